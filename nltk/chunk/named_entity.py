@@ -25,6 +25,8 @@ class NEChunkParserTagger(ClassifierBasedTagger):
     """
     The IOB tagger used by the chunk parser.
     """
+    _history_size = 2
+
     def __init__(self, train):
         ClassifierBasedTagger.__init__(
             self, train=train,
@@ -97,6 +97,7 @@ try:
     import numpy
     from nltk.classify.maxent import (MaxentClassifier, BinaryMaxentFeatureEncoding,
                                       ConditionalExponentialClassifier)
+    from nltk.classify.linear import LinearClassifier
     import svmlight
     from nltk.classify.svm import SvmClassifier
 except ImportError:
@@ -13,8 +13,14 @@ the basis of a tree structure, where branches correspond to conditions
 on feature values, and leaves correspond to label assignments.
 """
 
+import multiprocessing
 from collections import defaultdict
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nltk.probability import FreqDist, MLEProbDist, entropy
 
 from nltk.classify.api import ClassifierI
@@ -129,12 +135,22 @@ class DecisionTreeClassifier(ClassifierI):
     @staticmethod
     def train(labeled_featuresets, entropy_cutoff=0.05, depth_cutoff=100,
               support_cutoff=10, binary=False, feature_values=None,
-              verbose=False):
+              verbose=False, processes=1):
         """
         :param binary: If true, then treat all feature/value pairs a
         individual binary features, rather than using a single n-way
         branch for each feature.
+        :param processes: The number of worker processes used to
+        score candidate features at large nodes.  If ``None``, then
+        one process per CPU is used.  Candidate scoring requires
+        numpy; without it, this parameter is ignored.
         """
+        if numpy is not None:
+            trainer = _DecisionTreeTrainer(labeled_featuresets, binary,
+                                           feature_values, processes)
+            return trainer.train(entropy_cutoff, depth_cutoff,
+                                 support_cutoff, verbose)
+
         # Collect a list of all feature names.
         feature_names = set()
         for featureset, label in labeled_featuresets:
@@ -269,6 +285,309 @@ class DecisionTreeClassifier(ClassifierI):
                    (len(labeled_featuresets), descr, best_error))
         return best_stump
         
+##//////////////////////////////////////////////////////
+##  Training Engine
+##//////////////////////////////////////////////////////
+
+# Nodes with fewer tokens than this are always scored in the main
+# process; the cost of shipping their indices to the workers would
+# outweigh the work saved.
+_MIN_PARALLEL_TOKS = 1000
+
+class _DecisionTreeTrainer(object):
+    """
+    A helper class used by L{DecisionTreeClassifier.train} to build a
+    decision tree without re-classifying the training corpus for
+    every candidate stump.  Each token's (feature, value) pairs are
+    encoded once as integer ids; each node is then represented by the
+    list of indices of the tokens that reach it, and the errors of
+    every candidate stump at that node are computed together from a
+    single table of (feature value, label) counts.
+
+    The stumps that are chosen, the order in which candidates are
+    considered, and the tie-breaking between them are the same as
+    for L{DecisionTreeClassifier.best_stump} and
+    L{DecisionTreeClassifier.best_binary_stump}; except that binary
+    stumps which would send every token down the same branch are
+    never chosen, since they can not improve on a leaf.
+    """
+    def __init__(self, labeled_featuresets, binary, feature_values,
+                 processes):
+        self._toks = list(labeled_featuresets)
+        self._binary = binary
+
+        # Collect a list of the values each feature can take.
+        if feature_values is None and binary:
+            feature_values = defaultdict(set)
+            for featureset, label in self._toks:
+                for fname, fval in featureset.items():
+                    feature_values[fname].add(fval)
+        self._feature_values = feature_values
+
+        # Assign ids to labels, feature names, and (name, value) pairs.
+        # Missing features and features whose value is None are both
+        # looked up as None, so neither gets a (name, value) id.
+        label_ids = {}
+        fname_ids = {}
+        self._fv_ids = {}
+        self._fnames = []
+        fv_fname = []
+        labels = []
+        ex_ptr = [0]
+        ex_fv = []
+        for featureset, label in self._toks:
+            labels.append(label_ids.setdefault(label, len(label_ids)))
+            for fname, fval in featureset.items():
+                if fval is None: continue
+                fv = self._fv_ids.get((fname, fval))
+                if fv is None:
+                    fid = fname_ids.get(fname)
+                    if fid is None:
+                        fid = fname_ids[fname] = len(self._fnames)
+                        self._fnames.append(fname)
+                    fv = self._fv_ids[fname, fval] = len(fv_fname)
+                    fv_fname.append(fid)
+                ex_fv.append(fv)
+            ex_ptr.append(len(ex_fv))
+        self._labels = sorted(label_ids, key=label_ids.get)
+        self._y = numpy.array(labels, dtype=int)
+        self._fv_fname = numpy.array(fv_fname, dtype=int)
+
+        # Split the encoded tokens into one table per worker, each
+        # covering a disjoint set of feature names.
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        ex_ptr = numpy.array(ex_ptr, dtype=int)
+        ex_fv = numpy.array(ex_fv, dtype=int)
+        if processes == 1:
+            self._tables = [(ex_ptr, ex_fv)]
+        else:
+            entry_tok = numpy.repeat(numpy.arange(len(self._toks)),
+                                     numpy.diff(ex_ptr))
+            entry_part = self._fv_fname[ex_fv] % processes
+            self._tables = []
+            for part in range(processes):
+                mask = (entry_part == part)
+                counts = numpy.bincount(entry_tok[mask],
+                                        minlength=len(self._toks))
+                part_ptr = numpy.concatenate([[0], numpy.cumsum(counts)])
+                self._tables.append((part_ptr, ex_fv[mask]))
+        self._pool = None
+
+    def train(self, entropy_cutoff, depth_cutoff, support_cutoff, verbose):
+        if len(self._tables) > 1:
+            self._pool = multiprocessing.Pool(
+                len(self._tables), _init_decision_tree_worker,
+                (self._tables, self._fv_fname, self._y,
+                 len(self._labels), self._binary))
+        try:
+            return self._train(range(len(self._toks)), entropy_cutoff,
+                               depth_cutoff, support_cutoff, verbose)
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+    def _train(self, indices, entropy_cutoff, depth_cutoff, support_cutoff,
+               verbose):
+        tree = self._best_stump(indices, verbose)
+        self._refine(tree, indices, entropy_cutoff, depth_cutoff-1,
+                     support_cutoff, verbose)
+        return tree
+
+    def _refine(self, tree, indices, entropy_cutoff, depth_cutoff,
+                support_cutoff, verbose):
+        if len(indices) <= support_cutoff: return
+        if tree._fname is None: return
+        if depth_cutoff <= 0: return
+
+        # Partition the tokens by their value for the tree's feature.
+        partition = defaultdict(list)
+        for i in indices:
+            partition[self._toks[i][0].get(tree._fname)].append(i)
+
+        for fval in tree._decisions:
+            fval_indices = partition.get(fval, [])
+            if self._entropy(fval_indices) > entropy_cutoff:
+                tree._decisions[fval] = self._train(
+                    fval_indices, entropy_cutoff, depth_cutoff,
+                    support_cutoff, verbose)
+        if tree._default is not None:
+            default_indices = [i for i in indices
+                               if self._toks[i][0].get(tree._fname) not in
+                               tree._decisions]
+            if self._entropy(default_indices) > entropy_cutoff:
+                tree._default = self._train(
+                    default_indices, entropy_cutoff, depth_cutoff,
+                    support_cutoff, verbose)
+
+    def _entropy(self, indices):
+        label_freqs = FreqDist([self._toks[i][1] for i in indices])
+        return entropy(MLEProbDist(label_freqs))
+
+    def _best_stump(self, indices, verbose):
+        toks = [self._toks[i] for i in indices]
+        feature_names = set()
+        for featureset, label in toks:
+            for fname in featureset:
+                feature_names.add(fname)
+
+        # Find the candidate with the fewest errors.  Error counts are
+        # compared directly, which is equivalent to comparing error
+        # rates, since every candidate is scored on the same tokens.
+        label_counts = numpy.bincount(self._y[indices],
+                                      minlength=len(self._labels))
+        best_errors = len(indices) - label_counts.max()
+        best = None
+        if not self._binary:
+            errors = self._node_errors(indices)
+            for fname in feature_names:
+                stump_errors = errors.get(fname, best_errors)
+                if stump_errors < best_errors:
+                    best_errors = stump_errors
+                    best = fname
+        else:
+            fv_errors, none_errors = self._node_errors(indices)
+            for fname in feature_names:
+                for fval in self._feature_values[fname]:
+                    if fval is None:
+                        stump_errors = none_errors.get(fname)
+                    else:
+                        stump_errors = fv_errors.get(
+                            self._fv_ids.get((fname, fval)))
+                    if (stump_errors is not None and
+                        stump_errors < best_errors):
+                        best_errors = stump_errors
+                        best = (fname, fval)
+
+        # Build the chosen stump.
+        if best is None:
+            stump = DecisionTreeClassifier.leaf(toks)
+        elif not self._binary:
+            stump = DecisionTreeClassifier.stump(best, toks)
+        else:
+            stump = DecisionTreeClassifier.binary_stump(best[0], best[1],
+                                                        toks)
+        if verbose:
+            if not self._binary:
+                descr = stump._fname
+            elif stump._decisions:
+                descr = '%s=%s' % (stump._fname, stump._decisions.keys()[0])
+            else:
+                descr = '(default)'
+            print ('best stump for %6d toks uses %-20s err=%6.4f' %
+                   (len(indices), descr, float(best_errors)/len(indices)))
+        return stump
+
+    def _node_errors(self, indices):
+        """
+        Return the number of errors that each candidate stump makes
+        on the tokens with the given indices.  For n-way trees, this
+        is a dictionary mapping feature names to error counts.  For
+        binary trees, it is a tuple C{(fv_errors, none_errors)},
+        where C{fv_errors} maps (name, value) ids to the errors of
+        the stump testing for that value, and C{none_errors} maps
+        feature names to the errors of the stump testing for None.
+        Binary stumps that do not split the tokens are omitted.
+        """
+        indices = numpy.array(indices, dtype=int)
+        if self._pool is not None and len(indices) >= _MIN_PARALLEL_TOKS:
+            results = self._pool.map(
+                _decision_tree_worker,
+                [(part, indices) for part in range(len(self._tables))])
+        else:
+            results = [_node_errors(ex_ptr, ex_fv, self._fv_fname, self._y,
+                                    len(self._labels), indices, self._binary)
+                       for (ex_ptr, ex_fv) in self._tables]
+
+        fnames = self._fnames
+        if not self._binary:
+            errors = {}
+            for fids, fid_errors in results:
+                errors.update(zip([fnames[fid] for fid in fids],
+                                  fid_errors.tolist()))
+            return errors
+        else:
+            fv_errors = {}
+            none_errors = {}
+            for (fvs, fv_errs), (fids, fid_errs) in results:
+                fv_errors.update(zip(fvs.tolist(), fv_errs.tolist()))
+                none_errors.update(zip([fnames[fid] for fid in fids],
+                                       fid_errs.tolist()))
+            return fv_errors, none_errors
+
+def _node_errors(ex_ptr, ex_fv, fv_fname, y, num_labels, indices, binary):
+    """
+    Count the errors made by each candidate stump over the tokens
+    with the given indices, using the encoded (name, value) ids in
+    C{ex_fv[ex_ptr[i]:ex_ptr[i+1]]} for each token C{i}.  See
+    L{_DecisionTreeTrainer._node_errors} for the return value; here,
+    feature names are given as ids into C{fv_fname}'s range.
+    """
+    n = len(indices)
+    node_y = y[indices]
+    label_counts = numpy.bincount(node_y, minlength=num_labels)
+
+    # Gather the (name, value) ids of every token in the node, and
+    # count how often each one occurs with each label.
+    starts = ex_ptr[indices]
+    lengths = ex_ptr[indices+1] - starts
+    ends = numpy.cumsum(lengths)
+    entries = (numpy.arange(ends[-1] if n else 0) -
+               numpy.repeat(ends - lengths - starts, lengths))
+    keys = ex_fv[entries] * num_labels + numpy.repeat(node_y, lengths)
+    # (numpy.unique's return_counts needs numpy 1.9.)
+    keys, key_rows = numpy.unique(keys, return_inverse=True)
+    counts = numpy.bincount(key_rows)
+    key_fvs = keys // num_labels
+    is_new = numpy.ones(len(keys), dtype=bool)
+    is_new[1:] = key_fvs[1:] != key_fvs[:-1]
+    fvs = key_fvs[is_new]
+
+    # pos[r, l]: how often the r-th (name, value) pair has label l.
+    pos = numpy.zeros((len(fvs), num_labels), dtype=int)
+    pos[numpy.cumsum(is_new)-1, keys % num_labels] = counts
+    pos_n = pos.sum(1)
+
+    # present[r, l]: how often the r-th feature name has any value
+    # other than None with label l; the remaining tokens fall in the
+    # feature's None branch.
+    fids, fv_rows = numpy.unique(fv_fname[fvs], return_inverse=True)
+    present = numpy.zeros((len(fids), num_labels), dtype=int)
+    for l in range(num_labels):
+        present[:,l] = numpy.bincount(fv_rows, pos[:,l], len(fids))
+    missing = label_counts - present
+
+    if not binary:
+        correct = numpy.bincount(fv_rows, pos.max(1), len(fids))
+        correct = correct.astype(int) + missing.max(1)
+        return fids, n - correct
+    else:
+        fv_errors = ((pos_n - pos.max(1)) +
+                     (n - pos_n) - (label_counts - pos).max(1))
+        splits = pos_n < n
+        missing_n = n - present.sum(1)
+        none_errors = ((missing_n - missing.max(1)) +
+                       (n - missing_n) - present.max(1))
+        none_splits = missing_n > 0
+        return ((fvs[splits], fv_errors[splits]),
+                (fids[none_splits], none_errors[none_splits]))
+
+# Per-process state for the candidate-scoring workers.
+_worker_state = None
+
+def _init_decision_tree_worker(tables, fv_fname, y, num_labels, binary):
+    global _worker_state
+    _worker_state = (tables, fv_fname, y, num_labels, binary)
+
+def _decision_tree_worker(args):
+    part, indices = args
+    tables, fv_fname, y, num_labels, binary = _worker_state
+    ex_ptr, ex_fv = tables[part]
+    return _node_errors(ex_ptr, ex_fv, fv_fname, y, num_labels, indices,
+                        binary)
+
+
 ##//////////////////////////////////////////////////////
 ##  Demo
 ##//////////////////////////////////////////////////////
@@ -0,0 +1,398 @@
+# Natural Language Toolkit: Linear Classifiers
+#
+# Copyright (C) 2001-2011 NLTK Project
+# URL: <http://www.nltk.org/>
+# For license information, see LICENSE.TXT
+
+"""
+Linear classifiers, trained in-process using numpy.  A linear
+classifier scores each label for a featureset by adding up the
+weights of the joint-features that the featureset has with that
+label, and chooses the label with the highest score.  Featuresets are
+converted to joint-feature vectors by a L{MaxentFeatureEncodingI
+<nltk.classify.maxent.MaxentFeatureEncodingI>}, so the same encodings
+are used as for L{MaxentClassifier
+<nltk.classify.maxent.MaxentClassifier>}.
+
+The weights are found by minimizing the training loss plus an L2
+penalty on the weights, using the limited-memory BFGS algorithm.
+Two loss functions are supported:
+
+  - C{'hinge'}: the squared hinge loss, which gives a linear support
+    vector machine (with one margin for each incorrect label).
+  - C{'log'}: the log loss, which gives a (regularized) logistic
+    regression model.  Only these classifiers can estimate
+    probabilities.
+
+Unlike the classifiers in L{svm <nltk.classify.svm>}, L{weka
+<nltk.classify.weka>} and L{megam <nltk.classify.megam>}, these
+classifiers need no external programs or temporary files.  A trained
+classifier can be saved as a compressed numpy archive, using
+L{LinearClassifier.save()}, and loaded with L{LinearClassifier.load()}.
+The archive holds only arrays of numbers and strings, so loading it
+never unpickles any data.
+"""
+
+import numpy
+
+from nltk.probability import DictionaryProbDist
+
+from nltk.classify.api import ClassifierI
+from nltk.classify.util import split_labels, minimize_lbfgs
+from nltk.classify.maxent import BinaryMaxentFeatureEncoding, GISEncoding
+
+class LinearClassifier(ClassifierI):
+    """
+    A classifier that chooses the label whose joint-features have the
+    highest total weight.  See the module documentation for details.
+    """
+    LOSSES = ('hinge', 'log')
+    """A list of the loss functions that C{LinearClassifier}s can be
+       trained with."""
+
+    def __init__(self, encoding, weights, loss='hinge'):
+        """
+        :param encoding: An encoding that is used to convert the
+            featuresets that are given to the C{classify} method into
+            joint-feature vectors.
+        :type encoding: MaxentFeatureEncodingI
+        :param weights: The weight of each joint-feature.
+        :type weights: numpy.ndarray
+        :param loss: The loss function that the weights were trained
+            with.  Probabilities are only estimated for C{'log'}.
+        """
+        if loss not in self.LOSSES:
+            raise ValueError('Unknown loss function %r' % loss)
+        self._encoding = encoding
+        self._weights = numpy.asarray(weights, 'd')
+        self._loss = loss
+        assert encoding.length() == len(self._weights)
+
+    def labels(self):
+        return list(self._encoding.labels())
+
+    def weights(self):
+        """
+        :return: The weight of each joint-feature.
+        :rtype: numpy.ndarray
+        """
+        return self._weights
+
+    def loss(self):
+        """
+        :return: The loss function that the weights were trained with.
+        """
+        return self._loss
+
+    def batch_classify(self, featuresets):
+        labels = self.labels()
+        return [labels[i] for i in self.batch_scores(featuresets).argmax(1)]
+
+    def batch_prob_classify(self, featuresets):
+        if self._loss != 'log':
+            raise ValueError('Probabilities require loss="log", not '
+                             'loss=%r' % self._loss)
+        labels = self.labels()
+        # Scores are base-e logs of unnormalized probabilities.
+        scores = self.batch_scores(featuresets) * numpy.log2(numpy.e)
+        return [DictionaryProbDist(dict(zip(labels, row)), log=True,
+                                   normalize=True)
+                for row in scores.tolist()]
+
+    def batch_scores(self, featuresets):
+        """
+        :return: An array whose M{[i,j]}th element is the score of the
+            M{j}th label (in the order given by C{labels()}) for the
+            M{i}th featureset.
+        :rtype: numpy.ndarray
+        """
+        num_rows = len(featuresets)*len(self.labels())
+        (data, indices, indptr) = self._encoding.batch_encode(featuresets)
+        rows = numpy.repeat(numpy.arange(num_rows), numpy.diff(indptr))
+        scores = numpy.bincount(rows, data*self._weights[indices], num_rows)
+        return scores.reshape(len(featuresets), len(self.labels()))
+
+    def save(self, filename):
+        """
+        Save this classifier to the given file, as a compressed numpy
+        archive holding the weights, the loss function, and the
+        encoding's labels and joint-feature mapping.  Only
+        L{BinaryMaxentFeatureEncoding}s and L{GISEncoding}s can be
+        saved, and their labels, feature names and feature values must
+        be strings, numbers, booleans or C{None}.
+        """
+        outfile = open(filename, 'wb')
+        try:
+            numpy.savez_compressed(outfile, weights=self._weights,
+                                   loss=self._loss,
+                                   **_encoding_to_arrays(self._encoding))
+        finally:
+            outfile.close()
+
+    @staticmethod
+    def load(filename):
+        """
+        Load a classifier that was saved by L{save()}.
+        """
+        archive = numpy.load(filename, allow_pickle=False)
+        try:
+            return LinearClassifier(_encoding_from_arrays(archive),
+                                    archive['weights'],
+                                    str(archive['loss']))
+        finally:
+            archive.close()
+
+    def __repr__(self):
+        return ('<LinearClassifier: %d labels, %d features, %s loss>' %
+                (len(self.labels()), len(self._weights), self._loss))
+
+    @classmethod
+    def train(cls, train_toks, loss='hinge', C=1.0, encoding=None,
+              labels=None, trace=3, memory=10, **cutoffs):
+        """
+        Train a new C{LinearClassifier}, by minimizing
+        C{C*L(w) + |w|**2/2}, where C{L(w)} is the total loss of the
+        weights C{w} on C{train_toks}.
+
+        :param train_toks: Training data, represented as a list of
+            pairs, the first member of which is a featureset,
+            and the second of which is a classification label.
+        :param loss: The loss function: C{'hinge'} (a linear support
+            vector machine) or C{'log'} (logistic regression).
+        :param C: The weight of the training loss, relative to the
+            penalty on the weights.  Larger values fit the training
+            data more closely.
+        :param encoding: The encoding that is used to convert
+            featuresets into joint-feature vectors.  By default, a
+            L{BinaryMaxentFeatureEncoding} with always-on features is
+            built from C{train_toks}.
+        :param labels: The set of possible labels.  If none is given,
+            then the set of all labels attested in the training data
+            will be used instead.
+        :param trace: The level of diagnostic tracing output to
+            produce.  Higher values produce more verbose output.
+        :param memory: The number of previous updates that L-BFGS
+            uses to approximate the inverse Hessian.
+        :param cutoffs: Arguments specifying the conditions under
+            which training should be terminated.  Supported cutoffs
+            are:
+
+              - C{max_iter=v}: Terminate after C{v} iterations
+                (default 100).
+              - C{tolerance=v}: Terminate when an iteration improves
+                the objective by no more than C{v} times its value
+                (default 1e-7).
+              - C{count_cutoff=v}: Ignore input-features that occur
+                fewer than C{v} times when building the default
+                encoding.
+        """
+        if loss not in cls.LOSSES:
+            raise ValueError('Unknown loss function %r' % loss)
+        max_iter = cutoffs.get('max_iter', 100)
+        tolerance = cutoffs.get('tolerance', 1e-7)
+
+        # Construct an encoding from the training data.
+        if encoding is None:
+            encoding = BinaryMaxentFeatureEncoding.train(
+                train_toks, cutoffs.get('count_cutoff', 0), labels=labels,
+                alwayson_features=True)
+        elif labels is not None:
+            raise ValueError('Specify encoding or labels, not both')
+
+        # Encode the training data.
+        featuresets, gold_labels = split_labels(train_toks)
+        label_index = dict((label, i)
+                           for (i, label) in enumerate(encoding.labels()))
+        try:
+            gold = numpy.array([label_index[label] for label in gold_labels],
+                               int)
+        except KeyError, e:
+            raise ValueError('Unexpected label %s' % e)
+        num_toks = len(gold)
+        num_labels = len(label_index)
+        (data, indices, indptr) = encoding.batch_encode(featuresets)
+        rows = numpy.repeat(numpy.arange(num_toks*num_labels),
+                            numpy.diff(indptr))
+        gold_rows = (numpy.arange(num_toks), gold)
+
+        def objective(weights):
+            """
+            Return the value of the training objective for the given
+            weights, its gradient, and the training accuracy.
+            """
+            scores = numpy.bincount(rows, data*weights[indices],
+                                    num_toks*num_labels)
+            scores = scores.reshape(num_toks, num_labels)
+            if loss == 'log':
+                scores -= scores.max(1)[:,numpy.newaxis]
+                coef = numpy.exp(scores)
+                totals = coef.sum(1)
+                total_loss = (numpy.log(totals) - scores[gold_rows]).sum()
+                coef /= totals[:,numpy.newaxis]
+                coef[gold_rows] -= 1
+            else:
+                margins = 1 + scores - scores[gold_rows][:,numpy.newaxis]
+                margins[gold_rows] = 0
+                numpy.maximum(margins, 0, margins)
+                total_loss = numpy.dot(margins.ravel(), margins.ravel())
+                coef = 2*margins
+                coef[gold_rows] = -coef.sum(1)
+            value = C*total_loss + 0.5*numpy.dot(weights, weights)
+            gradient = C*numpy.bincount(indices, data*coef.ravel()[rows],
+                                        len(weights)) + weights
+            acc = numpy.mean(scores.argmax(1) == gold)
+            return value, gradient, acc
+
+        if trace > 0: print '  ==> Training (%d iterations)' % max_iter
+        if trace > 2:
+            print
+            print '      Iteration         Objective    Accuracy'
+            print '      ---------------------------------------'
+
+        # Train the classifier.
+        weights = numpy.zeros(encoding.length(), 'd')
+        try:
+            iternum = 0
+            for (new_weights, new_value, gradient, new_acc) in \
+                    minimize_lbfgs(objective, weights, memory):
+                iternum += 1
+                if iternum > 1:
+                    improvement = value - new_value
+                weights, value, acc = new_weights, new_value, new_acc
+
+                # Check the cutoffs.
+                if iternum > 1:
+                    if iternum >= max_iter:
+                        break
+                    if improvement <= tolerance * max(abs(value), 1.0):
+                        break
+
+                if trace > 2:
+                    print '     %9d    %14.5f    %9.3f' % (iternum, value, acc)
+
+        except KeyboardInterrupt:
+            print '      Training stopped: keyboard interrupt'
+
+        if trace > 2:
+            print '         Final    %14.5f    %9.3f' % (value, acc)
+
+        return cls(encoding, weights, loss)
+
+##//////////////////////////////////////////////////////
+##  Saving Encodings
+##//////////////////////////////////////////////////////
+
+_ENCODING_CLASSES = {'binary': BinaryMaxentFeatureEncoding,
+                     'gis': GISEncoding}
+"""The encoding classes that L{LinearClassifier.save()} supports,
+   keyed by the name that is stored in the archive."""
+
+_VALUE_DECODERS = {'n': lambda text: None,
+                   'b': lambda text: text == 'True',
+                   'i': int, 'f': float, 'u': unicode,
+                   's': lambda text: text.encode('latin-1')}
+"""Functions that convert the text of a saved value back into the
+   value, keyed by the value's kind."""
+
+def _values_to_arrays(values):
+    """
+    :return: A pair of arrays encoding C{values}: the kind of each
+        value (a key of L{_VALUE_DECODERS}), and its text.
+    """
+    kinds, texts = [], []
+    for value in values:
+        if value is None: kind, text = 'n', u''
+        elif isinstance(value, bool): kind, text = 'b', unicode(value)
+        elif isinstance(value, (int, long)): kind, text = 'i', unicode(value)
+        elif isinstance(value, float): kind, text = 'f', unicode(repr(value))
+        elif isinstance(value, unicode): kind, text = 'u', value
+        elif isinstance(value, str): kind, text = 's', value.decode('latin-1')
+        else:
+            raise ValueError('Cannot save %r: labels, feature names and '
+                             'feature values must be strings, numbers, '
+                             'booleans or None' % (value,))
+        kinds.append(kind)
+        texts.append(text)
+    return numpy.array(kinds, 'S1'), numpy.array(texts, unicode)
+
+def _values_from_arrays(kinds, texts):
+    """
+    :return: The list of values encoded by L{_values_to_arrays()}.
+    """
+    return [_VALUE_DECODERS[kind](text)
+            for (kind, text) in zip(kinds.tolist(), texts.tolist())]
+
+def _encoding_to_arrays(encoding):
+    """
+    :return: A dictionary of arrays that describe C{encoding}, keyed
+        by their names in the archive written by
+        L{LinearClassifier.save()}.
+    """
+    for (name, cls) in _ENCODING_CLASSES.items():
+        if type(encoding) is cls: break
+    else:
+        raise ValueError('Cannot save a %s' % type(encoding).__name__)
+    arrays = dict(encoding=name, alwayson=encoding._alwayson is not None)
+
+    # The mapping's ids are exactly 0...len(mapping)-1, so it is stored
+    # as three arrays, indexed by id.
+    joint_features = sorted(encoding._mapping,
+                            key=encoding._mapping.__getitem__)
+    for (i, key) in enumerate(['fname', 'fval', 'label']):
+        arrays[key+'_kinds'], arrays[key+'_texts'] = _values_to_arrays(
+            [joint_feature[i] for joint_feature in joint_features])
+    arrays['label_set_kinds'], arrays['label_set_texts'] = \
+        _values_to_arrays(encoding._labels)
+
+    # The ids of unseen-value features depend on set iteration order,
+    # so they are stored explicitly.
+    unseen = sorted((encoding._unseen or {}).items(), key=lambda item: item[1])
+    arrays['unseen'] = encoding._unseen is not None
+    arrays['unseen_kinds'], arrays['unseen_texts'] = _values_to_arrays(
+        [fname for (fname, fid) in unseen])
+    arrays['unseen_ids'] = numpy.array([fid for (fname, fid) in unseen], int)
+
+    if name == 'gis':
+        arrays['C_kinds'], arrays['C_texts'] = _values_to_arrays(
+            [encoding.C])
+    return arrays
+
+def _encoding_from_arrays(arrays):
+    """
+    :return: The encoding described by the arrays that
+        L{_encoding_to_arrays()} returned.
+    """
+    def values(key):
+        return _values_from_arrays(arrays[key+'_kinds'],
+                                   arrays[key+'_texts'])
+
+    name = str(arrays['encoding'])
+    if name not in _ENCODING_CLASSES:
+        raise ValueError('Unknown encoding %r' % name)
+    mapping = dict((joint_feature, fid) for (fid, joint_feature) in
+                   enumerate(zip(values('fname'), values('fval'),
+                                 values('label'))))
+    kwargs = dict(alwayson_features=bool(arrays['alwayson']))
+    if name == 'gis':
+        kwargs['C'] = values('C')[0]
+    encoding = _ENCODING_CLASSES[name](values('label_set'), mapping,
+                                       **kwargs)
+    if arrays['unseen']:
+        encoding._unseen = dict(zip(values('unseen'),
+                                    arrays['unseen_ids'].tolist()))
+        encoding._length += len(encoding._unseen)
+    return encoding
+
+##//////////////////////////////////////////////////////
+##  Demo
+##//////////////////////////////////////////////////////
+
+def demo():
+    from nltk.classify.util import names_demo
+    for loss in LinearClassifier.LOSSES:
+        classifier = names_demo(
+            lambda toks: LinearClassifier.train(toks, loss, trace=0))
+        print classifier
+
+if __name__ == '__main__':
+    demo()
@@ -58,6 +58,8 @@ import time
 import tempfile
 import os
 import gzip
+import math
+from itertools import repeat
 from collections import defaultdict
 
 from nltk.util import OrderedDict
@@ -65,6 +67,7 @@ from nltk.probability import DictionaryProbDist
 
 from nltk.classify.api import ClassifierI
 from nltk.classify.util import attested_labels, CutoffChecker, accuracy, log_likelihood
+from nltk.classify.util import FeaturesetCache, split_labels, minimize_lbfgs
 from nltk.classify.megam import call_megam, write_megam_file, parse_megam_weights
 from nltk.classify.tadm import call_tadm, write_tadm_file, parse_tadm_weights
 
@@ -133,9 +136,32 @@ class MaxentClassifier(ClassifierI):
         return self._weights
 
     def classify(self, featureset):
-        return self.prob_classify(featureset).max()
-        
+        return self.batch_classify([featureset])[0]
+
+    def batch_classify(self, featuresets):
+        if not self._logarithmic:
+            return [pdist.max()
+                    for pdist in self.batch_prob_classify(featuresets)]
+
+        # Pick the label with the highest total for each featureset;
+        # as with DictionaryProbDist.max(), ties go to the greatest
+        # label.  Rows whose highest total is not finite are left to
+        # DictionaryProbDist.
+        (labels, totals) = self._batch_totals(featuresets)
+        order = sorted(range(len(labels)), key=labels.__getitem__,
+                       reverse=True)
+        best = totals[:,order].argmax(axis=1)
+        result = [labels[order[i]] for i in best.tolist()]
+        for i in numpy.nonzero(~numpy.isfinite(totals.max(axis=1)))[0]:
+            prob_dict = dict(zip(labels, totals[i].tolist()))
+            result[i] = DictionaryProbDist(prob_dict, log=True,
+                                           normalize=True).max()
+        return result
+
     def prob_classify(self, featureset):
+        if self._logarithmic:
+            return self.batch_prob_classify([featureset])[0]
+
         prob_dict = {}
         for label in self._encoding.labels():
             feature_vector = self._encoding.encode(featureset, label)
@@ -155,6 +181,32 @@ class MaxentClassifier(ClassifierI):
         # Normalize the dictionary to give a probability distribution
         return DictionaryProbDist(prob_dict, log=self._logarithmic,
                                   normalize=True)
+
+    def batch_prob_classify(self, featuresets):
+        if not self._logarithmic:
+            return [self.prob_classify(featureset)
+                    for featureset in featuresets]
+
+        # Normalize each row to give a probability distribution
+        (labels, totals) = self._batch_totals(featuresets)
+        return [DictionaryProbDist(dict(zip(labels, row)), log=True,
+                                   normalize=True)
+                for row in totals.tolist()]
+
+    def _batch_totals(self, featuresets):
+        """
+        Return a tuple C{(labels, totals)}, where C{totals} is an
+        array whose M{[i,j]} entry is the dot product of the weight
+        vector with the encoding of the M{i}th featureset and the
+        M{j}th label in the list C{labels}.
+        """
+        labels = list(self._encoding.labels())
+        (data, indices, indptr) = self._encoding.batch_encode(featuresets)
+        weights = numpy.asarray(self._weights, 'd')
+        num_rows = len(featuresets)*len(labels)
+        rows = numpy.repeat(numpy.arange(num_rows), numpy.diff(indptr))
+        totals = numpy.bincount(rows, data*weights[indices], num_rows)
+        return labels, totals.reshape(len(featuresets), len(labels))
         
     def explain(self, featureset, columns=4):
         """
@@ -212,12 +264,13 @@ class MaxentClassifier(ClassifierI):
 
     #: A list of the algorithm names that are accepted for the
     #: L{train()} method's C{algorithm} parameter.
-    ALGORITHMS = ['GIS', 'IIS', 'CG', 'BFGS', 'Powell', 'LBFGSB',
+    ALGORITHMS = ['GIS', 'IIS', 'LBFGS', 'CG', 'BFGS', 'Powell', 'LBFGSB',
                   'Nelder-Mead', 'MEGAM', 'TADM']
 
     @classmethod
     def train(cls, train_toks, algorithm=None, trace=3, encoding=None, 
-              labels=None, sparse=True, gaussian_prior_sigma=0, **cutoffs):
+              labels=None, sparse=True, gaussian_prior_sigma=0,
+              processes=1, **cutoffs):
         """
         Train a new maxent classifier based on the given corpus of
         training samples.  This classifier will have its weights
@@ -240,6 +293,10 @@ class MaxentClassifier(ClassifierI):
               - Iterative Scaling Methods
                 - C{'GIS'}: Generalized Iterative Scaling
                 - C{'IIS'}: Improved Iterative Scaling
+
+              - Optimization Methods (built in)
+                - C{'LBFGS'}: A limited-memory variant of the BFGS
+                  algorithm, implemented with numpy.
                 
               - Optimization Methods (require C{scipy})
                 - C{'CG'}: Conjugate gradient
@@ -277,9 +334,16 @@ class MaxentClassifier(ClassifierI):
             algorithms, its value is ignored.
         
         :param gaussian_prior_sigma: The sigma value for a gaussian
-            prior on model weights.  Currently, this is supported by
-            the scipy (optimization method) algorithms and C{megam}.
-            For other algorithms, its value is ignored.
+            prior on model weights (i.e., L2 regularization).
+            Currently, this is supported by the C{LBFGS} and scipy
+            (optimization method) algorithms and C{megam}.  For other
+            algorithms, its value is ignored.
+
+        :param processes: The number of worker processes that are used
+            to compute the gradient, each for a part of the training
+            data.  If None, one worker per CPU is used.  Currently,
+            this is only supported by the C{LBFGS} algorithm.  For
+            other algorithms, its value is ignored.
             
         :param cutoffs: Arguments specifying various conditions under
             which the training should be halted.  (Some of the cutoff
@@ -295,7 +359,10 @@ class MaxentClassifier(ClassifierI):
                 exact meaning of this tolerance depends on the scipy
                 algorithm used.  See C{scipy} documentation for more
                 info.  Default values: 1e-3 for CG, 1e-5 for LBFGSB,
-                and 1e-4 for other algorithms.  I{(C{scipy} only)}
+                and 1e-4 for other algorithms.  For C{LBFGS}, training
+                stops when an iteration reduces the objective by less
+                than a fraction C{v} of its value (default 1e-7).
+                I{(C{scipy} and C{LBFGS} only)}
         """
         if algorithm is None:
             try:
@@ -315,6 +382,10 @@ class MaxentClassifier(ClassifierI):
         elif algorithm == 'gis':
             return train_maxent_classifier_with_gis(
                 train_toks, trace, encoding, labels, **cutoffs)
+        elif algorithm == 'lbfgs':
+            return train_maxent_classifier_with_lbfgs(
+                train_toks, trace, encoding, labels,
+                gaussian_prior_sigma, processes, **cutoffs)
         elif algorithm in cls._SCIPY_ALGS:
             return train_maxent_classifier_with_scipy(
                 train_toks, trace, encoding, labels, 
@@ -380,6 +451,39 @@ class MaxentFeatureEncodingI(object):
         """
         raise AssertionError('Not implemented')
 
+    def batch_encode(self, featuresets):
+        """
+        Return the joint-feature vectors for every pair of a
+        featureset in C{featuresets} and a label in C{labels()}, as a
+        sparse matrix in compressed sparse row (CSR) format.  The
+        matrix has one row for each pair, with the row for the M{i}th
+        featureset and the M{j}th label at index
+        C{i*len(labels())+j}; and one column for each joint-feature.
+        The entries of each row are in the order given by
+        C{encode()}.
+
+        The matrix is returned as a tuple C{(data, indices, indptr)}
+        of numpy arrays, as used by C{scipy.sparse.csr_matrix}: the
+        entries of row M{r} have the values
+        C{data[indptr[r]:indptr[r+1]]} and the joint-feature indices
+        C{indices[indptr[r]:indptr[r+1]]}.
+
+        :type featuresets: list of dict
+        :rtype: tuple of C{numpy.ndarray}
+        """
+        labels = list(self.labels())
+        data = []
+        indices = []
+        indptr = [0]
+        for featureset in featuresets:
+            for label in labels:
+                for (f_id, f_val) in self.encode(featureset, label):
+                    indices.append(f_id)
+                    data.append(f_val)
+                indptr.append(len(indices))
+        return (numpy.array(data, 'd'), numpy.array(indices, int),
+                numpy.array(indptr, int))
+
     def length(self):
         """
         :return: The size of the fixed-length joint-feature vectors
@@ -577,6 +681,123 @@ class BinaryMaxentFeatureEncoding(MaxentFeatureEncodingI):
             
         return encoding
 
+    def batch_encode(self, featuresets):
+        # Inherit docs.
+        feature_rows, unseen_rows, alwayson_row, row_ptr, row_labels, \
+                      row_fids = self._fid_table()
+        num_labels = len(self._labels)
+
+        # Find the table row for each input-feature, followed by the
+        # always-on features.  Input-features with no joint-features
+        # use the last row, which is empty.
+        empty_row = len(row_ptr)-2
+        get_row = feature_rows.get
+        if isinstance(featuresets, FeaturesetCache):
+            # Cached featuresets are already encoded as input-feature
+            # ids, so we only need to find the row of each id.
+            vocabulary, fs_indptr, ids = featuresets.encoded()
+            vocabulary_rows = numpy.array(
+                [get_row(feature, unseen_rows.get(feature[0], empty_row))
+                 for feature in vocabulary], int)
+            table_rows = vocabulary_rows[ids[fs_indptr[0]:fs_indptr[-1]]]
+            num_features = numpy.diff(fs_indptr)
+        else:
+            table_rows = []
+            num_features = []
+            for featureset in featuresets:
+                if unseen_rows:
+                    rows = [get_row(feature,
+                                    unseen_rows.get(feature[0], empty_row))
+                            for feature in featureset.iteritems()]
+                else:
+                    rows = map(get_row, featureset.iteritems(),
+                               repeat(empty_row, len(featureset)))
+                table_rows.extend(rows)
+                num_features.append(len(rows))
+            table_rows = numpy.array(table_rows, int)
+        featureset_ids = numpy.repeat(numpy.arange(len(featuresets)),
+                                      num_features)
+        if alwayson_row is not None:
+            table_rows = numpy.concatenate(
+                [table_rows, numpy.repeat(alwayson_row, len(featuresets))])
+            featureset_ids = numpy.concatenate(
+                [featureset_ids, numpy.arange(len(featuresets))])
+
+        # Look up the joint-features in each table row, and sort them
+        # into rows, keeping the order of each row's joint-features.
+        starts = row_ptr[table_rows]
+        lengths = row_ptr[table_rows+1] - starts
+        ends = numpy.cumsum(lengths)
+        entries = (numpy.arange(ends[-1] if len(ends) else 0) -
+                   numpy.repeat(ends-lengths-starts, lengths))
+        rows = (numpy.repeat(featureset_ids, lengths)*num_labels +
+                row_labels[entries])
+        order = numpy.argsort(rows, kind='mergesort')
+        indices = row_fids[entries][order]
+        row_lengths = numpy.bincount(rows, None,
+                                     len(featuresets)*num_labels)
+        indptr = numpy.concatenate([[0], numpy.cumsum(row_lengths)])
+        return (numpy.ones(len(indices), 'd'), indices, indptr)
+
+    def _fid_table(self):
+        """
+        Return a tuple C{(feature_rows, unseen_rows, alwayson_row,
+        row_ptr, row_labels, row_fids)} that is used by
+        L{batch_encode()} to find the joint-features of an
+        input-feature.  The joint-features are stored in a table whose
+        rows list a label index and a joint-feature index for each of
+        the labels that has one: row M{r} has the label indices
+        C{row_labels[row_ptr[r]:row_ptr[r+1]]} and the joint-feature
+        indices C{row_fids[row_ptr[r]:row_ptr[r+1]]}.  C{feature_rows}
+        maps each C{(fname, fval)} pair to its row; C{unseen_rows}
+        maps each feature name with an unseen-value feature to its
+        row; C{alwayson_row} is the row for the always-on features, or
+        C{None}; and the last row is empty.
+        """
+        try:
+            return self._fid_table_cache
+        except AttributeError:
+            label_index = dict((label, i)
+                               for (i, label) in enumerate(self._labels))
+            feature_rows = {}
+            table = []
+            for ((fname, fval, label), fid) in self._mapping.items():
+                if label not in label_index: continue
+                row = feature_rows.get((fname, fval))
+                if row is None:
+                    row = feature_rows[fname, fval] = len(table)
+                    table.append([])
+                table[row].append((label_index[label], fid))
+
+            unseen_rows = {}
+            for (fname, fid) in (self._unseen or {}).items():
+                unseen_rows[fname] = len(table)
+                table.append([(i, fid) for i in range(len(self._labels))])
+
+            alwayson_row = None
+            if self._alwayson:
+                alwayson_row = len(table)
+                table.append([(i, self._alwayson[label])
+                              for (i, label) in enumerate(self._labels)
+                              if label in self._alwayson])
+
+            table.append([])
+
+            entries = [entry for row in table for entry in row]
+            row_ptr = numpy.cumsum([0]+[len(row) for row in table])
+            row_labels = numpy.array([i for (i, fid) in entries], int)
+            row_fids = numpy.array([fid for (i, fid) in entries], int)
+            self._fid_table_cache = (feature_rows, unseen_rows,
+                                     alwayson_row, row_ptr, row_labels,
+                                     row_fids)
+            return self._fid_table_cache
+
+    def __getstate__(self):
+        # Don't save the joint-feature table.
+        state = self.__dict__.copy()
+        state.pop('_fid_table_cache', None)
+        return state
+
     def describe(self, f_id):
         # Inherit docs.
         if not isinstance(f_id, (int, long)):
@@ -707,6 +928,23 @@ class GISEncoding(BinaryMaxentFeatureEncoding):
         # Return the result
         return encoding
 
+    def batch_encode(self, featuresets):
+        # Get the basic encoding.
+        (data, indices, indptr) = BinaryMaxentFeatureEncoding.batch_encode(
+            self, featuresets)
+        base_length = BinaryMaxentFeatureEncoding.length(self)
+
+        # Add a correction feature to the end of each row.
+        num_rows = len(indptr)-1
+        rows = numpy.repeat(numpy.arange(num_rows), numpy.diff(indptr))
+        totals = numpy.bincount(rows, data, num_rows)
+        if (totals >= self._C).any():
+            raise ValueError('Correction feature is not high enough!')
+        data = numpy.insert(data, indptr[1:], self._C-totals)
+        indices = numpy.insert(indices, indptr[1:], base_length)
+        indptr = indptr + numpy.arange(len(indptr))
+        return (data, indices, indptr)
+
     def length(self):
         return BinaryMaxentFeatureEncoding.length(self) + 1
 
@@ -740,6 +978,9 @@ class TadmEventMaxentFeatureEncoding(BinaryMaxentFeatureEncoding):
                              self._label_mapping[value]))
         return encoding
 
+    def batch_encode(self, featuresets):
+        return MaxentFeatureEncodingI.batch_encode(self, featuresets)
+
     def labels(self):
         return self._labels
 
@@ -1026,8 +1267,10 @@ def train_maxent_classifier_with_gis(train_toks, trace=3, encoding=None,
     # faster learning.
     Cinv = 1.0/encoding.C
     
-    # Count how many times each feature occurs in the training data.
-    empirical_fcount = calculate_empirical_fcount(train_toks, encoding)
+    # Encode the training data once, and count how many times each
+    # feature occurs in it.
+    encoded_toks = _EncodedToks(train_toks, encoding)
+    empirical_fcount = encoded_toks.empirical_fcount
 
     # Check for any features that are not attested in train_toks.
     unattested = set(numpy.nonzero(empirical_fcount==0)[0])
@@ -1064,8 +1307,8 @@ def train_maxent_classifier_with_gis(train_toks, trace=3, encoding=None,
             
             # Use the model to estimate the number of times each
             # feature should occur in the training data.
-            estimated_fcount = calculate_estimated_fcount(
-                classifier, train_toks, encoding)
+            estimated_fcount = encoded_toks.estimated_fcount(
+                classifier.weights())
     
             # Take the log of estimated fcount (avoid taking log(0).)
             for fid in unattested: estimated_fcount[fid] += 1
@@ -1138,16 +1381,19 @@ def train_maxent_classifier_with_iis(train_toks, trace=3, encoding=None,
     if encoding is None:
         encoding = BinaryMaxentFeatureEncoding.train(train_toks, labels=labels)
     
-    # Count how many times each feature occurs in the training data.
-    empirical_ffreq = (calculate_empirical_fcount(train_toks, encoding) /
-                       len(train_toks))
+    # Encode the training data once, and count how many times each
+    # feature occurs in it.
+    encoded_toks = _EncodedToks(train_toks, encoding)
+    empirical_ffreq = encoded_toks.empirical_fcount / len(train_toks)
 
     # Find the nf map, and related variables nfarray and nfident.
     # nf is the sum of the features for a given labeled text.
     # nfmap compresses this sparse set of values to a dense list.
     # nfarray performs the reverse operation.  nfident is 
     # nfarray multiplied by an identity matrix.
-    nfmap = calculate_nfmap(train_toks, encoding)
+    nfs = numpy.bincount(encoded_toks.rows, encoded_toks.data,
+                         encoded_toks.num_toks*encoded_toks.num_labels)
+    nfmap = dict((nf, i) for (i, nf) in enumerate(set(nfs.tolist())))
     nfarray = numpy.array(sorted(nfmap, key=nfmap.__getitem__), 'd')
     nftranspose = numpy.reshape(nfarray, (len(nfarray), 1))
 
@@ -1183,7 +1429,7 @@ def train_maxent_classifier_with_iis(train_toks, trace=3, encoding=None,
             # Calculate the deltas for this iteration, using Newton's method.
             deltas = calculate_deltas(
                 train_toks, classifier, unattested, empirical_ffreq, 
-                nfmap, nfarray, nftranspose, encoding)
+                nfmap, nfarray, nftranspose, encoding, encoded_toks)
     
             # Use the deltas to update our weights.
             weights = classifier.weights()
@@ -1237,7 +1483,8 @@ def calculate_nfmap(train_toks, encoding):
     return dict([(nf, i) for (i, nf) in enumerate(nfset)])
 
 def calculate_deltas(train_toks, classifier, unattested, ffreq_empirical,
-                     nfmap, nfarray, nftranspose, encoding):
+                     nfmap, nfarray, nftranspose, encoding,
+                     encoded_toks=None):
     """
     Calculate the update values for the classifier weights for
     this iteration of IIS.  These update weights are the value of
@@ -1300,6 +1547,9 @@ def calculate_deltas(train_toks, classifier, unattested, ffreq_empirical,
     :type nfarray: C{array} of float
     :param nftranspose: C{array} of float
     :type nftranspose: The transpose of C{nfarray}
+    :param encoded_toks: C{train_toks}, already encoded with
+        C{encoding}.  If given, the C{A} matrix is computed from it
+        instead of encoding every (token, label) pair again.
     """
     # These parameters control when we decide that we've
     # converged.  It probably should be possible to set these
@@ -1312,19 +1562,30 @@ def calculate_deltas(train_toks, classifier, unattested, ffreq_empirical,
     # Precompute the A matrix:
     # A[nf][id] = sum ( p(fs) * p(label|fs) * f(fs,label) )
     # over all label,fs s.t. num_features[label,fs]=nf
-    A = numpy.zeros((len(nfmap), encoding.length()), 'd')
-
-    for tok, label in train_toks:
-        dist = classifier.prob_classify(tok)
-
-        for label in encoding.labels():
-            # Generate the feature vector
-            feature_vector = encoding.encode(tok,label)
-            # Find the number of active features
-            nf = sum([val for (id, val) in feature_vector])
-            # Update the A matrix
-            for (id, val) in feature_vector:
-                A[nfmap[nf], id] += dist.prob(label) * val
+    if encoded_toks is not None:
+        e = encoded_toks
+        num_rows = e.num_toks*e.num_labels
+        nfs = numpy.bincount(e.rows, e.data, num_rows)
+        row_nfs = numpy.array([nfmap[nf] for nf in nfs.tolist()], int)
+        row_probs = e.label_probs(classifier.weights())
+        A = numpy.bincount(row_nfs[e.rows]*e.num_features + e.indices,
+                           e.data*row_probs[e.rows],
+                           len(nfmap)*e.num_features)
+        A = A.reshape(len(nfmap), e.num_features)
+    else:
+        A = numpy.zeros((len(nfmap), encoding.length()), 'd')
+
+        for tok, label in train_toks:
+            dist = classifier.prob_classify(tok)
+
+            for label in encoding.labels():
+                # Generate the feature vector
+                feature_vector = encoding.encode(tok,label)
+                # Find the number of active features
+                nf = sum([val for (id, val) in feature_vector])
+                # Update the A matrix
+                for (id, val) in feature_vector:
+                    A[nfmap[nf], id] += dist.prob(label) * val
     A /= len(train_toks)
     
     # Iteratively solve for delta.  Use the following variables:
@@ -1356,6 +1617,234 @@ def calculate_deltas(train_toks, classifier, unattested, ffreq_empirical,
 
     return deltas
 
+######################################################################
+#{ Classifier Trainer: L-BFGS
+######################################################################
+
+def train_maxent_classifier_with_lbfgs(train_toks, trace=3, encoding=None,
+                                       labels=None, gaussian_prior_sigma=0,
+                                       processes=1, memory=10, **cutoffs):
+    """
+    Train a new C{ConditionalExponentialClassifier}, using the given
+    training samples, by minimizing the negative log likelihood of
+    C{train_toks} with the limited-memory BFGS algorithm.  If
+    C{gaussian_prior_sigma} is given, then the objective includes a
+    gaussian prior on the weights (L2 regularization).  This
+    C{ConditionalExponentialClassifier} will encode the model that
+    maximizes entropy from all the models that are empirically
+    consistent with C{train_toks}.
+
+    The training samples are encoded once, as sparse matrices (see
+    L{MaxentFeatureEncodingI.batch_encode()}).  If C{processes} is
+    greater than one, then the samples are divided among that many
+    worker processes, and each iteration's gradient is computed by
+    summing the gradients of the parts.
+
+    :param memory: The number of previous updates that are used to
+        approximate the inverse Hessian.
+    :see: L{train_maxent_classifier()} for parameter descriptions.
+    """
+    cutoffs.setdefault('max_iter', 100)
+    tolerance = cutoffs.get('tolerance', 1e-7)
+
+    # Construct an encoding from the training data.
+    if encoding is None:
+        count_cutoff = cutoffs.get('count_cutoff', 0)
+        encoding = BinaryMaxentFeatureEncoding.train(train_toks, count_cutoff,
+                                                     labels=labels,
+                                                     alwayson_features=True)
+    elif labels is not None:
+        raise ValueError('Specify encoding or labels, not both')
+
+    # Encode the training data, in one part for each worker process.
+    if processes != 1:
+        import multiprocessing
+        processes = processes or multiprocessing.cpu_count()
+    num_toks = len(train_toks)
+    size = max(1, -(-num_toks // processes))
+    parts = [_EncodedToks(train_toks[i:i+size], encoding)
+             for i in range(0, num_toks, size)]
+    for part in parts:
+        if part.unknown_labels:
+            raise ValueError('Unexpected label %r' % part.unknown_labels[0])
+    empirical_fcount = sum(part.empirical_fcount for part in parts)
+    if processes == 1 or len(parts) < 2:
+        pool = None
+    else:
+        pool = multiprocessing.Pool(len(parts), _init_lbfgs_worker, (parts,))
+
+    if gaussian_prior_sigma:
+        inv_variance = 1.0 / gaussian_prior_sigma**2
+    else:
+        inv_variance = 0
+
+    def objective(weights):
+        """
+        Return the negative log likelihood of the training data (plus
+        the prior) for the given base-e weights, its gradient, and a
+        tuple containing the log likelihood and accuracy reported by
+        C{log_likelihood()} and C{accuracy()}.
+        """
+        if pool is None:
+            results = [part.objective(weights) for part in parts]
+        else:
+            results = pool.map(_lbfgs_worker,
+                               [(i, weights) for i in range(len(parts))])
+        nll = sum(result[0] for result in results)
+        gradient = sum(result[1] for result in results) - empirical_fcount
+        nll += 0.5 * inv_variance * numpy.dot(weights, weights)
+        gradient += inv_variance * weights
+        ll = math.log(sum(result[2] for result in results) / num_toks)
+        acc = float(sum(result[3] for result in results)) / num_toks
+        return nll, gradient, (ll, acc)
+
+    if trace > 0: print '  ==> Training (%d iterations)' % cutoffs['max_iter']
+    if trace > 2:
+        print
+        print '      Iteration    Log Likelihood    Accuracy'
+        print '      ---------------------------------------'
+
+    # Train the classifier.
+    weights = numpy.zeros(encoding.length(), 'd')
+    try:
+        iternum = 0
+        for (new_weights, new_nll, gradient, (new_ll, new_acc)) in \
+                minimize_lbfgs(objective, weights, memory):
+            iternum += 1
+            if iternum > 1:
+                improvement = nll - new_nll
+                lldelta = new_ll - ll
+            weights, nll, ll, acc = new_weights, new_nll, new_ll, new_acc
+
+            # Check the cutoffs.
+            if iternum > 1:
+                if iternum >= cutoffs['max_iter']:
+                    break
+                if improvement <= tolerance * max(abs(nll), 1.0):
+                    break
+                if 'min_ll' in cutoffs and ll >= -abs(cutoffs['min_ll']):
+                    break
+                if ('min_lldelta' in cutoffs and
+                    lldelta <= abs(cutoffs['min_lldelta'])):
+                    break
+
+            if trace > 2:
+                print '     %9d    %14.5f    %9.3f' % (iternum, ll, acc)
+
+    except KeyboardInterrupt:
+        print '      Training stopped: keyboard interrupt'
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if trace > 2:
+        print '         Final    %14.5f    %9.3f' % (ll, acc)
+
+    # Convert from base-e to base-2 weights, and build the classifier.
+    return MaxentClassifier(encoding, weights * numpy.log2(numpy.e))
+
+class _EncodedToks(object):
+    """
+    Training data for the GIS, IIS and L-BFGS trainers (or, for
+    L{train_maxent_classifier_with_lbfgs()}, a part of it), encoded
+    once as a sparse matrix with a row for each (token, label) pair.
+
+    Tokens whose correct label is not one of the encoding's labels
+    have no row for it; they add to C{empirical_fcount} whatever
+    C{encoding.encode()} returns for that label (no joint features,
+    but possibly a correction feature), and their correct label is
+    recorded as -1 in C{gold}.
+    """
+    def __init__(self, train_toks, encoding):
+        labels = list(encoding.labels())
+        labelnum = dict((label, i) for (i, label) in enumerate(labels))
+        featuresets, gold_labels = split_labels(train_toks)
+        (self.data, self.indices, indptr) = encoding.batch_encode(
+            featuresets)
+        self.num_toks = len(train_toks)
+        self.num_labels = len(labels)
+        self.num_features = encoding.length()
+        self.rows = numpy.repeat(numpy.arange(len(indptr)-1),
+                                 numpy.diff(indptr))
+        self.gold = numpy.array([labelnum.get(label, -1)
+                                 for label in gold_labels], int)
+        self.unknown_labels = [label for label in gold_labels
+                               if label not in labelnum]
+
+        # Count how many times each feature occurs in the training data.
+        known = numpy.nonzero(self.gold >= 0)[0]
+        is_gold = numpy.zeros(self.num_toks*self.num_labels, 'd')
+        is_gold[known*self.num_labels+self.gold[known]] = 1
+        self.empirical_fcount = numpy.bincount(
+            self.indices, self.data*is_gold[self.rows], self.num_features)
+        for i in numpy.nonzero(self.gold < 0)[0]:
+            for (fid, fval) in encoding.encode(featuresets[i],
+                                               gold_labels[i]):
+                self.empirical_fcount[fid] += fval
+
+    def objective(self, weights):
+        """
+        Return a tuple C{(nll, fcount, prob, correct)} for the given
+        base-e weights, where C{nll} is the negative log likelihood
+        of this part; C{fcount} is the number of times the model
+        expects each feature to occur in it; C{prob} is the total
+        probability of the correct labels; and C{correct} is the
+        number of tokens whose correct label is the most likely.
+        """
+        totals = self._totals(weights)
+        toks = numpy.arange(self.num_toks)
+        correct = (totals.argmax(axis=1) == self.gold).sum()
+
+        # Normalize each row to give a probability distribution.
+        totals -= totals.max(axis=1)[:,numpy.newaxis]
+        probs = numpy.exp(totals)
+        sums = probs.sum(axis=1)
+        probs /= sums[:,numpy.newaxis]
+        nll = (numpy.log(sums) - totals[toks, self.gold]).sum()
+        return (nll, self._fcount(probs.ravel()),
+                probs[toks, self.gold].sum(), correct)
+
+    def label_probs(self, weights):
+        """
+        Return the probability of each (token, label) pair's label,
+        given the token, under the base-2 weights used by
+        L{MaxentClassifier}, as an array with one entry per row.
+        """
+        totals = self._totals(weights)
+        totals -= totals.max(axis=1)[:,numpy.newaxis]
+        probs = 2 ** totals
+        probs /= probs.sum(axis=1)[:,numpy.newaxis]
+        return probs.ravel()
+
+    def estimated_fcount(self, weights):
+        """
+        Return the number of times the model with the given base-2
+        weights expects each feature to occur in this data.
+        """
+        return self._fcount(self.label_probs(weights))
+
+    def _totals(self, weights):
+        num_rows = self.num_toks*self.num_labels
+        totals = numpy.bincount(self.rows, self.data*weights[self.indices],
+                                num_rows)
+        return totals.reshape(self.num_toks, self.num_labels)
+
+    def _fcount(self, row_probs):
+        return numpy.bincount(self.indices, self.data*row_probs[self.rows],
+                              self.num_features)
+
+# The training data parts used by train_maxent_classifier_with_lbfgs()
+# in each worker process.
+_worker_parts = None
+
+def _init_lbfgs_worker(parts):
+    global _worker_parts
+    _worker_parts = parts
+
+def _lbfgs_worker(args):
+    (i, weights) = args
+    return _worker_parts[i].objective(weights)
+
 ######################################################################
 #{ Classifier Trainer: scipy algorithms (GC, LBFGSB, etc.)
 ######################################################################
@@ -34,9 +34,19 @@ sum to one::
 
 from collections import defaultdict
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nltk.probability import FreqDist, DictionaryProbDist, ELEProbDist, sum_logs
 
 from api import ClassifierI
+from util import FeaturesetCache
+
+# The feature value used to find P(fname=fval|label) for values of
+# fname that were never seen.
+_UNSEEN_VALUE = object()
 
 ##//////////////////////////////////////////////////////
 ##  Naive Bayes Classifier
@@ -61,6 +71,12 @@ class NaiveBayesClassifier(ClassifierI):
     The feature value 'None' is reserved for unseen feature values;
     you generally should not use 'None' as a feature value for one of
     your own features.
+
+    If numpy is available, the classifier is compiled the first time
+    it is used: each C{(fname, fval)} pair is given a feature id, and
+    the log probabilities are stored in an array with one row per
+    feature id and one column per label.  C{batch_prob_classify()}
+    then scores all of its featuresets with a single sparse product.
     """
     def __init__(self, label_probdist, feature_probdist):
         """
@@ -89,7 +105,14 @@ class NaiveBayesClassifier(ClassifierI):
     def classify(self, featureset):
         return self.prob_classify(featureset).max()
         
+    def batch_classify(self, featuresets):
+        return [pdist.max()
+                for pdist in self.batch_prob_classify(featuresets)]
+
     def prob_classify(self, featureset):
+        if numpy is not None:
+            return self.batch_prob_classify([featureset])[0]
+
         # Discard any feature names that we've never seen before.
         # Otherwise, we'll just assign a probability of 0 to
         # everything.
@@ -122,6 +145,117 @@ class NaiveBayesClassifier(ClassifierI):
                     
         return DictionaryProbDist(logprob, normalize=True, log=True)
 
+    def batch_prob_classify(self, featuresets):
+        if numpy is None:
+            return [self.prob_classify(featureset)
+                    for featureset in featuresets]
+
+        feature_ids, unseen_ids, logprobs = self._compiled()
+
+        # Build the featuresets' rows of a sparse (CSR) matrix over
+        # feature ids.  Every row starts with feature id 0, whose
+        # log probabilities are those of the labels themselves;
+        # feature names we've never seen before are discarded.
+        if isinstance(featuresets, FeaturesetCache):
+            indices, indptr = self._cached_rows(featuresets)
+        else:
+            indices = []
+            indptr = []
+            for featureset in featuresets:
+                indptr.append(len(indices))
+                indices.append(0)
+                for (fname, fval) in featureset.iteritems():
+                    fid = feature_ids.get((fname, fval))
+                    if fid is None:
+                        fid = unseen_ids.get(fname)
+                        if fid is None: continue
+                    indices.append(fid)
+        if not len(indptr):
+            return []
+
+        # Sum the selected rows of the log probability array for
+        # each featureset.
+        scores = numpy.add.reduceat(logprobs[indices], indptr, axis=0)
+
+        return [DictionaryProbDist(dict(zip(self._labels, row)),
+                                   normalize=True, log=True)
+                for row in scores.tolist()]
+
+    def _cached_rows(self, featuresets):
+        """
+        Return the C{(indices, indptr)} arrays that
+        L{batch_prob_classify()} uses for a L{FeaturesetCache},
+        computed from the cache's input-feature ids.
+        """
+        feature_ids, unseen_ids, logprobs = self._compiled()
+        vocabulary, fs_indptr, ids = featuresets.encoded()
+        vocabulary_fids = numpy.array(
+            [feature_ids.get(feature, unseen_ids.get(feature[0], -1))
+             for feature in vocabulary], int)
+        fids = vocabulary_fids[ids[fs_indptr[0]:fs_indptr[-1]]]
+        rows = numpy.repeat(numpy.arange(len(featuresets)),
+                            numpy.diff(fs_indptr))
+        known = fids >= 0
+        fids = fids[known]
+        rows = rows[known]
+
+        # Each row holds feature id 0, followed by its known features.
+        row_lengths = numpy.bincount(rows, minlength=len(featuresets)) + 1
+        indptr = numpy.cumsum(row_lengths) - row_lengths
+        indices = numpy.zeros(row_lengths.sum(), int)
+        rank = numpy.arange(len(rows)) - numpy.searchsorted(rows, rows)
+        indices[indptr[rows]+rank+1] = fids
+        return indices, indptr
+
+    def _compiled(self):
+        """
+        Return a tuple C{(feature_ids, unseen_ids, logprobs)}, where
+        C{feature_ids} maps C{(fname, fval)} pairs to feature ids;
+        C{unseen_ids} maps each feature name to the feature id used
+        for values of that feature that were never seen; and
+        C{logprobs} is an array whose row for a feature id holds
+        P(fname=fval|label) for each label (in the order given by
+        C{labels()}), as a log probability.  Row 0 holds P(label).
+        """
+        try:
+            return self.__compiled
+        except AttributeError:
+            fvals = defaultdict(set)
+            for (label, fname), probdist in self._feature_probdist.items():
+                fvals[fname].update(probdist.samples())
+
+            def feature_logprobs(fname, fval):
+                logprobs = []
+                for label in self._labels:
+                    if (label, fname) in self._feature_probdist:
+                        feature_probs = self._feature_probdist[label,fname]
+                        logprobs.append(feature_probs.logprob(fval))
+                    else:
+                        logprobs.append(sum_logs([])) # = -INF.
+                return logprobs
+
+            rows = [[self._label_probdist.logprob(label)
+                     for label in self._labels]]
+            feature_ids = {}
+            unseen_ids = {}
+            for fname, values in fvals.items():
+                unseen_ids[fname] = len(rows)
+                rows.append(feature_logprobs(fname, _UNSEEN_VALUE))
+                for fval in values:
+                    feature_ids[fname, fval] = len(rows)
+                    rows.append(feature_logprobs(fname, fval))
+            logprobs = numpy.array(rows, 'd').reshape(len(rows),
+                                                      len(self._labels))
+
+            self.__compiled = (feature_ids, unseen_ids, logprobs)
+            return self.__compiled
+
+    def __getstate__(self):
+        # Don't save the compiled form.
+        state = self.__dict__.copy()
+        state.pop('_NaiveBayesClassifier__compiled', None)
+        return state
+
     def show_most_informative_features(self, n=10):
         # Determine the most relevant features, and display them.
         cpdist = self._feature_probdist
@@ -189,16 +323,28 @@ class NaiveBayesClassifier(ClassifierI):
         fnames = set()
 
         # Count up how many times each feature value occured, given
-        # the label and featurename.
+        # the label, using an id for each (fname, fval) pair.
+        feature_ids = {}
+        feature_counts = defaultdict(int)
         for featureset, label in labeled_featuresets:
             label_freqdist.inc(label)
-            for fname, fval in featureset.items():
-                # Increment freq(fval|label, fname)
-                feature_freqdist[label, fname].inc(fval)
-                # Record that fname can take the value fval.
-                feature_values[fname].add(fval)
-                # Keep a list of all feature names.
-                fnames.add(fname)
+            for feature in featureset.iteritems():
+                fid = feature_ids.get(feature)
+                if fid is None:
+                    fid = feature_ids[feature] = len(feature_ids)
+                feature_counts[label, fid] += 1
+
+        # Record the values that each feature name can take.
+        features = [None] * len(feature_ids)
+        for (fname, fval), fid in feature_ids.iteritems():
+            features[fid] = (fname, fval)
+            feature_values[fname].add(fval)
+            fnames.add(fname)
+
+        # Set freq(fval|label, fname) from the counts.
+        for (label, fid), count in feature_counts.iteritems():
+            fname, fval = features[fid]
+            feature_freqdist[label, fname].inc(fval, count)
 
         # If a feature didn't have a value given for an instance, then
         # we assume that it gets the implicit value 'None.'  This loop
@@ -10,10 +10,18 @@
 Utility functions and classes for classifiers.
 """
 import math
+import copy
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #from nltk.util import Deprecated
 import nltk.classify.util # for accuracy & log_likelihood
-from nltk.util import LazyMap
+from nltk.util import LazyMap, AbstractLazySequence
+from nltk.internals import slice_bounds
 
 ######################################################################
 #{ Helper Functions
@@ -23,7 +31,7 @@ from nltk.util import LazyMap
 # alternative name possibility: 'detect_features()'?
 # alternative name possibility: 'map_featuredetect()'?
 # or.. just have users use LazyMap directly?
-def apply_features(feature_func, toks, labeled=None):
+def apply_features(feature_func, toks, labeled=None, cache=False):
     """
     Use the L{LazyMap} class to construct a lazy list-like
     object that is analogous to C{map(feature_func, toks)}.  In
@@ -55,9 +63,19 @@ def apply_features(feature_func, toks, labeled=None):
     :param labeled: If true, then C{toks} contains labeled tokens --
         i.e., tuples of the form C{(tok, label)}.  (Default:
         auto-detect based on types.)
+    :param cache: If true, then return a L{FeaturesetCache}, which
+        computes each featureset only once, and stores the results
+        in a compact encoded form.  If C{cache} is a string, then it
+        is used as the name of the file in which the encoded
+        featuresets are stored.
     """
     if labeled is None:
         labeled = toks and isinstance(toks[0], (tuple, list))
+    if cache:
+        if isinstance(cache, basestring):
+            return FeaturesetCache(feature_func, toks, labeled, cache)
+        else:
+            return FeaturesetCache(feature_func, toks, labeled)
     if labeled:
         def lazy_func(labeled_token):
             return (feature_func(labeled_token[0]), labeled_token[1])
@@ -76,19 +94,103 @@ def attested_labels(tokens):
     """
     return tuple(set([label for (tok,label) in tokens]))
 
+def split_labels(labeled_featuresets):
+    """
+    :return: A tuple C{(featuresets, labels)}, containing the
+        featuresets and the labels of the given list of labeled
+        featuresets.  If C{labeled_featuresets} is a
+        L{FeaturesetCache}, then C{featuresets} is a cache that
+        shares its encoded featuresets.
+    :param labeled_featuresets: A list of C{(featureset, label)}
+        tuples.
+    """
+    if isinstance(labeled_featuresets, FeaturesetCache):
+        return (labeled_featuresets.featuresets(),
+                labeled_featuresets.labels())
+    return ([fs for (fs,l) in labeled_featuresets],
+            [l for (fs,l) in labeled_featuresets])
+
 def log_likelihood(classifier, gold):
-    results = classifier.batch_prob_classify([fs for (fs,l) in gold])
-    ll = [pdist.prob(l) for ((fs,l), pdist) in zip(gold, results)]
+    featuresets, labels = split_labels(gold)
+    results = classifier.batch_prob_classify(featuresets)
+    ll = [pdist.prob(l) for (l, pdist) in zip(labels, results)]
     return math.log(float(sum(ll))/len(ll))
 
 def accuracy(classifier, gold):
-    results = classifier.batch_classify([fs for (fs,l) in gold])
-    correct = [l==r for ((fs,l), r) in zip(gold, results)]
+    featuresets, labels = split_labels(gold)
+    results = classifier.batch_classify(featuresets)
+    correct = [l==r for (l, r) in zip(labels, results)]
     if correct:
         return float(sum(correct))/len(correct)
     else:
         return 0
 
+def minimize_lbfgs(objective, x, memory=10):
+    """
+    Minimize a differentiable function with the limited-memory BFGS
+    algorithm, using a backtracking line search.  This is a generator,
+    which yields a tuple C{(x, value, gradient, info)} for the
+    starting point, and for the point reached by each iteration; the
+    caller decides when to stop iterating.  The generator stops on
+    its own when no further progress can be made.
+
+    :param objective: A function that takes a point C{x} (a numpy
+        array), and returns a tuple C{(value, gradient, info)}, where
+        C{info} is any additional value that should be yielded with
+        the point.
+    :param x: The starting point.
+    :param memory: The number of previous updates that are used to
+        approximate the inverse Hessian.
+    """
+    value, gradient, info = objective(x)
+    yield x, value, gradient, info
+    updates = []  # (s, y, 1/dot(y, s)) for each recent update.
+    while True:
+        # Find the search direction, using the two-loop recursion.
+        direction = -gradient
+        alphas = []
+        for (s, y, rho) in reversed(updates):
+            alpha = rho * numpy.dot(s, direction)
+            direction -= alpha * y
+            alphas.append(alpha)
+        if updates:
+            (s, y, rho) = updates[-1]
+            direction *= 1.0 / (rho * numpy.dot(y, y))
+        for (s, y, rho), alpha in zip(updates, reversed(alphas)):
+            beta = rho * numpy.dot(y, direction)
+            direction += (alpha - beta) * s
+        slope = numpy.dot(gradient, direction)
+        if slope >= 0:
+            # Not a descent direction: start again from the gradient.
+            updates = []
+            direction = -gradient
+            slope = numpy.dot(gradient, direction)
+        if slope == 0:
+            return # The gradient is zero.
+
+        # Find a step size that decreases the objective enough
+        # (backtracking line search).
+        if updates: step = 1.0
+        else: step = 1.0 / math.sqrt(-slope)
+        while True:
+            new_x = x + step * direction
+            new_value, new_gradient, new_info = objective(new_x)
+            if new_value <= value + 1e-4 * step * slope:
+                break
+            step *= 0.5
+            if step < 1e-20:
+                return # No further progress is possible.
+
+        # Remember the update.
+        s = new_x - x
+        y = new_gradient - gradient
+        if numpy.dot(y, s) > 0:
+            updates.append((s, y, 1.0 / numpy.dot(y, s)))
+            del updates[:-memory]
+
+        x, value, gradient, info = new_x, new_value, new_gradient, new_info
+        yield x, value, gradient, info
+
 class CutoffChecker(object):
     """
     A helper class that implements cutoff checks based on number of
@@ -137,6 +239,196 @@ class CutoffChecker(object):
 
             return False # no cutoff reached.
 
+######################################################################
+#{ Featureset Caches
+######################################################################
+
+class FeaturesetCache(AbstractLazySequence):
+    """
+    A list-like object whose values are equal to those of
+    C{apply_features(feature_func, toks, labeled)}, but whose
+    featuresets are only computed once.  The first time a value is
+    read, C{feature_func} is applied to every token, and the
+    featuresets are stored in an encoded form: each distinct
+    C{(fname, fval)} pair is assigned an integer id, and each
+    featureset is stored as an array of those ids.  Later passes over
+    the list (such as the iterations of a trainer, or the evaluation
+    of a classifier) decode the stored featuresets, rather than
+    running C{feature_func} again.
+
+    The encoded featuresets are kept in memory; or, if a C{filename}
+    is given, they are written to that file, which is then mapped
+    into memory.  Classifiers that can work with the encoded form
+    directly (such as L{MaxentClassifier} and
+    L{NaiveBayesClassifier}) use it when they are given a
+    C{FeaturesetCache} of unlabeled featuresets; use
+    L{featuresets()} or L{split_labels()} to get one from a cache of
+    labeled featuresets.
+
+    Feature values must be hashable.  This class requires numpy.
+    """
+    _CHUNK_SIZE = 1<<16
+    """The number of encoded features that are buffered before they
+       are written to a cache file."""
+
+    def __init__(self, feature_func, toks, labeled=None, filename=None):
+        """
+        :param feature_func: The function that will be applied to each
+            token.  It should return a featureset -- i.e., a dict
+            mapping feature names to feature values.
+        :param toks: The list of tokens to which C{feature_func}
+            should be applied (see L{apply_features()}).
+        :param labeled: If true, then C{toks} contains labeled tokens
+            -- i.e., tuples of the form C{(tok, label)}.  (Default:
+            auto-detect based on types.)
+        :param filename: The name of the file in which the encoded
+            featuresets should be stored.  Any existing file with this
+            name is overwritten.  If C{None}, then the encoded
+            featuresets are kept in memory.
+        """
+        if numpy is None:
+            raise ValueError('FeaturesetCache requires that numpy be '
+                             'installed')
+        if labeled is None:
+            labeled = toks and isinstance(toks[0], (tuple, list))
+        self._feature_func = feature_func
+        self._toks = toks
+        self._labeled = self._labeled_toks = labeled
+        self._filename = filename
+        self._start = 0
+        self._stop = len(toks)
+        # The encoded featuresets are shared by all views of the cache.
+        self._store = {}
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def iterate_from(self, start):
+        vocabulary, indptr, ids, label_ids, labels = self._encoded()
+        for i in xrange(self._start+max(0, start), self._stop):
+            featureset = dict([vocabulary[fid] for fid in
+                               ids[indptr[i]:indptr[i+1]].tolist()])
+            if self._labeled:
+                yield (featureset, labels[label_ids[i]])
+            else:
+                yield featureset
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop = slice_bounds(self, i)
+            return self._view(self._start+start, self._start+stop,
+                              self._labeled)
+        else:
+            if i < 0: i += len(self)
+            if not 0 <= i < len(self):
+                raise IndexError('index out of range')
+            return self.iterate_from(i).next()
+
+    def featuresets(self):
+        """
+        :return: A C{FeaturesetCache} of this cache's featuresets,
+            without their labels.  The two caches share their encoded
+            featuresets.
+        """
+        return self._view(self._start, self._stop, False)
+
+    def labels(self):
+        """
+        :return: A list of the labels of this cache's featuresets.
+        :raise ValueError: If the cached tokens were not labeled.
+        """
+        if not self._labeled_toks:
+            raise ValueError('This cache does not contain labels')
+        vocabulary, indptr, ids, label_ids, labels = self._encoded()
+        return [labels[label_id] for label_id in
+                label_ids[self._start:self._stop].tolist()]
+
+    def encoded(self):
+        """
+        :return: A tuple C{(vocabulary, indptr, ids)} giving the
+            encoded form of this cache's featuresets: the C{i}th
+            featureset consists of the C{(fname, fval)} pairs
+            C{vocabulary[id]} for each C{id} in
+            C{ids[indptr[i]:indptr[i+1]]}, in the order in which
+            C{feature_func}'s result listed them.  C{indptr} is a
+            numpy array with C{len(self)+1} elements, and C{ids} is a
+            numpy array (which may be shared with other caches, so
+            C{indptr[0]} need not be zero).
+        """
+        vocabulary, indptr, ids, label_ids, labels = self._encoded()
+        return vocabulary, indptr[self._start:self._stop+1], ids
+
+    def _view(self, start, stop, labeled):
+        view = copy.copy(self)
+        view._start = start
+        view._stop = stop
+        view._labeled = labeled
+        return view
+
+    def _encoded(self):
+        """
+        Return a tuple C{(vocabulary, indptr, ids, label_ids,
+        labels)} containing the encoded featuresets for every token,
+        computing them if necessary.
+        """
+        if not self._store:
+            self._store['encoded'] = self._encode()
+        return self._store['encoded']
+
+    def _encode(self):
+        vocabulary = []
+        vocabulary_ids = {}
+        labels = []
+        label_index = {}
+        lengths = array.array('i')
+        label_ids = array.array('i')
+        ids = array.array('i')
+        num_ids = 0
+        if self._filename is not None:
+            outfile = open(self._filename, 'wb')
+        try:
+            for tok in self._toks:
+                if self._labeled_toks:
+                    tok, label = tok
+                    label_id = label_index.get(label)
+                    if label_id is None:
+                        label_id = label_index[label] = len(labels)
+                        labels.append(label)
+                    label_ids.append(label_id)
+                featureset = self._feature_func(tok)
+                for (fname, fval) in featureset.iteritems():
+                    # Include the type, so that e.g. 1 and True are
+                    # decoded as they were given.
+                    key = (fname, type(fval), fval)
+                    fid = vocabulary_ids.get(key)
+                    if fid is None:
+                        fid = vocabulary_ids[key] = len(vocabulary)
+                        vocabulary.append((fname, fval))
+                    ids.append(fid)
+                lengths.append(len(featureset))
+                if (self._filename is not None and
+                    len(ids) >= self._CHUNK_SIZE):
+                    ids.tofile(outfile)
+                    num_ids += len(ids)
+                    ids = array.array('i')
+        finally:
+            if self._filename is not None:
+                ids.tofile(outfile)
+                num_ids += len(ids)
+                outfile.close()
+
+        if self._filename is None:
+            ids = numpy.frombuffer(ids, numpy.intc)
+        elif num_ids:
+            ids = numpy.memmap(self._filename, numpy.intc, 'r',
+                               shape=(num_ids,))
+        else:
+            ids = numpy.zeros(0, numpy.intc)
+        indptr = numpy.zeros(len(lengths)+1, int)
+        numpy.cumsum(numpy.frombuffer(lengths, numpy.intc), out=indptr[1:])
+        return (vocabulary, indptr, ids,
+                numpy.frombuffer(label_ids, numpy.intc), labels)
+
 ######################################################################
 #{ Demos
 ######################################################################
@@ -1038,7 +1038,7 @@ def substitute_bindings(fstruct, bindings, fs_class='default'):
     :param bindings: A dictionary mapping from variables to values.
     """
     if fs_class == 'default': fs_class = _default_fs_class(fstruct)
-    fstruct = copy.deepcopy(fstruct)
+    fstruct = _copy_fstruct(fstruct, fs_class, {})
     _substitute_bindings(fstruct, bindings, fs_class, set())
     return fstruct
 
@@ -1171,8 +1171,8 @@ def rename_variables(fstruct, vars=None, used_vars=(), new_vars=None,
     used_vars = find_variables(fstruct, fs_class).union(used_vars)
 
     # Copy ourselves, and rename variables in the copy.
-    return _rename_variables(copy.deepcopy(fstruct), vars, used_vars,
-                             new_vars, fs_class, set())
+    return _rename_variables(_copy_fstruct(fstruct, fs_class, {}), vars,
+                             used_vars, new_vars, fs_class, set())
 
 def _rename_variables(fstruct, vars, used_vars, new_vars, fs_class, visited):
     if id(fstruct) in visited: return
@@ -1243,13 +1243,27 @@ UnificationFailure = _UnificationFailure()
    returned by L{Feature.unify_base_values()} or by custom C{fail()}
    functions to indicate that unificaiton should fail."""
 
-# The basic unification algorithm:
-#   1. Make copies of self and other (preserving reentrance)
+# There are two implementations of unification, which give the same
+# results and update the bindings in the same way.  The basic
+# algorithm, which is used when tracing or when a failure function is
+# given:
+#   1. Make copies of self, other and the bindings (preserving
+#      reentrance)
 #   2. Destructively unify self and other
-#   3. Apply forward pointers, to preserve reentrance.
+#   3. Apply forward pointers to the result and to the bound values,
+#      to preserve reentrance; and copy the bindings back.
+#   4. Replace bound variables with their values.
+# And the quasi-destructive algorithm (after Tomabechi 1991), which is
+# used otherwise:
+#   1. Unify self and other without modifying them, by recording
+#      forward pointers, and by copying each feature structure that
+#      gets new feature values the first time it is changed (shallowly).
+#   2. If unification fails, return None; nothing else was copied.
+#   3. Build the result with a single copy, which follows the forward
+#      pointers and picks up the new feature values.
 #   4. Replace bound variables with their values.
 def unify(fstruct1, fstruct2, bindings=None, trace=False,
-          fail=None, rename_vars=True, fs_class='default'):
+          fail=None, rename_vars=True, fs_class='default', memo=None):
     """
     Unify C{fstruct1} with C{fstruct2}, and return the resulting feature
     structure.  This unified feature structure is the minimal
@@ -1285,6 +1299,12 @@ def unify(fstruct1, fstruct2, bindings=None, trace=False,
         assumed to be unbound.  I.e., C{bindings} defaults to an
         empty dict.
 
+        C{bindings} is only updated if unification succeeds.  (In
+        earlier versions, a failed unification could leave some of
+        the variables that it had bound in C{bindings}.)  Bound
+        feature structure values share structure with the result,
+        so reentrance through variables is preserved.
+
     :type trace: bool
     :param trace: If true, generate trace output.
 
@@ -1300,6 +1320,21 @@ def unify(fstruct1, fstruct2, bindings=None, trace=False,
         If you intend for a variables in C{fstruct1} and C{fstruct2} with
         the same name to be treated as a single variable, use
         C{rename_vars=False}.
+
+    :type memo: dict
+    :param memo: A dictionary that is used to cache unification
+        results, keyed on C{(fstruct1, fstruct2, rename_vars)}.  It is
+        only used if C{fstruct1} and C{fstruct2} are both frozen, and
+        no C{bindings}, C{trace} or C{fail} are given.  Results that
+        come from the memo are frozen, since they are shared.  E.g.:
+
+            >>> memo = {}
+            >>> fs1 = FeatStruct('[a=?x, b=1]'); fs1.freeze()
+            >>> fs2 = FeatStruct('[a=2]'); fs2.freeze()
+            >>> unify(fs1, fs2, memo=memo)
+            [a=2, b=1]
+            >>> unify(fs1, fs2, memo=memo) is unify(fs1, fs2, memo=memo)
+            True
     """
     # Decide which class(es) will be treated as feature structures,
     # for the purposes of unification.
@@ -1310,22 +1345,46 @@ def unify(fstruct1, fstruct2, bindings=None, trace=False,
                              "dicts and lists is not supported.")
     assert isinstance(fstruct1, fs_class)
     assert isinstance(fstruct2, fs_class)
-    
+
+    # Look the result up in the memo, if we can use it.
+    if (memo is not None and bindings is None and not trace and fail is None
+        and isinstance(fstruct1, FeatStruct) and fstruct1.frozen()
+        and isinstance(fstruct2, FeatStruct) and fstruct2.frozen()):
+        key = (fstruct1, fstruct2, rename_vars)
+        try: return memo[key]
+        except KeyError: pass
+        result = _quasi_destructively_unify(fstruct1, fstruct2, None,
+                                            rename_vars, fs_class)
+        if result is not None: result.freeze()
+        memo[key] = result
+        return result
+
+    if trace or fail is not None:
+        return _copying_unify(fstruct1, fstruct2, bindings, trace, fail,
+                              rename_vars, fs_class)
+    else:
+        return _quasi_destructively_unify(fstruct1, fstruct2, bindings,
+                                          rename_vars, fs_class)
+
+def _copying_unify(fstruct1, fstruct2, bindings, trace, fail,
+                   rename_vars, fs_class):
+    """
+    Unify C{fstruct1} with C{fstruct2}, using the basic unification
+    algorithm.  See L{unify()} for the arguments.
+    """
     # If bindings are unspecified, use an empty set of bindings.
-    user_bindings = (bindings is not None)
     if bindings is None: bindings = {}
 
     # Make copies of fstruct1 and fstruct2 (since the unification
     # algorithm is destructive). Do it all at once, to preserve
     # reentrance links between fstruct1 and fstruct2.  Copy bindings
     # as well, in case there are any bound vars that contain parts
-    # of fstruct1 or fstruct2.
-    (fstruct1copy, fstruct2copy, bindings_copy) = (
+    # of fstruct1 or fstruct2.  Unification updates the copy of the
+    # bindings, which is only copied back to the original bindings
+    # dict if it succeeds (as in _quasi_destructively_unify()).
+    (fstruct1copy, fstruct2copy, new_bindings) = (
         copy.deepcopy((fstruct1, fstruct2, bindings)))
 
-    # Copy the bindings back to the original bindings dict.
-    bindings.update(bindings_copy)
-
     if rename_vars:
         vars1 = find_variables(fstruct1copy, fs_class)
         vars2 = find_variables(fstruct2copy, fs_class)
@@ -1334,8 +1393,9 @@ def unify(fstruct1, fstruct2, bindings=None, trace=False,
     # Do the actual unification.  If it fails, return None.
     forward = {}
     if trace: _trace_unify_start((), fstruct1copy, fstruct2copy)
-    try: result = _destructively_unify(fstruct1copy, fstruct2copy, bindings, 
-                                       forward, trace, fail, fs_class, ())
+    try: result = _destructively_unify(fstruct1copy, fstruct2copy,
+                                       new_bindings, forward, trace, fail,
+                                       fs_class, ())
     except _UnificationFailureError: return None
 
     # _destructively_unify might return UnificationFailure, e.g. if we
@@ -1345,9 +1405,16 @@ def unify(fstruct1, fstruct2, bindings=None, trace=False,
         else: return fail(fstruct1copy, fstruct2copy, ())
 
     # Replace any feature structure that has a forward pointer
-    # with the target of its forward pointer.
-    result = _apply_forwards(result, forward, fs_class, set())
-    if user_bindings: _apply_forwards_to_bindings(forward, bindings)
+    # with the target of its forward pointer.  This is done for the
+    # bindings too, since bound values can be substituted back into
+    # the result, and must share its structure to preserve reentrance.
+    visited = set()
+    result = _apply_forwards(result, forward, fs_class, visited)
+    _apply_forwards_to_bindings(forward, new_bindings)
+    for value in new_bindings.values():
+        if isinstance(value, fs_class):
+            _apply_forwards(value, forward, fs_class, visited)
+    bindings.update(new_bindings)
 
     # Replace bound vars with values.
     _resolve_aliases(bindings)
@@ -1358,6 +1425,250 @@ def unify(fstruct1, fstruct2, bindings=None, trace=False,
     if trace: _trace_bindings((), bindings)
     return result
 
+def _quasi_destructively_unify(fstruct1, fstruct2, bindings,
+                               rename_vars, fs_class):
+    """
+    Unify C{fstruct1} with C{fstruct2}, using the quasi-destructive
+    unification algorithm.  See L{unify()} for the arguments.  Neither
+    C{fstruct1} nor C{fstruct2} is modified; and C{bindings} is only
+    modified if unification succeeds.
+    """
+    # If bindings are unspecified, use an empty set of bindings.
+    if bindings is None: bindings = {}
+
+    # Unify using a private copy of the bindings.  The new feature
+    # values of each feature structure are kept in `arcs`, which maps
+    # its id to a shallow copy of its features.
+    new_bindings = dict(bindings)
+    forward = {}
+    arcs = {}
+
+    if rename_vars:
+        vars1 = find_variables(fstruct1, fs_class)
+        vars2 = find_variables(fstruct2, fs_class)
+        _quasi_rename_variables(fstruct2, vars1, vars2, {}, fs_class,
+                                set(), arcs)
+
+    # Do the actual unification.  If it fails, return None.
+    try: result = _quasi_unify(fstruct1, fstruct2, new_bindings,
+                               forward, arcs, fs_class)
+    except _UnificationFailureError: return None
+    if result is UnificationFailure: return None
+
+    # Copy the unified structure, following forward pointers, and
+    # copy the bindings along with it, to preserve reentrance.
+    memo = {}
+    result = _copy_fstruct(result, fs_class, memo, forward, arcs)
+    for (var, value) in new_bindings.items():
+        bindings[var] = _copy_fstruct(value, fs_class, memo, forward, arcs)
+
+    # Replace bound vars with values.
+    _resolve_aliases(bindings)
+    _substitute_bindings(result, bindings, fs_class, set())
+    return result
+
+def _quasi_features(fstruct, arcs):
+    """
+    Return the features of C{fstruct} that can be modified during
+    quasi-destructive unification, copying them the first time.
+    """
+    try: return arcs[id(fstruct)]
+    except KeyError:
+        if _is_mapping(fstruct): features = dict(fstruct)
+        else: features = list(fstruct)
+        arcs[id(fstruct)] = features
+        return features
+
+def _quasi_unify(fstruct1, fstruct2, bindings, forward, arcs, fs_class):
+    """
+    Attempt to unify C{fstruct1} and C{fstruct2}, without modifying
+    them.  This mirrors L{_destructively_unify()}, except that new
+    feature values for C{fstruct1} (and default values for
+    C{fstruct2}) are recorded in C{arcs}.
+    """
+    if fstruct1 is fstruct2: return fstruct1
+    forward[id(fstruct2)] = fstruct1
+
+    # Unifying two mappings:
+    if _is_mapping(fstruct1) and _is_mapping(fstruct2):
+        features1 = _quasi_features(fstruct1, arcs)
+        features2 = arcs.get(id(fstruct2), fstruct2)
+        for fname in features1:
+            if (getattr(fname, 'default', None) is not None and
+                fname not in features2):
+                features2 = _quasi_features(fstruct2, arcs)
+                features2[fname] = fname.default
+        for fname in features2:
+            if getattr(fname, 'default', None) is not None:
+                features1.setdefault(fname, fname.default)
+
+        for fname, fval2 in sorted(features2.items()):
+            if fname in features1:
+                features1[fname] = _quasi_unify_feature_values(
+                    fname, features1[fname], fval2, bindings,
+                    forward, arcs, fs_class)
+            else:
+                features1[fname] = fval2
+        return fstruct1
+
+    # Unifying two sequences:
+    elif _is_sequence(fstruct1) and _is_sequence(fstruct2):
+        if len(fstruct1) != len(fstruct2):
+            return UnificationFailure
+        features1 = _quasi_features(fstruct1, arcs)
+        for findex in range(len(features1)):
+            fval2 = arcs.get(id(fstruct2), fstruct2)[findex]
+            features1[findex] = _quasi_unify_feature_values(
+                findex, features1[findex], fval2, bindings,
+                forward, arcs, fs_class)
+        return fstruct1
+
+    # Unifying sequence & mapping: fail.
+    elif ((_is_sequence(fstruct1) or _is_mapping(fstruct1)) and
+          (_is_sequence(fstruct2) or _is_mapping(fstruct2))):
+        return UnificationFailure
+
+    # Unifying anything else: not allowed!
+    raise TypeError('Expected mappings or sequences')
+
+def _quasi_unify_feature_values(fname, fval1, fval2, bindings, forward,
+                                arcs, fs_class):
+    """
+    Attempt to unify C{fval1} and C{fval2}, and return the resulting
+    unified value.  This mirrors L{_unify_feature_values()}.
+    """
+    # Look up the "canonical" copy of fval1 and fval2
+    while id(fval1) in forward: fval1 = forward[id(fval1)]
+    while id(fval2) in forward: fval2 = forward[id(fval2)]
+
+    # Replace bound variables by their values.
+    fvar1 = fvar2 = None
+    while isinstance(fval1, Variable) and fval1 in bindings:
+        fvar1 = fval1
+        fval1 = bindings[fval1]
+    while isinstance(fval2, Variable) and fval2 in bindings:
+        fvar2 = fval2
+        fval2 = bindings[fval2]
+
+    # Case 1: Two feature structures (recursive case)
+    if isinstance(fval1, fs_class) and isinstance(fval2, fs_class):
+        result = _quasi_unify(fval1, fval2, bindings, forward, arcs,
+                              fs_class)
+
+    # Case 2: Two unbound variables (create alias)
+    elif (isinstance(fval1, Variable) and
+          isinstance(fval2, Variable)):
+        if fval1 != fval2: bindings[fval2] = fval1
+        result = fval1
+
+    # Case 3: An unbound variable and a value (bind)
+    elif isinstance(fval1, Variable):
+        bindings[fval1] = fval2
+        result = fval1
+    elif isinstance(fval2, Variable):
+        bindings[fval2] = fval1
+        result = fval2
+
+    # Case 4: A feature structure & a base value (fail)
+    elif isinstance(fval1, fs_class) or isinstance(fval2, fs_class):
+        result = UnificationFailure
+
+    # Case 5: Two base values
+    else:
+        if isinstance(fname, Feature):
+            result = fname.unify_base_values(fval1, fval2, bindings)
+        elif isinstance(fval1, CustomFeatureValue):
+            result = fval1.unify(fval2)
+            if (isinstance(fval2, CustomFeatureValue) and
+                result != fval2.unify(fval1)):
+                raise AssertionError(
+                    'CustomFeatureValue objects %r and %r disagree '
+                    'about unification value: %r vs. %r' %
+                    (fval1, fval2, result, fval2.unify(fval1)))
+        elif isinstance(fval2, CustomFeatureValue):
+            result = fval2.unify(fval1)
+        elif fval1 == fval2:
+            result = fval1
+        else:
+            result = UnificationFailure
+
+        if result is not UnificationFailure:
+            if fvar1 is not None:
+                bindings[fvar1] = result
+                result = fvar1
+            if fvar2 is not None and fvar2 != fvar1:
+                bindings[fvar2] = result
+                result = fvar2
+
+    if result is UnificationFailure:
+        raise _UnificationFailureError
+    return result
+
+def _quasi_rename_variables(fstruct, vars, used_vars, new_vars, fs_class,
+                            visited, arcs):
+    """
+    Rename variables in C{fstruct}, like L{_rename_variables()}, but
+    record the renamed feature values in C{arcs}.
+    """
+    if id(fstruct) in visited: return
+    visited.add(id(fstruct))
+    if _is_mapping(fstruct): items = fstruct.items()
+    elif _is_sequence(fstruct): items = enumerate(fstruct)
+    else: raise ValueError('Expected mapping or sequence')
+    for (fname, fval) in items:
+        if isinstance(fval, Variable):
+            if fval in new_vars:
+                _quasi_features(fstruct, arcs)[fname] = new_vars[fval]
+            elif fval in vars:
+                new_vars[fval] = _rename_variable(fval, used_vars)
+                _quasi_features(fstruct, arcs)[fname] = new_vars[fval]
+                used_vars.add(new_vars[fval])
+        elif isinstance(fval, fs_class):
+            _quasi_rename_variables(fval, vars, used_vars, new_vars,
+                                    fs_class, visited, arcs)
+        elif isinstance(fval, SubstituteBindingsI):
+            for var in fval.variables():
+                if var in vars and var not in new_vars:
+                    new_vars[var] = _rename_variable(var, used_vars)
+                    used_vars.add(new_vars[var])
+            _quasi_features(fstruct, arcs)[fname] = (
+                fval.substitute_bindings(new_vars))
+
+#: Feature value types that are immutable, and so can be shared
+#: between a feature structure and its copies.
+_IMMUTABLE_VALUE_TYPES = (basestring, int, long, float, bool,
+                          type(None), Variable)
+
+def _copy_fstruct(fval, fs_class, memo, forward=None, arcs=None):
+    """
+    Return a deep copy of C{fval}.  This is equivalent to
+    C{copy.deepcopy(fval, memo)}, except that feature names and
+    immutable base values are shared, rather than copied.
+
+    :param forward: If specified, then follow these forward pointers
+        before copying any feature structure.
+    :param arcs: If specified, then use the feature values that it
+        maps feature structure ids to, in place of the feature
+        structures' own values.
+    """
+    if not isinstance(fval, fs_class):
+        if isinstance(fval, _IMMUTABLE_VALUE_TYPES): return fval
+        return copy.deepcopy(fval, memo)
+    if forward:
+        while id(fval) in forward: fval = forward[id(fval)]
+    if id(fval) in memo: return memo[id(fval)]
+    if arcs: features = arcs.get(id(fval), fval)
+    else: features = fval
+    memo[id(fval)] = fcopy = fval.__class__()
+    if _is_mapping(fval):
+        for (fname, fval2) in features.items():
+            fcopy[fname] = _copy_fstruct(fval2, fs_class, memo,
+                                         forward, arcs)
+    else:
+        fcopy.extend([_copy_fstruct(fval2, fs_class, memo, forward, arcs)
+                      for fval2 in features])
+    return fcopy
+
 class _UnificationFailureError(Exception):
     """An exception that is used by C{_destructively_unify} to abort
     unification when a failure is encountered."""
@@ -70,6 +70,7 @@ X{expanding} M{lhs} to M{rhs} in M{tree}.
 """
 
 import re
+import copy
 
 from nltk.util import transitive_closure, invert_graph
 
@@ -677,6 +678,17 @@ class ContextFreeGrammar(object):
         return (self.is_flexible_chomsky_normal_form() and 
                 self._all_unary_are_lexical)
 
+    def compile(self):
+        """
+        :return: A version of this grammar that has been compiled for
+            use by chart parsers.  The compiled grammar is cached, so
+            the grammar should not be modified after it is compiled.
+        :rtype: L{CompiledGrammar}
+        """
+        if getattr(self, '_compiled', None) is None:
+            self._compiled = CompiledGrammar(self)
+        return self._compiled
+
     def __repr__(self):
         return '<Grammar with %d productions>' % len(self._productions)
 
@@ -688,6 +700,177 @@ class ContextFreeGrammar(object):
         return str
 
 
+class CompiledGrammar(ContextFreeGrammar):
+    """
+    A context-free grammar that has been compiled for use by chart
+    parsers.  Each nonterminal and terminal of the grammar is mapped
+    to an integer id, and its productions are stored in lists that
+    are indexed by the id of their left-hand side, and by the id of
+    the first element of their right-hand side.  The left-corner
+    relation is precomputed for every nonterminal, as a set of the
+    ids of the nonterminals that it can start with.
+
+    A C{CompiledGrammar} answers the same queries as the grammar that
+    it was compiled from, with equal productions.  But each symbol is
+    represented by a single object, which is shared by all of the
+    productions; so the edges that are built from them can be
+    compared by identity, rather than symbol by symbol.  Each of
+    these nonterminals also records its own id, so when a chart rule
+    asks for the productions (or left corners) of a nonterminal that
+    it took from one of this grammar's productions, they are found by
+    indexing rather than by hashing.  Use L{ContextFreeGrammar.compile()}
+    to compile a grammar.
+    """
+    def __init__(self, grammar):
+        """
+        Compile the given grammar.
+
+        :type grammar: L{ContextFreeGrammar}
+        """
+        self._grammar = grammar
+        self._symbols = []
+        self._symbol_ids = {}
+        start = self._intern(grammar.start())
+        productions = []
+        for prod in grammar.productions():
+            prod = copy.copy(prod)
+            prod._lhs = self._intern(prod._lhs)
+            prod._rhs = tuple(self._intern(elt) for elt in prod._rhs)
+            productions.append(prod)
+        ContextFreeGrammar.__init__(self, start, productions,
+                                    hasattr(grammar, '_leftcorners'))
+
+    def _intern(self, symbol):
+        i = self._symbol_ids.get(symbol)
+        if i is None:
+            i = self._symbol_ids[symbol] = len(self._symbols)
+            if is_nonterminal(symbol):
+                # A private copy, which records its id.
+                symbol = copy.copy(symbol)
+                symbol._compiled_id = i
+            self._symbols.append(symbol)
+        return self._symbols[i]
+
+    def _id(self, symbol):
+        """
+        :return: The id of the given nonterminal or terminal, or
+            C{None} if it is not used by the grammar.  Nonterminals
+            that were taken from this grammar are not hashed.
+        """
+        i = getattr(symbol, '_compiled_id', None)
+        if (i is not None and i < len(self._symbols) and
+            self._symbols[i] is symbol):
+            return i
+        return self._symbol_ids.get(symbol)
+
+    def _calculate_indexes(self):
+        ContextFreeGrammar._calculate_indexes(self)
+        ids = self._symbol_ids
+        self._lhs_productions = [[] for symbol in self._symbols]
+        self._rhs_productions = [[] for symbol in self._symbols]
+        for prod in self._productions:
+            self._lhs_productions[ids[prod._lhs]].append(prod)
+            if prod._rhs:
+                self._rhs_productions[ids[prod._rhs[0]]].append(prod)
+
+    def _calculate_leftcorners(self):
+        ids = self._symbol_ids
+        symbols = self._symbols
+        # The immediate left corners of each nonterminal: the
+        # nonterminals (including itself), and the terminals.
+        immediate = [set([i]) for i in range(len(symbols))]
+        immediate_words = [set() for symbol in symbols]
+        for prod in self._productions:
+            if prod._rhs:
+                i, left = ids[prod._lhs], ids[prod._rhs[0]]
+                if is_nonterminal(prod._rhs[0]):
+                    immediate[i].add(left)
+                else:
+                    immediate_words[i].add(left)
+        closure = transitive_closure(dict(enumerate(immediate)),
+                                     reflexive=True)
+        # Terminals have no left corners.
+        self._leftcorner_ids = [frozenset(closure[i]) if is_nonterminal(sym)
+                                else frozenset()
+                                for (i, sym) in enumerate(symbols)]
+        parents = [set() for symbol in symbols]
+        for (i, lefts) in enumerate(self._leftcorner_ids):
+            for left in lefts:
+                parents[left].add(i)
+        self._leftcorner_parent_ids = [frozenset(p) for p in parents]
+        self._immediate_leftcorner_word_ids = immediate_words
+
+        nr_leftcorner_categories = sum(map(len, immediate))
+        nr_leftcorner_words = sum(map(len, immediate_words))
+        if nr_leftcorner_words > nr_leftcorner_categories > 10000:
+            # If the grammar is big, the leftcorner-word sets will be
+            # too large.  In that case it is better to check the
+            # relation on demand.
+            self._leftcorner_word_ids = None
+            return
+
+        self._leftcorner_word_ids = []
+        for lefts in self._leftcorner_ids:
+            words = set()
+            for left in lefts:
+                words.update(immediate_words[left])
+            self._leftcorner_word_ids.append(frozenset(words))
+
+    def grammar(self):
+        """
+        :return: The grammar that this grammar was compiled from.
+        :rtype: L{ContextFreeGrammar}
+        """
+        return self._grammar
+
+    def compile(self):
+        return self
+
+    def productions(self, lhs=None, rhs=None, empty=False):
+        if rhs is not None and not empty and lhs is None:
+            i = self._id(rhs)
+            if i is None: return []
+            return self._rhs_productions[i]
+        elif lhs is not None and not empty and rhs is None:
+            i = self._id(lhs)
+            if i is None: return []
+            return self._lhs_productions[i]
+        return ContextFreeGrammar.productions(self, lhs, rhs, empty)
+    productions.__doc__ = ContextFreeGrammar.productions.__doc__
+
+    def leftcorners(self, cat):
+        i = self._id(cat)
+        if i is None or not self._leftcorner_ids[i]: return set([cat])
+        return set(self._symbols[j] for j in self._leftcorner_ids[i])
+    leftcorners.__doc__ = ContextFreeGrammar.leftcorners.__doc__
+
+    def is_leftcorner(self, cat, left):
+        i = self._id(cat)
+        if i is None: return is_nonterminal(left) and left == cat
+        j = self._id(left)
+        if j is None:
+            return False
+        elif is_nonterminal(left):
+            return j in self._leftcorner_ids[i]
+        elif self._leftcorner_word_ids is not None:
+            return j in self._leftcorner_word_ids[i]
+        else:
+            words = self._immediate_leftcorner_word_ids
+            return any(j in words[parent]
+                       for parent in self._leftcorner_ids[i])
+    is_leftcorner.__doc__ = ContextFreeGrammar.is_leftcorner.__doc__
+
+    def leftcorner_parents(self, cat):
+        i = self._id(cat)
+        if i is None or not self._leftcorner_parent_ids[i]:
+            return set([cat])
+        return set(self._symbols[j] for j in self._leftcorner_parent_ids[i])
+    leftcorner_parents.__doc__ = ContextFreeGrammar.leftcorner_parents.__doc__
+
+    def __repr__(self):
+        return ('<Compiled grammar with %d productions>' %
+                len(self._productions))
+
 class FeatureGrammar(ContextFreeGrammar):
     """
     A feature-based grammar.  This is equivalent to a 
@@ -709,6 +892,13 @@ class FeatureGrammar(ContextFreeGrammar):
         :type productions: list of L{Production}
         """
         ContextFreeGrammar.__init__(self, start, productions)
+
+    def compile(self):
+        """
+        :return: This grammar.  Feature grammars are not compiled,
+            since their productions are matched by unification.
+        """
+        return self
     
     # The difference with CFG is that the productions are
     # indexed on the TYPE feature of the nonterminals.
@@ -1478,7 +1668,8 @@ if __name__ == '__main__':
 
 __all__ = ['Nonterminal', 'nonterminals',
            'Production', 'DependencyProduction', 'WeightedProduction',
-           'ContextFreeGrammar', 'WeightedGrammar', 'DependencyGrammar',
+           'ContextFreeGrammar', 'CompiledGrammar', 'WeightedGrammar',
+           'DependencyGrammar',
            'StatisticalDependencyGrammar', 
            'induce_pcfg', 'parse_cfg', 'parse_cfg_production',
            'parse_pcfg', 'parse_pcfg_production',
@@ -43,7 +43,7 @@ three sub-modules for specialized kinds of parsing:
     associates a probability with each parse.
 """
 
-from nltk.parse.api import ParserI
+from nltk.parse.api import ParserI, ParseLimitExceeded
 from nltk.parse.chart import (ChartParser, SteppingChartParser, TopDownChartParser,
                               BottomUpChartParser, BottomUpLeftCornerChartParser,
                               LeftCornerChartParser)
@@ -8,9 +8,16 @@
 #
 
 import itertools
+import signal
 
 from nltk.internals import overridden
 
+class ParseLimitExceeded(Exception):
+    """
+    An exception that is raised when a parser gives up on a sentence,
+    because it has taken too long, or has built too many edges.
+    """
+
 class ParserI(object):
     """
     A processing class for deriving trees that represent possible
@@ -131,6 +138,46 @@ class ParserI(object):
         """
         return [self.nbest_parse(sent,n ) for sent in sents]
 
+    def parallel_nbest_parse(self, sents, n=None, processes=None,
+                             timeout=None, chunksize=1):
+        """
+        Apply L{self.nbest_parse()} to each element of C{sents}, using
+        a pool of worker processes.  Each worker receives a copy of
+        this parser, and compiles its grammar once (see
+        L{ContextFreeGrammar.compile()
+        <nltk.grammar.ContextFreeGrammar.compile>}), so the parser
+        and the sentences must be picklable.
+
+        The results are generated in the same order as C{sents}.  If
+        parsing a sentence raises L{ParseLimitExceeded} (for example,
+        because a chart parser's C{max_edges} was exceeded), or takes
+        longer than C{timeout}, then its result is C{None}.  Any other
+        exception is raised when its sentence's result is reached.
+
+        :param n: The maximum number of trees to return per sentence.
+        :param processes: The number of worker processes.  By
+            default, one per CPU.
+        :param timeout: The maximum number of seconds to spend on
+            each sentence.  Timeouts are only supported on platforms
+            that provide C{signal.setitimer}.
+        :param chunksize: The number of sentences that are sent to a
+            worker at a time.
+        :rtype: iter of (list of L{Tree} or C{None})
+        """
+        # Imported here, since most parsers never need it.
+        import multiprocessing
+        if timeout is not None and not hasattr(signal, 'setitimer'):
+            raise ValueError('Timeouts are not supported on this platform')
+        pool = multiprocessing.Pool(processes, _init_worker, (self,))
+        try:
+            tasks = ((sent, n, timeout) for sent in sents)
+            for result in pool.imap(_parse_in_worker, tasks, chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
     def batch_iter_parse(self, sents):
         """
         Apply L{self.iter_parse()} to each element of C{sents}.  I.e.:
@@ -151,3 +198,35 @@ class ParserI(object):
         """
         return [self.prob_parse(sent) for sent in sents]
 
+######################################################################
+## Worker processes for parallel_nbest_parse()
+######################################################################
+
+_worker_parser = None
+
+def _init_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+    grammar = parser.grammar()
+    if hasattr(grammar, 'compile'):
+        grammar.compile()
+
+def _timed_out(signum, frame):
+    raise ParseLimitExceeded('Timed out')
+
+def _parse_in_worker((sent, n, timeout)):
+    """
+    Parse C{sent} with the worker's parser, and return its C{n} best
+    trees, or C{None} if the parser gives up.
+    """
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            return _worker_parser.nbest_parse(sent, n)
+        finally:
+            if timeout is not None:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except ParseLimitExceeded:
+        return None
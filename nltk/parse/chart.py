@@ -39,13 +39,17 @@ defines three chart parsers:
 """
 
 from collections import defaultdict
+import bisect
+import heapq
+import itertools
 import re
 import warnings
 
 from nltk.tree import Tree
 from nltk.grammar import WeightedGrammar, is_nonterminal, is_terminal
+from nltk.internals import overridden
 
-from nltk.parse.api import ParserI
+from nltk.parse.api import ParserI, ParseLimitExceeded
 
 
 ########################################################################
@@ -89,6 +93,8 @@ class EdgeI(object):
     The C{EdgeI} interface provides a common interface to both types
     of edge, allowing chart parsers to treat them in a uniform manner.
     """
+    __slots__ = ()
+
     def __init__(self):
         if self.__class__ == EdgeI: 
             raise TypeError('Edge is an abstract interface')
@@ -223,6 +229,9 @@ class TreeEdge(EdgeI):
 
     For more information about edges, see the L{EdgeI} interface.
     """
+    # Charts can hold many edges, so they have no instance dictionary.
+    __slots__ = ('_lhs', '_rhs', '_span', '_dot', '_hash')
+
     def __init__(self, span, lhs, rhs, dot=0):
         """
         Construct a new C{TreeEdge}.
@@ -249,6 +258,7 @@ class TreeEdge(EdgeI):
         self._rhs = tuple(rhs)
         self._span = span
         self._dot = dot
+        self._hash = None
 
     # [staticmethod]
     def from_production(production, index):
@@ -290,13 +300,20 @@ class TreeEdge(EdgeI):
         if self._dot >= len(self._rhs): return None
         else: return self._rhs[self._dot]
 
-    # Comparisons & hashing
+    # Comparisons & hashing.  Edges that are built from the
+    # productions of a CompiledGrammar share their lhs & rhs, so
+    # they can usually be compared by identity.
     def __cmp__(self, other):
         if self.__class__ != other.__class__: return -1
+        if (self._rhs is other._rhs and self._lhs is other._lhs and
+            self._span == other._span and self._dot == other._dot):
+            return 0
         return cmp((self._span, self.lhs(), self.rhs(), self._dot),
                    (other._span, other.lhs(), other.rhs(), other._dot))
     def __hash__(self):
-        return hash((self.lhs(), self.rhs(), self._span, self._dot))
+        if self._hash is None:
+            self._hash = hash((self.lhs(), self.rhs(), self._span, self._dot))
+        return self._hash
 
     # String representation
     def __str__(self):
@@ -324,6 +341,8 @@ class LeafEdge(EdgeI):
     side is C{()}.  Its span is C{[index, index+1]}, and its dot
     position is C{0}.
     """
+    __slots__ = ('_leaf', '_index')
+
     def __init__(self, leaf, index):
         """
         Construct a new C{LeafEdge}.
@@ -365,6 +384,32 @@ class LeafEdge(EdgeI):
 ##  Chart
 ########################################################################
 
+class _ChildPointers(object):
+    """
+    The child pointer lists of a single edge in a L{Chart}, recorded
+    as a log of the insertions that added new child pointer lists.
+    Each entry is either C{(None, cpl, 0)}, for an explicit child
+    pointer list C{cpl}; or C{(previous, child, n)}, for the child
+    pointer lists that are formed by adding C{child} to each of the
+    child pointer lists that C{previous} had after its first C{n}
+    entries.
+
+    :ivar entries: The list of entries.
+    :ivar index: Used to check whether new entries add anything.
+        If all entries are explicit, then this is the set of child
+        pointer lists; if all entries are backpointers, then it is a
+        dictionary mapping each child edge to its previous edge and
+        the largest C{n} it was used with.  If there are no entries,
+        then it is C{None}; and if the entries are mixed, or a child
+        was used with several previous edges, then it is C{False}.
+    """
+    __slots__ = ('entries', 'index')
+
+    def __init__(self):
+        self.entries = []
+        self.index = None
+
+
 class Chart(object):
     """
     A blackboard for hypotheses about the syntactic constituents of a
@@ -379,16 +424,28 @@ class Chart(object):
     creates and maintains an index for each set of attributes that
     have been selected on.
 
+    The incomplete edges are always indexed by their C{end} and
+    C{next}, and the complete edges by their C{start} and C{lhs}: these
+    are the selections that are made by the fundamental rule.
+
     In order to reconstruct the trees that are represented by an edge,
     the chart associates each edge with a set of child pointer lists.
     A X{child pointer list} is a list of the edges that license an
-    edge's right-hand side.
+    edge's right-hand side.  When an edge is formed by moving the dot
+    of a previous edge (see L{insert_with_backpointer}), its child
+    pointer lists are not copied: the chart just records a pointer to
+    the previous edge and the new child, so the child pointer lists
+    form a packed forest.
 
     :ivar _tokens: The sentence that the chart covers.
     :ivar _num_leaves: The number of tokens.
     :ivar _edges: A list of the edges in the chart
-    :ivar _edge_to_cpls: A dictionary mapping each edge to a set
-        of child pointer lists that are associated with that edge.
+    :ivar _edge_to_cpls: A dictionary mapping each edge to the
+        C{_ChildPointers} that record its child pointer lists.
+    :ivar _incomplete_index: A dictionary mapping C{(end, next)} to
+        lists of incomplete edges.
+    :ivar _complete_index: A dictionary mapping C{(start, lhs)} to
+        lists of complete edges.
     :ivar _indexes: A dictionary mapping tuples of edge attributes
         to indices, where each index maps the corresponding edge
         attribute values to lists of edges.
@@ -418,6 +475,17 @@ class Chart(object):
         # The set of child pointer lists associated with each edge.
         self._edge_to_cpls = {}
 
+        # The unpacked child pointer lists, indexed by (edge, n),
+        # where n is the number of entries that were unpacked.
+        self._cpl_cache = {}
+
+        # Subclasses that override insert() can't use backpointers.
+        self._unpacked = overridden(self.insert)
+
+        # Indexes for the fundamental rule.
+        self._incomplete_index = {}
+        self._complete_index = {}
+
         # Indexes mapping attribute values to lists of edges 
         # (used by select()).
         self._indexes = {}
@@ -507,6 +575,18 @@ class Chart(object):
         """
         # If there are no restrictions, then return all edges.
         if restrictions=={}: return iter(self._edges)
+
+        # Use the fundamental rule's indexes, if possible.
+        if len(restrictions) == 3:
+            is_complete = restrictions.get('is_complete')
+            if (is_complete is False and 'end' in restrictions and
+                'next' in restrictions):
+                return iter(self._incomplete_index.get(
+                    (restrictions['end'], restrictions['next']), []))
+            if (is_complete is True and 'start' in restrictions and
+                'lhs' in restrictions):
+                return iter(self._complete_index.get(
+                    (restrictions['start'], restrictions['lhs']), []))
             
         # Find the index corresponding to the given restrictions.
         restr_keys = restrictions.keys()
@@ -543,6 +623,12 @@ class Chart(object):
         A helper function for L{insert}, which registers the new
         edge with all existing indexes.
         """
+        if edge.is_complete():
+            key = (edge.start(), edge.lhs())
+            self._complete_index.setdefault(key, []).append(edge)
+        else:
+            key = (edge.end(), edge.next())
+            self._incomplete_index.setdefault(key, []).append(edge)
         for (restr_keys, index) in self._indexes.items():
             vals = tuple(getattr(edge, key)() for key in restr_keys)
             index.setdefault(vals, []).append(edge)
@@ -554,10 +640,59 @@ class Chart(object):
     def insert_with_backpointer(self, new_edge, previous_edge, child_edge):
         """
         Add a new edge to the chart, using a pointer to the previous edge.
+        The child pointer lists of C{new_edge} are the child pointer
+        lists of C{previous_edge}, extended with C{child_edge}; but
+        they are only recorded as a pointer to C{previous_edge}.
+
+        :rtype: bool
+        :return: True if this operation modified the chart.  See
+            L{insert}.
         """
-        cpls = self.child_pointer_lists(previous_edge)
-        new_cpls = [cpl+(child_edge,) for cpl in cpls]
-        return self.insert(new_edge, *new_cpls)
+        if self._unpacked:
+            cpls = self.child_pointer_lists(previous_edge)
+            new_cpls = [cpl+(child_edge,) for cpl in cpls]
+            return self.insert(new_edge, *new_cpls)
+
+        # The child pointer lists of the previous edge, so far.
+        previous_cpls = self._edge_to_cpls.get(previous_edge)
+        if previous_cpls is None: n = 0
+        else: n = len(previous_cpls.entries)
+
+        # Is it a new edge?
+        cpls = self._edge_to_cpls.get(new_edge)
+        if cpls is None:
+            self._append_edge(new_edge)
+            self._register_with_indexes(new_edge)
+            cpls = self._edge_to_cpls[new_edge] = _ChildPointers()
+        if n == 0:
+            return False
+
+        # Does it add any new child pointer lists?  The previous
+        # edge's child pointer lists only grow, so this is cheap if
+        # child_edge has only been used with previous_edge.
+        index = cpls.index
+        if index is None:
+            cpls.index = index = {}
+        elif not isinstance(index, dict):
+            cpls.index = index = False
+        if index is not False:
+            last = index.get(child_edge)
+            if last is None:
+                index[child_edge] = (previous_edge, n)
+            elif last[0] == previous_edge:
+                if last[1] >= n: return False
+                index[child_edge] = (previous_edge, n)
+            else:
+                cpls.index = index = False
+        if index is False:
+            old_cpls = set(self._unpack(new_edge, len(cpls.entries)))
+            for cpl in self._unpack(previous_edge, n):
+                if cpl+(child_edge,) not in old_cpls: break
+            else:
+                return False
+
+        cpls.entries.append((previous_edge, child_edge, n))
+        return True
 
     def insert(self, edge, *child_pointer_lists):
         """
@@ -576,21 +711,33 @@ class Chart(object):
             C{child_pointer_lists} with C{edge}.
         """
         # Is it a new edge?
-        if edge not in self._edge_to_cpls:
+        cpls = self._edge_to_cpls.get(edge)
+        if cpls is None:
             # Add it to the list of edges.
             self._append_edge(edge)
             # Register with indexes.
             self._register_with_indexes(edge)
+            cpls = self._edge_to_cpls[edge] = _ChildPointers()
+        if not child_pointer_lists:
+            return False
 
         # Get the set of child pointer lists for this edge.
-        cpls = self._edge_to_cpls.setdefault(edge,{})
+        if cpls.index is None:
+            cpls.index = set()
+        if isinstance(cpls.index, set):
+            old_cpls = cpls.index
+        else:
+            old_cpls = set(self._unpack(edge, len(cpls.entries)))
         chart_was_modified = False
         for child_pointer_list in child_pointer_lists:
             child_pointer_list = tuple(child_pointer_list)
-            if child_pointer_list not in cpls:
+            if child_pointer_list not in old_cpls:
                 # It's a new CPL; register it, and return true.
-                cpls[child_pointer_list] = True
+                old_cpls.add(child_pointer_list)
+                cpls.entries.append((None, child_pointer_list, 0))
                 chart_was_modified = True
+        if chart_was_modified and old_cpls is not cpls.index:
+            cpls.index = False
         return chart_was_modified
     
     def _append_edge(self, edge):
@@ -606,10 +753,62 @@ class Chart(object):
         the entire chart, and whose root node is C{root}.
         """
         trees = []
-        for edge in self.select(start=0, end=self._num_leaves, lhs=root):
+        for edge in self._parse_edges(root):
             trees += self.trees(edge, tree_class=tree_class, complete=True)
         return trees
 
+    def iter_parses(self, root, tree_class=Tree):
+        """
+        :return: An iterator that generates the complete tree
+        structures that span the entire chart, and whose root node is
+        C{root}, in the same order as L{parses}.  The trees are read
+        off a L{PackedForest} one at a time, so taking the first few
+        parses of an ambiguous sentence is cheap.
+        :rtype: iter of L{Tree}
+        """
+        for edge in list(self._parse_edges(root)):
+            for tree in self.iter_trees(edge, tree_class, complete=True):
+                yield tree
+
+    def num_parses(self, root):
+        """
+        :return: The number of trees that L{parses} would return,
+        without building them.
+        :rtype: int
+        """
+        return sum(self.num_trees(edge, complete=True)
+                   for edge in self._parse_edges(root))
+
+    def iter_best_parses(self, root, weight, tree_class=Tree):
+        """
+        :return: An iterator that generates the trees of L{parses}
+        from highest to lowest score, without building the trees that
+        are not asked for.  See L{PackedForest.iter_best_trees}.
+        :rtype: iter of L{Tree}
+        :param weight: A function mapping each edge to a nonnegative
+            weight, such as the probability of its production.
+        """
+        streams = []
+        offset = 0
+        for edge in list(self._parse_edges(root)):
+            forest = PackedForest(self, complete=True)
+            streams.append(self._offset_trees(
+                forest._iter_best(edge, weight, tree_class), offset))
+            offset += forest.num_trees(edge)
+        for (neg_score, index, tree) in heapq.merge(*streams):
+            yield tree
+
+    def _offset_trees(self, trees, offset):
+        for (neg_score, index, tree) in trees:
+            yield (neg_score, index+offset, tree)
+
+    def _parse_edges(self, root):
+        """
+        :return: The complete edges that span the entire chart, and
+            whose root node is C{root}.
+        """
+        return self.select(start=0, end=self._num_leaves, lhs=root)
+
     def trees(self, edge, tree_class=Tree, complete=False):
         """
         :return: A list of the tree structures that are associated
@@ -627,6 +826,26 @@ class Chart(object):
         """
         return self._trees(edge, complete, memo={}, tree_class=tree_class)
 
+    def iter_trees(self, edge, tree_class=Tree, complete=False):
+        """
+        :return: An iterator that generates the tree structures that
+        are associated with C{edge}, in the same order as L{trees}.
+        Unlike L{trees}, the trees do not share subtrees.
+        :rtype: iter of L{Tree}
+        """
+        # Charts that read trees differently can't use the forest.
+        if overridden(self._trees):
+            return iter(self.trees(edge, tree_class, complete))
+        return PackedForest(self, complete).iter_trees(edge, tree_class)
+
+    def num_trees(self, edge, complete=False):
+        """
+        :return: The number of trees that L{trees} would return for
+        C{edge}, without building them.
+        :rtype: int
+        """
+        return PackedForest(self, complete).num_trees(edge)
+
     def _trees(self, edge, complete, memo, tree_class):
         """
         A helper function for L{trees}.
@@ -716,8 +935,35 @@ class Chart(object):
             Each child pointer list is a list of edges that have
             been used to form this edge.
         """
+        cpls = self._edge_to_cpls.get(edge)
+        if cpls is None: return []
         # Make a copy, in case they modify it.
-        return self._edge_to_cpls.get(edge, {}).keys()
+        return list(self._unpack(edge, len(cpls.entries)))
+
+    def _unpack(self, edge, n):
+        """
+        A helper function for L{child_pointer_lists}, which returns the
+        child pointer lists that were added by the first C{n} entries
+        of C{edge}, in the order that they were added to the chart.
+        """
+        if n == 0: return []
+        if (edge, n) in self._cpl_cache:
+            return self._cpl_cache[edge, n]
+        cpls = {}
+        has_backpointers = False
+        for (previous_edge, child, m) in self._edge_to_cpls[edge].entries[:n]:
+            if previous_edge is None:
+                cpls[child] = True
+            else:
+                has_backpointers = True
+                for cpl in self._unpack(previous_edge, m):
+                    cpls[cpl+(child,)] = True
+        cpls = cpls.keys()
+        # Explicit child pointer lists are cheap to unpack, so only
+        # the unpacked backpointers are kept.
+        if has_backpointers:
+            self._cpl_cache[edge, n] = cpls
+        return cpls
 
     #////////////////////////////////////////////////////////////
     # Display
@@ -842,6 +1088,224 @@ class Chart(object):
         s += '}\n'
         return s
 
+########################################################################
+##  Packed Forest
+########################################################################
+
+class PackedForest(object):
+    """
+    The trees of a L{Chart}, represented as a packed forest.  Each edge
+    is a node of the forest, whose alternatives are the edge's child
+    pointer lists.  The forest reads the same trees as L{Chart.trees}:
+    in particular, a tree never contains its own edge as a descendant;
+    and if C{complete} is true, then incomplete edges have no trees.
+
+    The forest is built lazily, as edges are visited.  Like a single
+    call to L{Chart.trees}, the trees of an edge that is reached
+    through a cycle are those that were found when it was first
+    visited.  The number of trees of an edge is found without
+    enumerating them; and its trees can be generated one at a time,
+    either in the order that L{Chart.trees} returns them, or from
+    best to worst (see L{iter_best_trees}).
+
+    :ivar _num_trees: A dictionary mapping each visited edge to its
+        number of trees.
+    :ivar _alternatives: A dictionary mapping each visited edge to a
+        list of C{(offset, cpl, counts)} tuples, one for each child
+        pointer list C{cpl} that has trees.  C{counts} gives the
+        number of trees of each child, and C{offset} is the number
+        of trees of the edge's earlier child pointer lists.
+    :ivar _best: A dictionary mapping each edge to the derivations
+        that L{iter_best_trees} has found so far, and the heap of
+        candidates for the next one.
+    """
+    def __init__(self, chart, complete=False):
+        """
+        Construct a new packed forest for the given chart.
+
+        :param complete: If true, then only complete edges have trees.
+        """
+        self._chart = chart
+        self._complete = complete
+        self._num_trees = {}
+        self._alternatives = {}
+        self._best = {}
+
+    def num_trees(self, edge):
+        """
+        :return: The number of trees of C{edge}, i.e. the length of
+            the list returned by L{Chart.trees}.
+        :rtype: int
+        """
+        # Edges that are being visited have no trees, which filters
+        # out any cyclic trees.
+        if edge in self._num_trees:
+            return self._num_trees[edge]
+        if self._complete and edge.is_incomplete():
+            return 0
+        if isinstance(edge, LeafEdge):
+            self._num_trees[edge] = 1
+            return 1
+        self._num_trees[edge] = 0
+
+        total = 0
+        alternatives = []
+        for cpl in self._chart.child_pointer_lists(edge):
+            counts = [self.num_trees(child) for child in cpl]
+            product = 1
+            for count in counts: product *= count
+            if product:
+                alternatives.append((total, cpl, counts))
+                total += product
+        self._alternatives[edge] = alternatives
+        self._num_trees[edge] = total
+        return total
+
+    def tree(self, edge, index, tree_class=Tree):
+        """
+        :return: The C{index}th tree of C{edge}, in the order that
+            L{Chart.trees} returns them.
+        :raise IndexError: If C{edge} has C{index} trees or fewer.
+        """
+        if not 0 <= index < self.num_trees(edge):
+            raise IndexError('tree index out of range')
+        if isinstance(edge, LeafEdge):
+            return self._chart.leaf(edge.start())
+        alternatives = self._alternatives[edge]
+        i = bisect.bisect_right(alternatives, (index+1,)) - 1
+        (offset, cpl, counts) = alternatives[i]
+        # The first child varies fastest.
+        index -= offset
+        children = []
+        for (child, count) in zip(cpl, counts):
+            children.append(self.tree(child, index % count, tree_class))
+            index //= count
+        return self._make_tree(edge, children, tree_class)
+
+    def iter_trees(self, edge, tree_class=Tree):
+        """
+        :return: An iterator that generates the trees of C{edge}, in
+            the order that L{Chart.trees} returns them.
+        :rtype: iter of L{Tree}
+        """
+        index = 0
+        num_trees = self.num_trees(edge)
+        while index < num_trees:
+            yield self.tree(edge, index, tree_class)
+            index += 1
+
+    def iter_best_trees(self, edge, weight, tree_class=Tree):
+        """
+        :return: An iterator that generates the trees of C{edge} from
+            highest to lowest score, using the lazy k-best algorithm
+            of Huang & Chiang (2005).  The score of a tree is the
+            weight of its edge times the scores of its subtrees, and
+            leaves have a score of 1.  Trees with equal scores are
+            generated in the order that L{Chart.trees} returns them.
+        :rtype: iter of L{Tree}
+        :param weight: A function mapping each edge to a nonnegative
+            weight, such as the probability of its production.
+        """
+        for (_, _, tree) in self._iter_best(edge, weight, tree_class):
+            yield tree
+
+    def _iter_best(self, edge, weight, tree_class):
+        """
+        A helper function for L{iter_best_trees}, which generates
+        C{(-score, index, tree)} tuples, where C{index} is the tree's
+        position in the order that L{Chart.trees} returns them.
+        """
+        subtrees = {}
+        k = 0
+        while True:
+            derivation = self._kth_best(edge, k, weight)
+            if derivation is None: return
+            ((neg_score, index), _, _) = derivation
+            yield (neg_score, index,
+                   self._best_tree(edge, k, weight, tree_class, subtrees))
+            k += 1
+
+    def _make_tree(self, edge, children, tree_class):
+        tree = tree_class(edge.lhs().symbol(), children)
+        # If the edge is incomplete, then extend it with "partial trees".
+        if edge.is_incomplete():
+            tree.extend([tree_class(elt, [])
+                         for elt in edge.rhs()[edge.dot():]])
+        return tree
+
+    def _best_tree(self, edge, k, weight, tree_class, subtrees):
+        """
+        :return: The C{k}th best tree of C{edge}.  Subtrees are
+            shared between the trees that are built with the same
+            C{subtrees} dictionary.
+        """
+        if isinstance(edge, LeafEdge):
+            return self._chart.leaf(edge.start())
+        if (edge, k) not in subtrees:
+            (_, i, ranks) = self._kth_best(edge, k, weight)
+            cpl = self._alternatives[edge][i][1]
+            children = [self._best_tree(child, rank, weight, tree_class,
+                                        subtrees)
+                        for (child, rank) in zip(cpl, ranks)]
+            subtrees[edge, k] = self._make_tree(edge, children, tree_class)
+        return subtrees[edge, k]
+
+    def _kth_best(self, edge, k, weight):
+        """
+        :return: The C{k}th best derivation of C{edge}, as a tuple
+            C{((-score, index), i, ranks)}, where C{i} selects the
+            edge's alternative and C{ranks} gives the rank of each
+            child's derivation; or C{None} if there are not C{k+1}
+            derivations.
+        """
+        if isinstance(edge, LeafEdge):
+            if k == 0: return ((-1.0, 0), None, ())
+            return None
+        if edge not in self._best:
+            if not self.num_trees(edge): return None
+            candidates = []
+            for i in range(len(self._alternatives[edge])):
+                ranks = (0,) * len(self._alternatives[edge][i][1])
+                candidates.append(self._derivation(edge, i, ranks, weight))
+            heapq.heapify(candidates)
+            self._best[edge] = ([], candidates, set())
+        (derivations, candidates, seen) = self._best[edge]
+
+        while len(derivations) <= k:
+            # Add the successors of the last derivation.
+            if derivations:
+                (_, i, ranks) = derivations[-1]
+                cpl = self._alternatives[edge][i][1]
+                for j in range(len(ranks)):
+                    successor = ranks[:j] + (ranks[j]+1,) + ranks[j+1:]
+                    if (i, successor) in seen: continue
+                    seen.add((i, successor))
+                    if self._kth_best(cpl[j], successor[j], weight):
+                        heapq.heappush(candidates, self._derivation(
+                            edge, i, successor, weight))
+            if not candidates: return None
+            derivations.append(heapq.heappop(candidates))
+        return derivations[k]
+
+    def _derivation(self, edge, i, ranks, weight):
+        """
+        :return: The derivation of C{edge} that uses its C{i}th
+            alternative, and the child derivations with the given
+            ranks.  See L{_kth_best}.
+        """
+        (offset, cpl, counts) = self._alternatives[edge][i]
+        score = weight(edge)
+        index = offset
+        stride = 1
+        for (child, rank, count) in zip(cpl, ranks, counts):
+            ((neg_child_score, child_index), _, _) = \
+                self._kth_best(child, rank, weight)
+            if not isinstance(child, LeafEdge):
+                score *= -neg_child_score
+            index += child_index * stride
+            stride *= count
+        return ((-score, index), i, ranks)
+
 ########################################################################
 ##  Chart Rules
 ########################################################################
@@ -1277,13 +1741,16 @@ class ChartParser(ParserI):
         - Return any complete parses in the chart
     """
     def __init__(self, grammar, strategy=BU_LC_STRATEGY, trace=0, 
-                 trace_chart_width=50, use_agenda=True, chart_class=Chart):
+                 trace_chart_width=50, use_agenda=True, chart_class=Chart,
+                 max_edges=None):
         """
         Create a new chart parser, that uses C{grammar} to parse
         texts.
 
         :type grammar: L{ContextFreeGrammar}
-        :param grammar: The grammar used to parse texts.
+        :param grammar: The grammar used to parse texts.  The chart
+            rules are given its compiled form (see
+            L{ContextFreeGrammar.compile()}).
         :type strategy: list of L{ChartRuleI}
         :param strategy: A list of rules that should be used to decide
             what edges to add to the chart (top-down strategy by default).
@@ -1301,11 +1768,15 @@ class ChartParser(ParserI):
             if possible. 
         :param chart_class: The class that should be used to create
             the parse charts.
+        :type max_edges: int
+        :param max_edges: If specified, then L{chart_parse()} raises
+            L{ParseLimitExceeded} when the chart has more edges.
         """
         self._grammar = grammar
         self._strategy = strategy
         self._trace = trace
         self._trace_chart_width = trace_chart_width
+        self._max_edges = max_edges
         # If the strategy only consists of axioms (NUM_EDGES==0) and
         # inference rules (NUM_EDGES==1), we can use an agenda-based algorithm:
         self._use_agenda = use_agenda
@@ -1348,7 +1819,7 @@ class ChartParser(ParserI):
         tokens = list(tokens)
         self._grammar.check_coverage(tokens)
         chart = self._chart_class(tokens)
-        grammar = self._grammar
+        grammar = self._grammar.compile()
 
         # Width, for printing trace edges.
         trace_edge_width = self._trace_chart_width / (chart.num_leaves() + 1)
@@ -1373,6 +1844,7 @@ class ChartParser(ParserI):
                         new_edges = list(new_edges)
                         trace_new_edges(chart, rule, new_edges, trace, trace_edge_width)
                     agenda += new_edges
+                self._check_max_edges(chart)
         
         else:
             # Do not use an agenda-based algorithm.
@@ -1383,14 +1855,22 @@ class ChartParser(ParserI):
                     new_edges = rule.apply_everywhere(chart, grammar)
                     edges_added = len(new_edges)
                     trace_new_edges(chart, rule, new_edges, trace, trace_edge_width)
+                    self._check_max_edges(chart)
 
         # Return the final chart.
         return chart
 
+    def _check_max_edges(self, chart):
+        if self._max_edges is not None and chart.num_edges() > self._max_edges:
+            raise ParseLimitExceeded('More than %d edges' % self._max_edges)
+
     def nbest_parse(self, tokens, n=None, tree_class=Tree):
         chart = self.chart_parse(tokens)
         # Return a list of complete parses.
-        return chart.parses(self._grammar.start(), tree_class=tree_class)[:n]
+        if n is None:
+            return chart.parses(self._grammar.start(), tree_class=tree_class)
+        return list(itertools.islice(
+            chart.iter_parses(self._grammar.start(), tree_class), n))
 
 class TopDownChartParser(ChartParser):
     """
@@ -1504,7 +1984,7 @@ class SteppingChartParser(ChartParser):
         whenever the parser's strategy, grammar, or chart is modified.
         """
         chart = self._chart
-        grammar = self._grammar
+        grammar = self._grammar.compile()
         edges_added = 1
         while edges_added > 0:
             edges_added = 0
@@ -1582,7 +2062,10 @@ class SteppingChartParser(ChartParser):
             if e is None: break
             
         # Return a list of complete parses.
-        return self.parses(tree_class=tree_class)[:n]
+        if n is None:
+            return self.parses(tree_class=tree_class)
+        return list(itertools.islice(
+            self._chart.iter_parses(self._grammar.start(), tree_class), n))
 
 ########################################################################
 ##  Demo Code
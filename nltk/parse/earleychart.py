@@ -28,13 +28,19 @@ The main parser class is L{EarleyChartParser}, which is a top-down
 algorithm, originally formulated by Jay Earley (1970).
 """
 
+from nltk.internals import overridden
+from nltk.grammar import is_nonterminal
+from nltk.tree import Tree
+
 from nltk.parse.chart import (Chart, ChartParser, EdgeI, LeafEdge, LeafInitRule,
                               BottomUpPredictRule, BottomUpPredictCombineRule,
-                              TopDownInitRule, SingleEdgeFundamentalRule,
+                              TopDownInitRule, TopDownPredictRule,
+                              SingleEdgeFundamentalRule,
                               EmptyPredictRule,
                               CachedTopDownPredictRule,
                               FilteredSingleEdgeFundamentalRule,
                               FilteredBottomUpPredictCombineRule)
+from nltk.featstruct import FeatStruct
 from nltk.parse.featurechart import (FeatureChart, FeatureChartParser,
                                      FeatureTopDownInitRule,
                                      FeatureTopDownPredictRule,
@@ -54,6 +60,8 @@ class IncrementalChart(Chart):
         
         # The set of child pointer lists associated with each edge.
         self._edge_to_cpls = {}
+        self._cpl_cache = {}
+        self._unpacked = overridden(self.insert)
         
         # Indexes mapping attribute values to lists of edges 
         # (used by select()).
@@ -111,8 +119,65 @@ class IncrementalChart(Chart):
     def _positions(self):
         return xrange(self.num_leaves() + 1)    
 
+    def append_leaf(self, leaf):
+        """
+        Extend the chart's sentence with C{leaf}, adding an empty
+        position for the edges that end after it.  The corresponding
+        L{LeafEdge} is not inserted.
+
+        :return: The index of the new leaf.
+        """
+        self._tokens += (leaf,)
+        self._num_leaves += 1
+        self._edgelists += ([],)
+        for restr_keys in self._indexes:
+            self._indexes[restr_keys] += ({},)
+        return self._num_leaves - 1
+
+    def truncate(self, num_leaves):
+        """
+        Shorten the chart's sentence to its first C{num_leaves}
+        leaves, removing every edge that ends after them.  Since the
+        edges that end at or before C{num_leaves} can only be built
+        from each other, the remaining chart is the same as before
+        the later leaves were appended (provided that the inference
+        rules do not look ahead at later leaves).
+        """
+        if not 0 <= num_leaves <= self._num_leaves:
+            raise ValueError('Bad number of leaves: %r' % num_leaves)
+        removed = set(edge for edgelist in self._edgelists[num_leaves+1:]
+                      for edge in edgelist)
+        for edge in removed:
+            del self._edge_to_cpls[edge]
+        for key in [key for key in self._cpl_cache if key[0] in removed]:
+            del self._cpl_cache[key]
+
+        self._tokens = self._tokens[:num_leaves]
+        self._num_leaves = num_leaves
+        self._edgelists = self._edgelists[:num_leaves+1]
+        for restr_keys in self._indexes:
+            self._indexes[restr_keys] = self._indexes[restr_keys][:num_leaves+1]
+
 
 class FeatureIncrementalChart(IncrementalChart, FeatureChart):
+    def initialize(self):
+        IncrementalChart.initialize(self)
+        self._initialize_feature_index()
+
+    def truncate(self, num_leaves):
+        edgelists = self._edgelists[num_leaves+1:]
+        for index in self._indexes.values():
+            for this_index in index[num_leaves+1:]:
+                for edges in this_index.values():
+                    self._feature_indexes.pop(id(edges), None)
+        IncrementalChart.truncate(self, num_leaves)
+        # The atomic features are indexed by edge id, so they must be
+        # forgotten together with the edges.
+        for edgelist in edgelists:
+            for edge in edgelist:
+                for edge_features in self._atomic_features.values():
+                    edge_features.pop(id(edge), None)
+
     def select(self, end, **restrictions):
         edgelist = self._edgelists[end]
         
@@ -130,7 +195,8 @@ class FeatureIncrementalChart(IncrementalChart, FeatureChart):
                 
         vals = tuple(self._get_type_if_possible(restrictions[key]) 
                      for key in restr_keys)
-        return iter(self._indexes[restr_keys][end].get(vals, []))
+        edges = self._indexes[restr_keys][end].get(vals, [])
+        return self._select_compatible(edges, restrictions)
     
     def _add_index(self, restr_keys):
         # Make sure it's a valid index.
@@ -154,7 +220,9 @@ class FeatureIncrementalChart(IncrementalChart, FeatureChart):
         for (restr_keys, index) in self._indexes.items():
             vals = tuple(self._get_type_if_possible(getattr(edge, key)())
                          for key in restr_keys)
-            index[end].setdefault(vals, []).append(edge)
+            edges = index[end].setdefault(vals, [])
+            edges.append(edge)
+            self._register_with_feature_indexes(edges, edge)
 
 #////////////////////////////////////////////////////////////
 # Incremental CFG Rules
@@ -209,7 +277,7 @@ class FeatureCompleteFundamentalRule(FeatureSingleEdgeFundamentalRule):
         # empty complete edges here.
         for right_edge in chart.select(start=end, end=end, 
                                        is_complete=True,
-                                       lhs=left_edge.next()):
+                                       lhs=left_edge.next_with_bindings()):
             for new_edge in fr.apply_iter(chart, grammar, left_edge, right_edge):
                 yield new_edge
 
@@ -222,6 +290,18 @@ class FeatureScannerRule(ScannerRule):
 class FeaturePredictorRule(FeatureTopDownPredictRule): 
     pass
 
+class FeaturePrefixPredictorRule(FeatureTopDownPredictRule):
+    """
+    A version of L{FeatureTopDownPredictRule} for parsing prefixes
+    (see L{IncrementalChartParser.feed()}).  It does not look ahead
+    at the next token, which is not known yet; and it does not cache
+    its predictions, since the chart can be truncated.
+    """
+    def apply_iter(self, chart, grammar, edge):
+        if edge.is_complete() or not is_nonterminal(edge.next()): return
+        for new_edge in self._predict(chart, grammar, edge, lookahead=False):
+            yield new_edge
+
 #////////////////////////////////////////////////////////////
 # Incremental CFG Chart Parsers
 #////////////////////////////////////////////////////////////
@@ -248,6 +328,14 @@ LC_INCREMENTAL_STRATEGY = [LeafInitRule(),
                            FilteredBottomUpPredictCombineRule(),
                            FilteredCompleteFundamentalRule()]
 
+# The strategy for parsing prefixes (see IncrementalChartParser.feed()).
+# The leaf edges are inserted as the tokens are fed, and the predictions
+# can't be filtered by the next token, since it is not known yet.
+PREFIX_STRATEGY = [TopDownInitRule(), 
+                   CompleterRule(), 
+                   ScannerRule(),
+                   TopDownPredictRule()]
+
 class IncrementalChartParser(ChartParser):
     """
     An I{incremental} chart parser implementing Jay Earley's 
@@ -264,10 +352,22 @@ class IncrementalChartParser(ChartParser):
             - If I{edge} is complete:
                 - Apply CompleterRule to I{edge}
         - Return any complete parses in the chart
+
+    The parser can also parse a sentence as it is being typed: 
+    L{initialize()} starts a new prefix, L{feed()} extends it with
+    one token, and L{rollback()} returns to an earlier prefix.  The
+    chart is kept between these calls, so that feeding a token only
+    adds the edges that end after it.  L{next_symbols()} returns the
+    terminals and nonterminals that can follow the current prefix.
+    Prefixes are always parsed top-down, with L{PREFIX_STRATEGY},
+    since the set of symbols that can follow a prefix is given by
+    the top-down predictions.
     """
+    _prefix_strategy = PREFIX_STRATEGY
+
     def __init__(self, grammar, strategy=BU_LC_INCREMENTAL_STRATEGY,
                  trace=0, trace_chart_width=50, 
-                 chart_class=IncrementalChart): 
+                 chart_class=IncrementalChart, max_edges=None): 
         """
         Create a new Earley chart parser, that uses C{grammar} to
         parse texts.
@@ -285,11 +385,17 @@ class IncrementalChartParser(ChartParser):
             be used to display edges. 
         :param chart_class: The class that should be used to create
             the charts used by this parser.
+        :type max_edges: int
+        :param max_edges: If specified, then L{chart_parse()} raises
+            L{ParseLimitExceeded <nltk.parse.api.ParseLimitExceeded>}
+            when the chart has more edges.
         """
         self._grammar = grammar
         self._trace = trace
         self._trace_chart_width = trace_chart_width
         self._chart_class = chart_class
+        self._max_edges = max_edges
+        self._prefix_chart = None
         
         self._axioms = []
         self._inference_rules = []
@@ -309,7 +415,7 @@ class IncrementalChartParser(ChartParser):
         tokens = list(tokens)
         self._grammar.check_coverage(tokens)
         chart = self._chart_class(tokens)
-        grammar = self._grammar
+        grammar = self._grammar.compile()
 
         # Width, for printing trace edges.
         trace_edge_width = self._trace_chart_width / (chart.num_leaves() + 1)
@@ -319,23 +425,125 @@ class IncrementalChartParser(ChartParser):
             new_edges = axiom.apply(chart, grammar)
             trace_new_edges(chart, axiom, new_edges, trace, trace_edge_width)
 
-        inference_rules = self._inference_rules
         for end in range(chart.num_leaves()+1):
-            if trace > 1: print "\n* Processing queue:", end, "\n"
-            agenda = list(chart.select(end=end))
-            while agenda:
-                edge = agenda.pop()
-                for rule in inference_rules:
-                    new_edges = rule.apply_iter(chart, grammar, edge)
-                    if trace:
-                        new_edges = list(new_edges)
-                        trace_new_edges(chart, rule, new_edges, trace, trace_edge_width)
-                    for new_edge in new_edges:
-                        if new_edge.end()==end:
-                            agenda.append(new_edge)
+            self._process_position(chart, grammar, self._inference_rules, 
+                                   end, trace, trace_edge_width)
 
         return chart
 
+    def _process_position(self, chart, grammar, inference_rules, end,
+                          trace, trace_edge_width):
+        """
+        Apply the inference rules to the edges that end at C{end},
+        until no more edges can be added there.
+        """
+        trace_new_edges = self._trace_new_edges
+        if trace > 1: print "\n* Processing queue:", end, "\n"
+        agenda = list(chart.select(end=end))
+        while agenda:
+            edge = agenda.pop()
+            for rule in inference_rules:
+                new_edges = rule.apply_iter(chart, grammar, edge)
+                if trace:
+                    new_edges = list(new_edges)
+                    trace_new_edges(chart, rule, new_edges, trace, trace_edge_width)
+                for new_edge in new_edges:
+                    if new_edge.end()==end:
+                        agenda.append(new_edge)
+            self._check_max_edges(chart)
+
+    #////////////////////////////////////////////////////////////
+    # Prefix Parsing
+    #////////////////////////////////////////////////////////////
+
+    def initialize(self, tokens=()):
+        """
+        Begin parsing a new prefix, consisting of C{tokens}.
+
+        :raise ValueError: If the grammar does not cover some of the
+            tokens.
+        """
+        tokens = list(tokens)
+        self._grammar.check_coverage(tokens)
+        chart = self._prefix_chart = self._chart_class([])
+        grammar = self._grammar.compile()
+        trace = self._trace
+        trace_edge_width = self._trace_chart_width
+
+        self._prefix_rules = []
+        for rule in self._prefix_strategy:
+            if rule.NUM_EDGES == 0:
+                new_edges = rule.apply(chart, grammar)
+                self._trace_new_edges(chart, rule, new_edges, trace, 
+                                      trace_edge_width)
+            else:
+                self._prefix_rules.append(rule)
+        self._process_position(chart, grammar, self._prefix_rules, 0, 
+                               trace, trace_edge_width)
+
+        for token in tokens:
+            self.feed(token)
+
+    def feed(self, token):
+        """
+        Extend the current prefix with C{token}.  Only the edges that
+        end after C{token} are added to the chart; the rest of the
+        chart is kept from the previous calls.
+
+        :return: The set of symbols that can follow the extended
+            prefix (see L{next_symbols()}).
+        :raise ValueError: If the grammar does not cover C{token}.
+        """
+        chart = self._get_prefix_chart()
+        self._grammar.check_coverage([token])
+        index = chart.append_leaf(token)
+        chart.insert(LeafEdge(token, index), ())
+        self._process_position(chart, self._grammar.compile(), 
+                               self._prefix_rules, index+1, self._trace,
+                               self._trace_chart_width / (index+2))
+        return self.next_symbols()
+
+    def rollback(self, num_tokens):
+        """
+        Return to the prefix consisting of the first C{num_tokens}
+        tokens of the current prefix.  The edges that end after them
+        are removed from the chart, and the rest is kept.
+        """
+        self._get_prefix_chart().truncate(num_tokens)
+
+    def next_symbols(self):
+        """
+        :return: The set of terminals and nonterminals that can follow
+            the current prefix, in a sentence of the grammar.  If the
+            set is empty, then the prefix is either a complete
+            sentence that can not be extended, or not the beginning of
+            any sentence.
+        :rtype: set
+        """
+        return set(edge.next() for edge in self._next_edges())
+
+    def _next_edges(self):
+        chart = self._get_prefix_chart()
+        return chart.select(end=chart.num_leaves(), is_complete=False)
+
+    def _get_prefix_chart(self):
+        if self._prefix_chart is None:
+            raise ValueError, 'Parser must be initialized first'
+        return self._prefix_chart
+
+    def prefix(self):
+        ":return: The tokens of the current prefix."
+        return self._get_prefix_chart().leaves()
+
+    def chart(self):
+        ":return: The chart of the current prefix."
+        return self._get_prefix_chart()
+
+    def parses(self, tree_class=Tree):
+        ":return: The parse trees of the current prefix, as a sentence."
+        return self._get_prefix_chart().parses(self._grammar.start(), 
+                                               tree_class)
+
 class EarleyChartParser(IncrementalChartParser):
     def __init__(self, grammar, **parser_args):
         IncrementalChartParser.__init__(self, grammar, EARLEY_STRATEGY, **parser_args)
@@ -381,8 +589,14 @@ BU_LC_INCREMENTAL_FEATURE_STRATEGY = [LeafInitRule(),
                                       FeatureEmptyPredictRule(),
                                       FeatureBottomUpPredictCombineRule(),
                                       FeatureCompleteFundamentalRule()]
+FEATURE_PREFIX_STRATEGY = [FeatureTopDownInitRule(), 
+                           FeatureCompleterRule(), 
+                           FeatureScannerRule(),
+                           FeaturePrefixPredictorRule()]
 
 class FeatureIncrementalChartParser(IncrementalChartParser, FeatureChartParser):
+    _prefix_strategy = FEATURE_PREFIX_STRATEGY
+
     def __init__(self, grammar, 
                  strategy=BU_LC_INCREMENTAL_FEATURE_STRATEGY,
                  trace_chart_width=20, 
@@ -394,6 +608,22 @@ class FeatureIncrementalChartParser(IncrementalChartParser, FeatureChartParser):
                                         chart_class=chart_class,
                                         **parser_args)
 
+    def chart_parse(self, tokens, trace=None):
+        if trace is None: trace = self._trace
+        chart = IncrementalChartParser.chart_parse(self, tokens, trace)
+        self._trace_feature_index(chart, trace)
+        return chart
+
+    def next_symbols(self):
+        # The nonterminals are instantiated with the edges' bindings.
+        symbols = set()
+        for edge in self._next_edges():
+            symbol = edge.next_with_bindings()
+            if isinstance(symbol, FeatStruct):
+                symbol.freeze()
+            symbols.add(symbol)
+        return symbols
+
 class FeatureEarleyChartParser(FeatureIncrementalChartParser):
     def __init__(self, grammar, **parser_args):
         FeatureIncrementalChartParser.__init__(self, grammar, EARLEY_FEATURE_STRATEGY, **parser_args)
@@ -16,7 +16,8 @@ feature structures as nodes.
 
 from collections import defaultdict
 
-from nltk.featstruct import FeatStruct, unify, FeatStructParser, TYPE, find_variables
+from nltk.featstruct import (FeatStruct, FeatDict, unify, FeatStructParser,
+                             TYPE, find_variables, UnificationFailure)
 from nltk.sem import logic
 from nltk.tree import Tree
 from nltk.grammar import (Nonterminal, Production, ContextFreeGrammar,
@@ -100,7 +101,8 @@ class FeatureTreeEdge(TreeEdge):
                                dot=self._dot+1, bindings=bindings)
 
     def _bind(self, nt, bindings):
-        if not isinstance(nt, FeatStructNonterminal): return nt
+        if not isinstance(nt, FeatStructNonterminal) or not bindings:
+            return nt
         return nt.substitute_bindings(bindings)
 
     def next_with_bindings(self):
@@ -147,19 +149,115 @@ class FeatureTreeEdge(TreeEdge):
 # A specialized Chart for feature grammars
 #////////////////////////////////////////////////////////////
 
+#: The types of feature value that are compared by L{atomic_features()}.
+_ATOMIC_VALUE_TYPES = (basestring, int, long)
+
+def atomic_features(nt, bindings=None, depth=2):
+    """
+    :return: A dictionary mapping feature paths to the atomic values
+        that C{nt} assigns them, for paths of at most C{depth} plain
+        (string) feature names.  Two nonterminals that assign
+        different atomic values to the same path can not be unified.
+        If C{nt} is not a feature structure, an empty dictionary is
+        returned.
+
+        >>> from nltk.grammar import FeatStructNonterminal
+        >>> nt = FeatStructNonterminal('NP[NUM=?n, AGR=[PER=3], CASE=acc]')
+        >>> sorted(atomic_features(nt).items())
+        [(('AGR', 'PER'), 3), (('CASE',), 'acc')]
+        >>> sorted(atomic_features(nt, {logic.Variable('?n'): 'sg'}).items())
+        [(('AGR', 'PER'), 3), (('CASE',), 'acc'), (('NUM',), 'sg')]
+
+    :param bindings: Variable bindings, which are used to find the
+        values of bound variables.
+    """
+    features = {}
+    if isinstance(nt, FeatDict):
+        _add_atomic_features(nt, bindings or {}, (), depth, features)
+    return features
+
+def _add_atomic_features(fstruct, bindings, path, depth, features):
+    for (fname, fval) in fstruct.items():
+        # Feature objects (such as TYPE) can define their own
+        # unification, so only plain feature names are compared.
+        if not isinstance(fname, basestring): continue
+        while isinstance(fval, logic.Variable) and fval in bindings:
+            fval = bindings[fval]
+        if isinstance(fval, _ATOMIC_VALUE_TYPES):
+            features[path+(fname,)] = fval
+        elif isinstance(fval, FeatDict) and depth > 1:
+            _add_atomic_features(fval, bindings, path+(fname,),
+                                 depth-1, features)
+
 # TODO: subsumes check when adding new edges
 
 class FeatureChart(Chart):
     """
     A Chart for feature grammars.
     :see: L{Chart} for more information.
+
+    Edges are indexed by the C{TYPE} (category) of their C{lhs} and
+    C{next} nonterminals.  In addition, the atomic feature values of
+    each edge's C{lhs} and C{next} nonterminals are computed once
+    (see L{atomic_features()}).  When L{select()} is given an C{lhs}
+    or C{next} restriction with atomic feature values, it looks the
+    edges up in a second-level index on one of those values, and
+    skips the remaining edges whose values conflict with the
+    restriction.
+
+    All unification done by the feature chart rules goes through
+    L{unify()}, so a subclass can override it to select a different
+    unification algorithm.
     """
+    def initialize(self):
+        Chart.initialize(self)
+        self._initialize_feature_index()
+
+    def _initialize_feature_index(self):
+        # Maps each restriction key ('lhs' or 'next') to a dictionary
+        # from edge ids to the atomic features of that nonterminal.
+        self._atomic_features = {'lhs': {}, 'next': {}}
+
+        # Maps the id of each list of edges in self._indexes to a pair
+        # (edges, value_indexes); value_indexes maps (key, path) to a
+        # dictionary from atomic values to the edges whose value for
+        # that path is compatible with it.  The entry for None holds
+        # the edges that have no value for the path.
+        self._feature_indexes = {}
+
+        # The number of edges that select() found by category for a
+        # restriction with atomic features, and the number of those
+        # that it skipped because their features conflict.
+        self._num_feature_candidates = 0
+        self._num_feature_skips = 0
+
+        # Memoized unification results for this chart (see unify()).
+        self._unify_memo = {}
+
+    def unify(self, fstruct1, fstruct2, bindings=None, rename_vars=True,
+              memoize=False):
+        """
+        Unify C{fstruct1} with C{fstruct2}, using L{nltk.featstruct.unify}.
+
+        :param memoize: If true, then look the result up in (and add it
+            to) a memo that is kept for the lifetime of this chart.
+            See L{nltk.featstruct.unify} for when the memo can be used.
+        """
+        if memoize: memo = self._unify_memo
+        else: memo = None
+        return unify(fstruct1, fstruct2, bindings, rename_vars=rename_vars,
+                     memo=memo)
 
     def select(self, **restrictions):
         """
         Returns an iterator over the edges in this chart. 
         See L{Chart.select} for more information about the
         C{restrictions} on the edges.
+
+        Feature structure values for C{lhs} and C{next} only need to
+        have the same C{TYPE} as the edges' values; but edges whose
+        values have conflicting atomic feature values (which would make
+        unification fail) are skipped.
         """
         # If there are no restrictions, then return all edges.
         if restrictions=={}: return iter(self._edges)
@@ -175,7 +273,122 @@ class FeatureChart(Chart):
                 
         vals = tuple(self._get_type_if_possible(restrictions[key]) 
                      for key in restr_keys)
-        return iter(self._indexes[restr_keys].get(vals, []))
+        edges = self._indexes[restr_keys].get(vals, [])
+        return self._select_compatible(edges, restrictions)
+
+    def _select_compatible(self, edges, restrictions):
+        """
+        A helper function for L{select}, which returns an iterator
+        over the given edges (all of which match the restrictions'
+        categories), skipping any edge whose C{lhs} or C{next}
+        nonterminal has atomic feature values that conflict with
+        those of the corresponding restriction.  The edges are looked
+        up by the restriction's value for one feature path; only the
+        remaining paths are checked edge by edge.
+        """
+        checks = []
+        for key in ('lhs', 'next'):
+            features = atomic_features(restrictions.get(key))
+            if features:
+                checks.append((key, sorted(features.items())))
+        if not checks or not edges: return iter(edges)
+
+        (key, features) = checks[0]
+        (path, fval) = features[0]
+        index = self._feature_index(edges, key, path)
+        try:
+            compatible = index[fval]
+        except KeyError:
+            # No edge has this value yet; edges that are added later
+            # will be registered with the new entry.
+            compatible = index[fval] = list(index[None])
+        self._num_feature_candidates += len(edges)
+        self._num_feature_skips += len(edges) - len(compatible)
+
+        checks[0] = (key, features[1:])
+        checks = [(key, features) for (key, features) in checks if features]
+        if not checks: return iter(compatible)
+        return self._iter_compatible(compatible, checks)
+
+    def _iter_compatible(self, edges, checks):
+        for edge in edges:
+            for (key, features) in checks:
+                edge_fvals = self._edge_atomic_features(edge, key)
+                for (path, fval) in features:
+                    edge_fval = edge_fvals.get(path)
+                    if edge_fval is not None and edge_fval != fval: break
+                else:
+                    continue
+                self._num_feature_skips += 1
+                break
+            else:
+                yield edge
+
+    def _edge_atomic_features(self, edge, key):
+        """
+        :return: The atomic features of C{edge}'s C{key} ('lhs' or
+            'next') nonterminal, computed once per edge.
+        """
+        edge_features = self._atomic_features[key]
+        try:
+            return edge_features[id(edge)]
+        except KeyError:
+            fvals = edge_features[id(edge)] = atomic_features(
+                getattr(edge, key)(), getattr(edge, '_bindings', None))
+            return fvals
+
+    def _feature_index(self, edges, key, path):
+        """
+        :return: The index of the list C{edges} (from C{self._indexes})
+            on the atomic value of C{path} in the edges' C{key}
+            nonterminals, creating it if necessary.
+        """
+        try:
+            value_indexes = self._feature_indexes[id(edges)][1]
+        except KeyError:
+            value_indexes = {}
+            # Keep a reference to edges, so its id is not reused.
+            self._feature_indexes[id(edges)] = (edges, value_indexes)
+        try:
+            return value_indexes[key, path]
+        except KeyError:
+            index = value_indexes[key, path] = {None: []}
+            for edge in edges:
+                self._add_to_feature_index(index, edge, key, path)
+            return index
+
+    def _add_to_feature_index(self, index, edge, key, path):
+        fval = self._edge_atomic_features(edge, key).get(path)
+        if fval is None:
+            # The edge is compatible with every value.
+            for compatible in index.values():
+                compatible.append(edge)
+        elif fval in index:
+            index[fval].append(edge)
+        else:
+            index[fval] = index[None] + [edge]
+
+    def _register_with_feature_indexes(self, edges, edge):
+        """
+        A helper function for L{_register_with_indexes}, which
+        registers C{edge}, which has just been added to the list
+        C{edges}, with that list's feature indexes.
+        """
+        if id(edges) in self._feature_indexes:
+            value_indexes = self._feature_indexes[id(edges)][1]
+            for ((key, path), index) in value_indexes.items():
+                self._add_to_feature_index(index, edge, key, path)
+
+    def feature_index_skips(self):
+        """
+        :return: A pair C{(skipped, candidates)}, where C{candidates}
+            is the number of edges that L{select()} has found by
+            category for C{lhs} or C{next} restrictions with atomic
+            feature values, and C{skipped} is the number of those
+            edges that it skipped, without unification, because their
+            atomic feature values conflict.
+        """
+        return (self._num_feature_skips, self._num_feature_candidates)
     
     def _add_index(self, restr_keys):
         """
@@ -204,7 +417,9 @@ class FeatureChart(Chart):
         for (restr_keys, index) in self._indexes.items():
             vals = tuple(self._get_type_if_possible(getattr(edge, key)())
                          for key in restr_keys)
-            index.setdefault(vals, []).append(edge)
+            edges = index.setdefault(vals, [])
+            edges.append(edge)
+            self._register_with_feature_indexes(edges, edge)
 
     def _get_type_if_possible(self, item):
         """
@@ -216,14 +431,11 @@ class FeatureChart(Chart):
         else:
             return item
 
-    def parses(self, start, tree_class=Tree):
-        trees = []
-        for edge in self.select(start=0, end=self._num_leaves):
-            if ( (isinstance(edge, FeatureTreeEdge)) and
-                 (edge.lhs()[TYPE] == start[TYPE]) and
-                 (unify(edge.lhs(), start, rename_vars=True)) ):
-                trees += self.trees(edge, complete=True, tree_class=tree_class)
-        return trees
+    def _parse_edges(self, start):
+        return [edge for edge in self.select(start=0, end=self._num_leaves)
+                if ( (isinstance(edge, FeatureTreeEdge)) and
+                     (edge.lhs()[TYPE] == start[TYPE]) and
+                     (self.unify(edge.lhs(), start, rename_vars=True)) )]
 
 
 #////////////////////////////////////////////////////////////
@@ -266,7 +478,7 @@ class FeatureFundamentalRule(FundamentalRule):
             found = found.rename_variables(used_vars=left_edge.variables())
             # Unify B1 (left_edge.next) with B2 (right_edge.lhs) to
             # generate B3 (result).
-            result = unify(next, found, bindings, rename_vars=False)
+            result = chart.unify(next, found, bindings, rename_vars=False)
             if result is None: return
         else:
             if next != found: return
@@ -301,7 +513,7 @@ class FeatureSingleEdgeFundamentalRule(SingleEdgeFundamentalRule):
         fr = self._fundamental_rule
         for right_edge in chart.select(start=left_edge.end(), 
                                        is_complete=True,
-                                       lhs=left_edge.next()):
+                                       lhs=left_edge.next_with_bindings()):
             for new_edge in fr.apply_iter(chart, grammar, left_edge, right_edge):
                 yield new_edge
 
@@ -330,6 +542,9 @@ class FeatureTopDownPredictRule(CachedTopDownPredictRule):
         - [B2 S{->} * S{gamma}][j:j]
     for each grammar production C{B2 S{->} S{gamma}}, assuming that B1
     and B2 can be unified.
+
+    The results of unifying B1 and B2 are memoized for the lifetime
+    of the chart (see L{FeatureChart.unify()}).
     """
     def apply_iter(self, chart, grammar, edge):
         if edge.is_complete(): return
@@ -341,11 +556,29 @@ class FeatureTopDownPredictRule(CachedTopDownPredictRule):
         # just return (no new edges to add).
         done = self._done.get((next, index), (None,None))
         if done[0] is chart and done[1] is grammar: return
+
+        for new_edge in self._predict(chart, grammar, edge, lookahead=True):
+            yield new_edge
         
+        # Record the fact that we've applied this rule.
+        self._done[next, index] = (chart, grammar)
+
+    def _predict(self, chart, grammar, edge, lookahead):
+        """
+        A helper function for L{apply_iter}, which inserts the edges
+        predicted by the incomplete C{edge}.  If C{lookahead} is true,
+        then productions whose left corner is a terminal are only
+        predicted if it matches the next token.
+        """
+        index = edge.end()
+        next_with_bindings = edge.next_with_bindings()
+        if isinstance(next_with_bindings, FeatStruct):
+            next_with_bindings.freeze()
+
         for prod in grammar.productions(lhs=edge.next()):
             # If the left corner in the predicted production is 
             # leaf, it must match with the input.
-            if prod.rhs():
+            if lookahead and prod.rhs():
                 first = prod.rhs()[0]
                 if is_terminal(first):
                     if index >= chart.num_leaves(): continue
@@ -353,13 +586,11 @@ class FeatureTopDownPredictRule(CachedTopDownPredictRule):
             
             # We rename vars here, because we don't want variables
             # from the two different productions to match.
-            if unify(prod.lhs(), edge.next_with_bindings(), rename_vars=True):
-                new_edge = FeatureTreeEdge.from_production(prod, edge.end())
+            if chart.unify(prod.lhs(), next_with_bindings, rename_vars=True,
+                           memoize=True):
+                new_edge = FeatureTreeEdge.from_production(prod, index)
                 if chart.insert(new_edge, ()):
                     yield new_edge
-        
-        # Record the fact that we've applied this rule.
-        self._done[next, index] = (chart, grammar)
 
 
 #////////////////////////////////////////////////////////////
@@ -394,7 +625,8 @@ class FeatureBottomUpPredictCombineRule(BottomUpPredictCombineRule):
                                            fs_class=FeatStruct)
                 found = found.rename_variables(used_vars=used_vars)
                 
-                result = unify(next, found, bindings, rename_vars=False)
+                result = chart.unify(next, found, bindings,
+                                     rename_vars=False)
                 if result is None: continue
             
             new_edge = (FeatureTreeEdge.from_production(prod, edge.start())
@@ -440,6 +672,19 @@ class FeatureChartParser(ChartParser):
                              chart_class=chart_class, 
                              **parser_args)
 
+    def chart_parse(self, tokens, trace=None):
+        if trace is None: trace = self._trace
+        chart = ChartParser.chart_parse(self, tokens, trace)
+        self._trace_feature_index(chart, trace)
+        return chart
+
+    def _trace_feature_index(self, chart, trace):
+        if trace > 1 and isinstance(chart, FeatureChart):
+            skipped, candidates = chart.feature_index_skips()
+            print ('Feature index: skipped %d of %d candidate edges '
+                   '(%.0f%%) without unification' %
+                   (skipped, candidates, 100.0*skipped/max(candidates, 1)))
+
 class FeatureTopDownChartParser(FeatureChartParser):
     def __init__(self, grammar, **parser_args):
         FeatureChartParser.__init__(self, grammar, TD_FEATURE_STRATEGY, **parser_args)
@@ -569,6 +814,65 @@ def run_profile():
     p.strip_dirs().sort_stats('time', 'cum').print_stats(60)
     p.strip_dirs().sort_stats('cum', 'time').print_stats(60)
 
+class _CopyingUnifyFeatureChart(FeatureChart):
+    """
+    A L{FeatureChart} that uses the basic (copying) unification
+    algorithm, as earlier versions did; used by L{benchmark()}.
+    """
+    def unify(self, fstruct1, fstruct2, bindings=None, rename_vars=True,
+              memoize=False):
+        # Giving a failure function selects the copying algorithm.
+        return unify(fstruct1, fstruct2, bindings, rename_vars=rename_vars,
+                     fail=lambda fval1, fval2, path: UnificationFailure)
+
+_BENCHMARK_CHART_CLASSES = {'quasi': FeatureChart,
+                            'copying': _CopyingUnifyFeatureChart}
+
+def benchmark(num_pps=(1, 3, 5), repeat=3, algorithms=('quasi', 'copying')):
+    """
+    Time the feature chart parsers on C{demo_grammar()}, using
+    sentences of increasing length, built by adding prepositional
+    phrases to the demo sentence; and compare the unification
+    algorithms used by the parsers' charts.
+
+    :param num_pps: The numbers of prepositional phrases to add.
+    :param repeat: The number of times to parse each sentence; the
+        fastest time is reported.
+    :param algorithms: The unification algorithms to compare:
+        C{'quasi'} for the quasi-destructive algorithm, and
+        C{'copying'} for the basic (copying) algorithm.
+    """
+    import gc, time
+    chart_classes = [_BENCHMARK_CHART_CLASSES[alg] for alg in algorithms]
+
+    grammar = demo_grammar()
+    parsers = [FeatureChartParser, FeatureTopDownChartParser,
+               FeatureBottomUpChartParser,
+               FeatureBottomUpLeftCornerChartParser]
+
+    header = ''.join('%16s' % ('%s (secs)' % alg.capitalize())
+                     for alg in algorithms)
+    print 'Words                          Parser | # Parses' + header
+    print '-'*38 + '+' + '-'*(9+len(header))
+    for n in num_pps:
+        tokens = ('I saw John' + ' with a dog'*n).split()
+        for parser_class in parsers:
+            times = []
+            for chart_class in chart_classes:
+                best = None
+                for i in range(repeat):
+                    parser = parser_class(grammar, chart_class=chart_class)
+                    gc.collect()
+                    t = time.clock()
+                    chart = parser.chart_parse(tokens)
+                    num_parses = chart.num_parses(grammar.start())
+                    t = time.clock() - t
+                    if best is None or t < best: best = t
+                times.append(best)
+            print '%5d %31s |%9d%s' % (
+                len(tokens), parser_class.__name__, num_parses,
+                ''.join('%16.4f' % t for t in times))
+
 if __name__ == '__main__':
     from nltk.data import load
     demo()
@@ -9,6 +9,11 @@
 
 import math
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nltk.grammar import parse_dependency_grammar
 
 from dependencygraph import DependencyGraph, conll_data2
@@ -65,6 +70,11 @@ class DependencyScorerI(object):
         When used in conjunction with a MaxEntClassifier, each score would 
         correspond to the confidence of a particular edge being classified 
         with the positive training examples.
+
+        Scorers that compute the scores of all the arcs at once may
+        instead return them as a two-dimensional C{numpy} array, where
+        C{scores[0, 1]} is the score of the arc from node 0 to node 1,
+        and arcs that are not allowed are scored C{-inf}.
         """
         raise AssertionError('DependencyScorerI is an abstract interface')
 
@@ -135,26 +145,15 @@ class NaiveBayesDependencyScorer(DependencyScorerI):
         :return: Edge scores for the graph parameter.
         """
         # Convert graph to feature representation
-        edges = []
-        for i in range(len(graph.nodelist)):
-            for j in range(len(graph.nodelist)):
-                head_node = graph.get_by_address(i)
-                child_node = graph.get_by_address(j)
-                print head_node
-                print child_node
-                edges.append((dict(a=head_node['word'],b=head_node['tag'],c=child_node['word'],d=child_node['tag'])))
-        # Score edges
-        edge_scores = []
-        row = []
-        count = 0
-        for pdist in self.classifier.batch_prob_classify(edges):
-            print '%.4f %.4f' % (pdist.prob('T'), pdist.prob('F'))
-            row.append([math.log(pdist.prob("T"))])
-            count += 1
-            if count == len(graph.nodelist):
-                edge_scores.append(row)
-                row = []
-                count = 0
+        nodes = [graph.get_by_address(i) for i in range(len(graph.nodelist))]
+        edges = [dict(a=head_node['word'],b=head_node['tag'],
+                      c=child_node['word'],d=child_node['tag'])
+                 for head_node in nodes for child_node in nodes]
+        # Score all edges with a single call to the classifier
+        pdists = self.classifier.batch_prob_classify(edges)
+        scores = [[math.log(pdist.prob("T"))] for pdist in pdists]
+        edge_scores = [scores[i:i+len(nodes)]
+                       for i in range(0, len(scores), len(nodes))]
         return edge_scores              
 
 
@@ -174,6 +173,141 @@ class DemoScorer:
                 [[], [10], [],   [5]],
                 [[], [8],  [8],  []]]
 
+#################################################################
+# Maximum Spanning Trees
+#################################################################
+
+def maximum_spanning_tree(scores):
+    """
+    Find the maximum spanning tree of a weighted directed graph, which
+    is rooted at node 0, using the Chu-Liu-Edmonds algorithm in the
+    form given by Tarjan (1977).  Starting from each node in turn, the
+    best incoming arcs are followed until they reach a node of the
+    tree built so far; when they form a cycle instead, the cycle is
+    contracted into a new node, whose incoming and outgoing arc scores
+    are computed with a few array operations.  Since each node is
+    contracted at most once, this takes O(M{n}^2) time for a graph of
+    M{n} nodes.  This requires C{numpy}.
+
+        >>> maximum_spanning_tree([[0, 5,  1,  1],
+        ...                        [0, 0,  11, 4],
+        ...                        [0, 10, 0,  5],
+        ...                        [0, 8,  8,  0]])
+        [None, 0, 1, 2]
+
+    :param scores: The arc scores, where C{scores[h][d]} is the score
+        of the arc from node C{h} to node C{d}.  Arcs scored C{-inf}
+        are not used; and neither are arcs into node 0, or from a node
+        to itself.
+    :type scores: C{numpy.ndarray} or list of lists of numbers
+    :return: The head of each node in the maximum spanning tree, with
+        C{None} for node 0.
+    :rtype: list
+    :raise ValueError: If some node can not be reached from node 0.
+    """
+    scores = numpy.asarray(scores, dtype=float)
+    num_nodes = len(scores)
+    if scores.shape != (num_nodes, num_nodes):
+        raise ValueError('Arc scores must be a square matrix')
+    if num_nodes == 0: return []
+
+    # Each contracted cycle becomes a new node, numbered from num_nodes.
+    # weights[u, v] is the score of the best arc from u to v, and
+    # arc_heads[u, v], arc_deps[u, v] is the original arc it stands for.
+    size = 2*num_nodes - 1
+    weights = numpy.empty((size, size))
+    weights.fill(-numpy.inf)
+    weights[:num_nodes, :num_nodes] = scores
+    weights[:, 0] = -numpy.inf
+    weights[numpy.arange(size), numpy.arange(size)] = -numpy.inf
+    arc_heads = numpy.arange(size).repeat(size).reshape(size, size)
+    arc_deps = arc_heads.transpose().copy()
+    positions = numpy.arange(size)
+
+    enter = [None] * size       # The original arc chosen into each node.
+    enter_score = numpy.zeros(size)
+    parent = [None] * size      # The node that each node was contracted into.
+    members = [None] * size     # The nodes contracted into each node.
+    done = [False] * size       # Is the node connected to node 0?
+    done[0] = True
+    next_node = num_nodes
+
+    for node in xrange(1, num_nodes):
+        while parent[node] is not None:
+            node = parent[node]
+        if done[node]: continue
+        # The nodes whose best incoming arcs were followed to node.
+        path = []
+        while True:
+            head = weights[:, node].argmax()
+            if weights[head, node] == -numpy.inf:
+                raise ValueError('Some nodes can not be reached from node 0')
+            enter[node] = (arc_heads[head, node], arc_deps[head, node])
+            enter_score[node] = weights[head, node]
+            if done[head]:
+                for path_node in path + [node]:
+                    done[path_node] = True
+                break
+            if head not in path:
+                path.append(node)
+                node = head
+                continue
+
+            # Contract the cycle into a new node.  An arc into the new
+            # node replaces the cycle arc into one of the cycle's nodes.
+            cycle = path[path.index(head):] + [node]
+            del path[path.index(head):]
+            node = next_node
+            next_node += 1
+            into = weights[:, cycle] - enter_score[cycle]
+            best = into.argmax(axis=1)
+            weights[:, node] = into[positions, best]
+            arc_heads[:, node] = arc_heads[:, cycle][positions, best]
+            arc_deps[:, node] = arc_deps[:, cycle][positions, best]
+            out_of = weights[cycle, :]
+            best = out_of.argmax(axis=0)
+            weights[node, :] = out_of[best, positions]
+            arc_heads[node, :] = arc_heads[cycle, :][best, positions]
+            arc_deps[node, :] = arc_deps[cycle, :][best, positions]
+            weights[cycle, :] = -numpy.inf
+            weights[:, cycle] = -numpy.inf
+            weights[node, node] = -numpy.inf
+            for cycle_node in cycle:
+                parent[cycle_node] = node
+            members[node] = cycle
+
+    # Expand the contracted nodes: the arc chosen into a contracted node
+    # enters one of the original nodes inside it, and breaks the cycles
+    # that contain that node; the other nodes of those cycles keep the
+    # arcs that they were entered by.
+    heads = [None] * num_nodes
+    agenda = [node for node in xrange(1, next_node) if parent[node] is None]
+    while agenda:
+        node = agenda.pop()
+        head, dep = enter[node]
+        heads[dep] = int(head)
+        while dep != node:
+            agenda.extend(member for member in members[parent[dep]]
+                          if member != dep)
+            dep = parent[dep]
+    return heads
+
+def _arc_score_matrix(scores):
+    """
+    :return: The scores returned by L{DependencyScorerI.score()}, as a
+        C{numpy} array of the best score of each arc, where arcs that
+        have no scores are scored C{-inf}.
+    """
+    if isinstance(scores, numpy.ndarray):
+        return scores
+    matrix = numpy.empty((len(scores), len(scores)))
+    matrix.fill(-numpy.inf)
+    for head, row in enumerate(scores):
+        for dep, arc_scores in enumerate(row):
+            if arc_scores:
+                matrix[head, dep] = max(arc_scores)
+    return matrix
+
 #################################################################
 # Non-Projective Probabilistic Parsing
 #################################################################
@@ -187,6 +321,11 @@ class ProbabilisticNonprojectiveParser(object):
     follows the MST parsing algorithm, outlined in McDonald(2005), 
     which likens the search for the best non-projective parse to 
     finding the maximum spanning tree in a weighted directed graph.
+
+    If numpy is installed, then the maximum spanning tree is found by
+    L{maximum_spanning_tree()}, from a matrix of all the arc scores.
+    Otherwise, the arc scores are kept in lists, and the cycles are
+    collapsed with L{collapse_nodes()} and L{update_edge_scores()}.
     """
     def __init__(self):
         """
@@ -376,6 +515,8 @@ class ProbabilisticNonprojectiveParser(object):
         :type tags: A List of C{String}.
         :param tags: A list of tags corresponding by index to the words in the tokens list.
         """
+        if numpy is not None:
+            return self._parse_with_numpy(tokens, tags)
         self.inner_nodes = {}
         # Initialize g_graph
         g_graph = DependencyGraph()
@@ -467,6 +608,27 @@ class ProbabilisticNonprojectiveParser(object):
         return original_graph
         print 'Done.'
 
+    def _parse_with_numpy(self, tokens, tags):
+        """
+        A version of L{parse} that scores all the arcs of the sentence
+        with one call to the scorer, and finds the best parse with
+        L{maximum_spanning_tree()}.
+        """
+        graph = DependencyGraph()
+        for index, token in enumerate(tokens):
+            graph.nodelist.append({'word':token, 'tag':tags[index], 'deps':[], 'rel':'NTOP', 'address':index+1})
+        # Fully connect non-root nodes in graph, and score its arcs
+        graph.connect_graph()
+        self.initialize_edge_scores(graph)
+        heads = maximum_spanning_tree(_arc_score_matrix(self.scores))
+        # Replace the arcs with those of the spanning tree
+        for node in graph.nodelist:
+            node['deps'] = []
+        for dep, head in enumerate(heads):
+            if head is not None:
+                graph.add_arc(head, dep)
+        return graph
+
         
 
 #################################################################
@@ -28,6 +28,11 @@ search strategies.  Currently the following subclasses are defined:
 The C{BottomUpProbabilisticChartParser} constructor has an optional 
 argument beam_size.  If non-zero, this controls the size of the beam 
 (aka the edge queue).  This option is most useful with InsideChartParser.
+
+The orderings of C{InsideChartParser} and C{LongestChartParser} are
+defined by key functions, which allow their queues to be kept as
+heaps, rather than being re-sorted every time an edge is added to
+the chart.
 """
 
 ##//////////////////////////////////////////////////////
@@ -37,8 +42,12 @@ argument beam_size.  If non-zero, this controls the size of the beam
 # [XX] This might not be implemented quite right -- it would be better
 # to associate probabilities with child pointer lists.
 
+import heapq
+import itertools
+
 from nltk.tree import Tree, ProbabilisticTree
 from nltk.grammar import Nonterminal, WeightedGrammar
+from nltk.internals import overridden
 
 from nltk.parse.api import ParserI
 from nltk.parse.chart import Chart, LeafEdge, TreeEdge, AbstractChartRule
@@ -143,8 +152,10 @@ class BottomUpProbabilisticChartParser(ParserI):
     The sorting order for the queue is not specified by
     C{BottomUpProbabilisticChartParser}.  Different sorting orders will 
     result in different search strategies.  The sorting order for the 
-    queue is defined by the method C{sort_queue}; subclasses are required
-    to provide a definition for this method.
+    queue is defined by the method C{sort_key} or by the method
+    C{sort_queue}; subclasses are required to provide a definition for
+    one of these methods.  If only C{sort_key} is defined, then the
+    queue is kept as a heap (see L{_EdgeQueue}).
 
     :type _grammar: C{PCFG}
     :ivar _grammar: The grammar used to parse sentences.
@@ -201,7 +212,10 @@ class BottomUpProbabilisticChartParser(ParserI):
         fr = SingleEdgeProbabilisticFundamentalRule()
 
         # Our queue!
-        queue = []
+        if overridden(self.sort_key) and not overridden(self.sort_queue):
+            queue = _EdgeQueue(self.sort_key, self.beam_size)
+        else:
+            queue = []
         
         # Initialize the chart.
         for edge in bu_init.apply_iter(chart, grammar):
@@ -211,12 +225,19 @@ class BottomUpProbabilisticChartParser(ParserI):
             queue.append(edge)
 
         while len(queue) > 0:
-            # Re-sort the queue.
-            self.sort_queue(queue, chart)
+            if isinstance(queue, _EdgeQueue):
+                # Prune the queue to the correct size if a beam was
+                # defined.  (The queue is always sorted.)
+                for edge in queue.prune():
+                    if self._trace > 2:
+                        print '  %-50s [DISCARDED]' % chart.pp_edge(edge,2)
+            else:
+                # Re-sort the queue.
+                self.sort_queue(queue, chart)
 
-            # Prune the queue to the correct size if a beam was defined
-            if self.beam_size:
-                self._prune(queue, chart)
+                # Prune the queue to the correct size if a beam was defined
+                if self.beam_size:
+                    self._prune(queue, chart)
 
             # Get the best edge.
             edge = queue.pop()
@@ -228,20 +249,20 @@ class BottomUpProbabilisticChartParser(ParserI):
             queue.extend(bu.apply(chart, grammar, edge))
             queue.extend(fr.apply(chart, grammar, edge))
 
-        # Get a list of complete parses.
-        parses = chart.parses(grammar.start(), ProbabilisticTree)
-
-        # Assign probabilities to the trees.
+        # Get the most likely complete parses, from best to worst.
         prod_probs = {}
         for prod in grammar.productions():
             prod_probs[prod.lhs(), prod.rhs()] = prod.prob()
+        parses = chart.iter_best_parses(
+            grammar.start(), lambda edge: prod_probs[edge.lhs(), edge.rhs()],
+            ProbabilisticTree)
+        parses = list(itertools.islice(parses, n))
+
+        # Assign probabilities to the trees.
         for parse in parses:
             self._setprob(parse, prod_probs)
-
-        # Sort by probability
-        parses.sort(lambda a,b: cmp(b.prob(), a.prob()))
         
-        return parses[:n]
+        return parses
 
     def _setprob(self, tree, prod_probs):
         if tree.prob() is not None: return
@@ -264,11 +285,27 @@ class BottomUpProbabilisticChartParser(ParserI):
 
         tree.set_prob(prob)
         
+    def sort_key(self, edge):
+        """
+        :return: The key that the queue is sorted by: edges with
+            higher keys are tried first, and edges with equal keys
+            are tried in the reverse of the order in which they were
+            added to the queue.  The key of an edge must not change
+            while it is in the queue.
+        :rtype: number
+        :param edge: An edge that could be added to the chart by
+            the fundamental rule; but that has not yet been added.
+        :type edge: C{Edge}
+        """
+        raise AssertionError, "BottomUpProbabilisticChartParser is an abstract class"
+
     def sort_queue(self, queue, chart):
         """
         Sort the given queue of C{Edge}s, placing the edge that should
-        be tried first at the beginning of the queue.  This method
-        will be called after each C{Edge} is added to the queue.
+        be tried first at the end of the queue.  This method
+        will be called after each C{Edge} is added to the queue,
+        unless the queue is kept as a heap.  By default, the queue
+        is sorted by C{sort_key}.
 
         :param queue: The queue of C{Edge}s to sort.  Each edge in
             this queue is an edge that could be added to the chart by
@@ -280,7 +317,7 @@ class BottomUpProbabilisticChartParser(ParserI):
         :type chart: C{Chart}
         :rtype: None
         """
-        raise AssertionError, "BottomUpProbabilisticChartParser is an abstract class"
+        queue.sort(key=self.sort_key)
 
     def _prune(self, queue, chart):
         """ Discard items in the queue if the queue is longer than the beam."""
@@ -291,6 +328,74 @@ class BottomUpProbabilisticChartParser(ParserI):
                     print '  %-50s [DISCARDED]' % chart.pp_edge(edge,2)
             del queue[:split]
 
+class _EdgeQueue(object):
+    """
+    A queue of edges, which is kept as a heap, ordered by a key
+    function.  Edges come off the queue in the same order as they
+    would from the end of a list that is stably sorted by that key
+    after every addition: highest key first, and among equal keys,
+    the edge that was added last first.
+
+    If the queue has a beam size, then C{prune} discards the edges
+    that would be at the start of that list.  These are found using
+    a second heap, in ascending order; an edge that is removed from
+    one heap is marked as deleted, and skipped when it reaches the
+    top of the other.
+    """
+    def __init__(self, key, beam_size=0):
+        self._key = key
+        self._beam_size = beam_size
+        self._count = 0
+        self._len = 0
+        # Both heaps hold [key, count, edge] entries; the edge is
+        # set to None when the entry is deleted.
+        self._best = []
+        self._worst = []
+
+    def __len__(self):
+        return self._len
+
+    def append(self, edge):
+        entry = [self._key(edge), self._count, edge]
+        self._count += 1
+        self._len += 1
+        heapq.heappush(self._best, (-entry[0], -entry[1], entry))
+        if self._beam_size:
+            heapq.heappush(self._worst, (entry[0], entry[1], entry))
+
+    def extend(self, edges):
+        for edge in edges:
+            self.append(edge)
+
+    def pop(self):
+        """
+        Remove and return the edge with the highest key.
+        """
+        while True:
+            entry = heapq.heappop(self._best)[2]
+            if entry[2] is not None: break
+        edge = entry[2]
+        entry[2] = None
+        self._len -= 1
+        return edge
+
+    def prune(self):
+        """
+        Discard the edges with the lowest keys, until the queue is
+        no longer than its beam size.
+
+        :return: The discarded edges, lowest first.
+        :rtype: list of C{Edge}
+        """
+        discarded = []
+        while self._beam_size and self._len > self._beam_size:
+            entry = heapq.heappop(self._worst)[2]
+            if entry[2] is None: continue
+            discarded.append(entry[2])
+            entry[2] = None
+            self._len -= 1
+        return discarded
+
 class InsideChartParser(BottomUpProbabilisticChartParser):
     """
     A bottom-up parser for C{PCFG}s that tries edges in descending
@@ -307,22 +412,12 @@ class InsideChartParser(BottomUpProbabilisticChartParser):
     strategy.
     """
     # Inherit constructor.
-    def sort_queue(self, queue, chart):
+    def sort_key(self, edge):
         """
-        Sort the given queue of edges, in descending order of the
-        inside probabilities of the edges' trees.
-
-        :param queue: The queue of C{Edge}s to sort.  Each edge in
-            this queue is an edge that could be added to the chart by
-            the fundamental rule; but that has not yet been added.
-        :type queue: list of C{Edge}
-        :param chart: The chart being used to parse the text.  This
-            chart can be used to provide extra information for sorting
-            the queue.
-        :type chart: C{Chart}
-        :rtype: None
+        Sort the queue in descending order of the inside
+        probabilities of the edges' trees.
         """
-        queue.sort(lambda e1,e2:cmp(e1.prob(), e2.prob()))
+        return edge.prob()
 
 # Eventually, this will become some sort of inside-outside parser:
 # class InsideOutsideParser(BottomUpProbabilisticChartParser):
@@ -377,8 +472,8 @@ class LongestChartParser(BottomUpProbabilisticChartParser):
     search strategy.
     """
     # Inherit constructor
-    def sort_queue(self, queue, chart):
-        queue.sort(lambda e1,e2: cmp(e1.length(), e2.length()))
+    def sort_key(self, edge):
+        return edge.length()
 
 ##//////////////////////////////////////////////////////
 ##  Test Code
@@ -477,5 +572,44 @@ def demo(choice=None, draw_parses=None, print_parses=None):
         for parse in parses:
             print parse
 
+def benchmark(num_pps=(2, 4, 5), beam_size=0):
+    """
+    Time C{InsideChartParser} and C{LongestChartParser} on sentences
+    of increasing length, built by adding prepositional phrases to
+    the sentences of the demo; and compare each parser with a version
+    of it that re-sorts its queue after every edge, as earlier
+    versions did.
+
+    :param num_pps: The numbers of prepositional phrases to add.
+    :param beam_size: The beam size of the parsers.
+    """
+    import gc, time
+    from nltk import toy_pcfg1, toy_pcfg2
+
+    demos = [('I saw John', ' with my telescope', toy_pcfg1),
+             ('the boy saw Jack', ' with Bob under the table', toy_pcfg2)]
+
+    print 'Words               Parser | # Parses  Heap (secs)  Sorted (secs)'
+    print '---------------------------+--------------------------------------'
+    for (sent, pp, grammar) in demos:
+        for n in num_pps:
+            tokens = (sent + pp*n).split()
+            for parser_class in (InsideChartParser, LongestChartParser):
+                class SortedQueueParser(parser_class):
+                    def sort_queue(self, queue, chart):
+                        key = self.sort_key
+                        queue.sort(lambda e1,e2: cmp(key(e1), key(e2)))
+                times = []
+                for cls in (parser_class, SortedQueueParser):
+                    parser = cls(grammar, beam_size=beam_size)
+                    gc.collect()
+                    t = time.time()
+                    parses = parser.nbest_parse(tokens)
+                    times.append(time.time()-t)
+                    del parser
+                print '%5d %20s |%9d%13.4f%15.4f' % (
+                    len(tokens), parser_class.__name__, len(parses),
+                    times[0], times[1])
+
 if __name__ == '__main__':
     demo()
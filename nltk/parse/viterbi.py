@@ -6,7 +6,15 @@
 # URL: <http://www.nltk.org/>
 # For license information, see LICENSE.TXT
 
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nltk.tree import Tree, ProbabilisticTree
+from nltk.grammar import Nonterminal
 
 from nltk.parse.api import ParserI
 
@@ -64,6 +72,11 @@ class ViterbiParser(ParserI):
                   - M{MLC}[M{start}, M{start+width}, M{prod}.lhs]
                     = M{new_tree}
       - Return M{MLC}[0, len(M{text}), M{start_symbol}]
+
+    If numpy is installed, then the table is filled in by L{CKYChart}
+    instead, which finds the same most likely tree, with one pass over
+    the productions for all of the spans of each width.  The algorithm
+    above is still used when tracing output is requested.
                 
     :type _grammar: C{WeightedGrammar}
     :ivar _grammar: The grammar used to parse sentences.
@@ -86,6 +99,7 @@ class ViterbiParser(ParserI):
         """
         self._grammar = grammar
         self._trace = trace
+        self._cky_grammar = None
 
     def grammar(self):
         return self._grammar
@@ -109,6 +123,9 @@ class ViterbiParser(ParserI):
         tokens = list(tokens)
         self._grammar.check_coverage(tokens)
 
+        if numpy is not None and not self._trace:
+            return self._chart(tokens).best_tree()
+
         # The most likely constituent table.  This table specifies the
         # most likely constituent for a given span and type.
         # Constituents can be either Trees or tokens.  For Trees,
@@ -141,6 +158,29 @@ class ViterbiParser(ParserI):
         # Return the tree that spans the entire text & have the right cat
         return constituents.get((0, len(tokens), self._grammar.start()))
 
+    def chart(self, tokens, prune=None):
+        """
+        :return: A CKY chart for the given text, which records the
+            most likely constituents of the text, and can compute
+            their inside and outside probabilities.  This requires
+            numpy.
+        :rtype: L{CKYChart}
+        :param prune: If specified, then only the constituents for
+            which this array is true are added to the chart.  It is
+            indexed in the same way as the chart's score arrays; for
+            example, C{chart.posteriors() > 1e-4} can be used to
+            prune a chart for the same text.
+        :type prune: C{numpy.ndarray} of bool
+        """
+        tokens = list(tokens)
+        self._grammar.check_coverage(tokens)
+        return self._chart(tokens, prune)
+
+    def _chart(self, tokens, prune=None):
+        if self._cky_grammar is None:
+            self._cky_grammar = _CKYGrammar(self._grammar)
+        return CKYChart(self._cky_grammar, tokens, prune)
+
     def _add_constituents_spanning(self, span, constituents, tokens):
         """
         Find any constituents that might cover C{span}, and add them
@@ -322,6 +362,599 @@ class ViterbiParser(ParserI):
         return '<ViterbiParser for %r>' % self._grammar
 
 
+##//////////////////////////////////////////////////////
+##  CKY Chart
+##//////////////////////////////////////////////////////
+
+class CKYChart(object):
+    """
+    A table of the constituents of a text, built by the CKY algorithm
+    for a C{WeightedGrammar}, using numpy.  The scores of the
+    constituents are returned as arrays, where M{table[s, e, i]} is
+    the score of a constituent that covers M{text[s:e]}, and whose
+    node value is the M{i}th symbol.  The first symbols are the
+    grammar's nonterminals, in the order given by L{nonterminals()};
+    these are followed by internal symbols, which are used to
+    binarize the grammar:
+
+      - a symbol for each terminal in a production with more than
+        one child; and
+      - a symbol for each prefix of the children of a production
+        with more than two children.  For example, M{A -> B C D [p]}
+        becomes M{<B,C> -> B C [p]} and M{A -> <B,C> D [1]}.
+
+    The table of the most likely constituents is filled in for all
+    of the spans of each length at once, when the chart is created.
+    It uses the same products of probabilities as L{ViterbiParser},
+    and the same order when choosing between equally likely trees, so
+    that L{best_tree()} returns the same tree as
+    L{ViterbiParser.parse()}.  In particular, unary productions
+    M{A -> B} are applied in the same series of passes over each span.
+
+    The inside and outside probabilities are computed, in log space,
+    when they are first requested.  Unary chains are then followed in
+    a single step, using the total probability of the chains between
+    each pair of nonterminals.  Productions with no children are
+    ignored.  Use L{ViterbiParser.chart()} to create a chart.
+    """
+    def __init__(self, grammar, tokens, prune=None):
+        """
+        :type grammar: C{_CKYGrammar}
+        :param grammar: The compiled grammar.
+        :param tokens: The text.
+        :param prune: See L{ViterbiParser.chart()}.
+        """
+        self._grammar = grammar
+        self._tokens = tokens
+        self._prune = prune
+        # The probability of the most likely constituents, or NaN
+        # where there is none: built by binary and lexical
+        # productions, and after unary productions are applied.
+        self._viterbi_layer = self._viterbi = None
+        # (start, end, symbol) -> [(unary rule, child version), ...]
+        self._history = {}
+        self._fill_viterbi()
+        self._inside_layer = self._inside = None
+        self._outside = None
+
+    def tokens(self):
+        return self._tokens
+
+    def nonterminals(self):
+        """
+        :return: The grammar's nonterminals, in the order of their
+            indices in the score arrays.
+        :rtype: list of L{Nonterminal}
+        """
+        return self._grammar.symbols[:self._grammar.num_nonterminals]
+
+    def viterbi(self):
+        """
+        :return: The log probability of the most likely constituent
+            for each span and symbol.
+        :rtype: C{numpy.ndarray}
+        """
+        olderr = numpy.seterr(divide='ignore')
+        try:
+            return numpy.log(numpy.nan_to_num(self._viterbi))
+        finally:
+            numpy.seterr(**olderr)
+
+    def inside(self):
+        """
+        :return: The log inside probability of each span and symbol:
+            the total probability of the trees for the span whose
+            root has the symbol.
+        :rtype: C{numpy.ndarray}
+        """
+        if self._inside is None:
+            (self._inside_layer, self._inside) = self._fill_inside()
+        return self._inside
+
+    def outside(self):
+        """
+        :return: The log outside probability of each span and symbol:
+            the total probability of the parses of the text with a
+            gap in place of a constituent for the span with the
+            symbol.
+        :rtype: C{numpy.ndarray}
+        """
+        if self._outside is None:
+            self._outside = self._fill_outside()
+        return self._outside
+
+    def log_prob(self):
+        """
+        :return: The log of the total probability of the parses of
+            the text.
+        :rtype: float
+        """
+        start = self._grammar.index.get(self._grammar.start)
+        if start is None: return float('-inf')
+        return self.inside()[0, len(self._tokens), start]
+
+    def posteriors(self):
+        """
+        :return: The probability, given the text, of each span and
+            symbol; i.e. the expected number of constituents for the
+            span with the symbol in a parse of the text.  This can be
+            used to prune the constituents that are unlikely to be
+            part of any good parse.
+        :rtype: C{numpy.ndarray}
+        """
+        log_prob = self.log_prob()
+        if log_prob == float('-inf'):
+            return numpy.zeros(self._viterbi.shape)
+        return numpy.exp(self.inside() + self.outside() - log_prob)
+
+    def best_tree(self):
+        """
+        :return: The most likely parse of the text, or C{None} if
+            there is none.
+        :rtype: L{ProbabilisticTree}
+        """
+        start = self._grammar.index.get(self._grammar.start)
+        if start is None: return None
+        if numpy.isnan(self._viterbi[0, len(self._tokens), start]):
+            return None
+        return self._best_tree(0, len(self._tokens), start)
+
+    #////////////////////////////////////////////////////////////
+    # Most likely constituents
+    #////////////////////////////////////////////////////////////
+
+    def _fill_viterbi(self):
+        g = self._grammar
+        n = len(self._tokens)
+        layer = numpy.empty((n+1, n+1, len(g.symbols)))
+        layer.fill(numpy.nan)
+        table = layer.copy()
+        olderr = numpy.seterr(invalid='ignore')
+        try:
+            for width in range(1, n+1):
+                starts = numpy.arange(n-width+1)
+                ends = starts + width
+                scores = layer[starts, ends]
+                if width == 1:
+                    for (i, token) in enumerate(self._tokens):
+                        (syms, probs, logps, prods) = g.lexical.get(
+                            token, g.NO_RULES)
+                        for (sym, p) in zip(syms, probs):
+                            if not p <= scores[i, sym]:
+                                scores[i, sym] = p
+                elif len(g.lhs):
+                    mids = starts[:,numpy.newaxis] + numpy.arange(1, width)
+                    left = table[starts[:,numpy.newaxis], mids][:,:,g.left]
+                    right = table[mids, ends[:,numpy.newaxis]][:,:,g.right]
+                    rules = numpy.fmax.reduce(g.prob * left * right, 1)
+                    scores[:,g.lhs_symbols] = numpy.fmax.reduceat(
+                        rules, g.lhs_starts, axis=1)
+                if self._prune is not None:
+                    scores[~self._prune[starts, ends]] = numpy.nan
+                layer[starts, ends] = scores
+                table[starts, ends] = self._apply_unary(starts, ends, scores)
+        finally:
+            numpy.seterr(**olderr)
+        (self._viterbi_layer, self._viterbi) = (layer, table)
+
+    def _apply_unary(self, starts, ends, scores):
+        """
+        Apply the grammar's unary productions to the most likely
+        constituents of the given spans, in the same way as
+        L{ViterbiParser._add_constituents_spanning()}: in a series of
+        passes, each of which tries every unary production on the
+        constituents that were found before the pass started; until a
+        pass finds no more likely constituent.
+        """
+        g = self._grammar
+        if not len(g.unary_lhs): return scores
+        if self._prune is not None:
+            allowed = self._prune[starts, ends][:,g.unary_lhs_symbols]
+        versions = numpy.zeros(scores.shape, int)
+        while True:
+            cands = g.unary_prob * scores[:,g.unary_rhs]
+            best = numpy.fmax.reduceat(cands, g.unary_starts, axis=1)
+            # Find the first production that gives the best tree.
+            rules = numpy.where(cands == best[:,g.unary_group],
+                                numpy.arange(len(g.unary_lhs)),
+                                len(g.unary_lhs))
+            rules = numpy.minimum.reduceat(rules, g.unary_starts, axis=1)
+            current = scores[:,g.unary_lhs_symbols]
+            better = (best > current) | (numpy.isnan(current) &
+                                         ~numpy.isnan(best))
+            if self._prune is not None:
+                better &= allowed
+            if not better.any():
+                return scores
+            (spans, groups) = better.nonzero()
+            syms = g.unary_lhs_symbols[groups]
+            rules = rules[spans, groups]
+            children = versions[spans, g.unary_rhs[rules]]
+            scores = scores.copy()
+            scores[spans, syms] = best[spans, groups]
+            for (span, sym, rule, child) in zip(spans.tolist(), syms.tolist(),
+                                                rules.tolist(),
+                                                children.tolist()):
+                key = (starts[span], ends[span], sym)
+                self._history.setdefault(key, []).append((rule, child))
+                versions[span, sym] = len(self._history[key])
+
+    def _best_tree(self, start, end, sym, version=None):
+        """
+        :return: The most likely tree for the given span and symbol,
+            as it was after the given number of unary productions
+            had replaced it (by default, the final tree); or, for the
+            internal symbol of a terminal, that terminal.
+        """
+        g = self._grammar
+        history = self._history.get((start, end, sym), ())
+        if version is None:
+            version = len(history)
+        if version > 0:
+            (rule, child) = history[version-1]
+            return _make_tree(g.unary_prods[rule], [self._best_tree(
+                start, end, g.unary_rhs[rule], child)])
+
+        if end == start+1:
+            token = self._tokens[start]
+            (syms, probs, logps, prods) = g.lexical.get(token, g.NO_RULES)
+            target = self._viterbi_layer[start, end, sym]
+            for (s, p, production) in zip(syms, probs, prods):
+                if s == sym and p == target:
+                    if production is None: return token
+                    return _make_tree(production, [token])
+
+        (lo, hi) = g.lhs_rules[sym]
+        mids = numpy.arange(start+1, end)
+        olderr = numpy.seterr(invalid='ignore')
+        try:
+            scores = (g.prob[lo:hi] *
+                      self._viterbi[start, mids][:,g.left[lo:hi]] *
+                      self._viterbi[mids, end][:,g.right[lo:hi]])
+        finally:
+            numpy.seterr(**olderr)
+        # Try the productions in order, and then the split points.
+        (rule, split) = divmod(numpy.nanargmax(scores.T), len(mids))
+        rule += lo
+        production = g.prods[rule]
+        if g.children[rule] is not None:
+            return self._best_nary_tree(start, end, rule,
+                                        scores[split, rule-lo])
+        mid = mids[split]
+        return _make_tree(production,
+                          [self._best_tree(start, mid, g.left[rule]),
+                           self._best_tree(mid, end, g.right[rule])])
+
+    def _best_nary_tree(self, start, end, rule, target):
+        """
+        :return: The most likely tree for the production with more
+            than two children that is binarized by C{rule}, whose
+            probability is C{target}.  The ways of dividing the span
+            between the children are tried in the same order as in
+            L{ViterbiParser._match_rhs()}.
+        """
+        g = self._grammar
+        production = g.prods[rule]
+        children = g.children[rule]
+        for splits in itertools.combinations(range(start+1, end),
+                                             len(children)-1):
+            bounds = (start,) + splits + (end,)
+            p = production.prob()
+            for (i, child) in enumerate(children):
+                child_p = self._viterbi[bounds[i], bounds[i+1], child]
+                if numpy.isnan(child_p): break
+                if child < g.num_nonterminals: p *= child_p
+            else:
+                if p == target:
+                    return _make_tree(production, [
+                        self._best_tree(bounds[i], bounds[i+1], child)
+                        for (i, child) in enumerate(children)])
+        raise AssertionError('tree not found')
+
+    #////////////////////////////////////////////////////////////
+    # Inside & outside probabilities
+    #////////////////////////////////////////////////////////////
+
+    def _fill_inside(self):
+        """
+        :return: The tables of log inside probabilities, before and
+            after the unary chains are applied.
+        """
+        g = self._grammar
+        n = len(self._tokens)
+        layer = numpy.empty((n+1, n+1, len(g.symbols)))
+        layer.fill(float('-inf'))
+        table = layer.copy()
+        olderr = numpy.seterr(divide='ignore', invalid='ignore')
+        try:
+            for width in range(1, n+1):
+                starts = numpy.arange(n-width+1)
+                ends = starts + width
+                scores = layer[starts, ends]
+                if width == 1:
+                    for (i, token) in enumerate(self._tokens):
+                        (syms, probs, logps, prods) = g.lexical.get(
+                            token, g.NO_RULES)
+                        numpy.logaddexp.at(scores[i], syms, logps)
+                elif len(g.lhs):
+                    mids = starts[:,numpy.newaxis] + numpy.arange(1, width)
+                    left = table[starts[:,numpy.newaxis], mids][:,:,g.left]
+                    right = table[mids, ends[:,numpy.newaxis]][:,:,g.right]
+                    scores[:,g.lhs_symbols] = _group_logsumexp(
+                        _logsumexp(left + right + g.logp, 1), g.lhs_starts)
+                if self._prune is not None:
+                    scores[~self._prune[starts, ends]] = float('-inf')
+                layer[starts, ends] = scores
+
+                # Apply the unary chains.
+                if len(g.unary_symbols):
+                    below = scores[:,g.unary_symbols]
+                    shift = _finite_max(below, 1)[:,numpy.newaxis]
+                    scores = scores.copy()
+                    scores[:,g.unary_symbols] = numpy.log(numpy.dot(
+                        numpy.exp(below - shift), g.unary_total.T)) + shift
+                    if self._prune is not None:
+                        scores[~self._prune[starts, ends]] = float('-inf')
+                table[starts, ends] = scores
+        finally:
+            numpy.seterr(**olderr)
+        return layer, table
+
+    def _fill_outside(self):
+        """
+        :return: The table of log outside probabilities.
+        """
+        g = self._grammar
+        n = len(self._tokens)
+        inside = self.inside()
+        # The outside scores of constituents as the children of binary
+        # productions (or as the root), before the unary chains are
+        # applied; and the outside scores of all constituents.
+        top = numpy.empty(inside.shape)
+        top.fill(float('-inf'))
+        outside = top.copy()
+        if self.log_prob() > float('-inf'):
+            top[0, n, g.index[g.start]] = 0.0
+        olderr = numpy.seterr(divide='ignore', invalid='ignore')
+        try:
+            for width in range(n, 0, -1):
+                starts = numpy.arange(n-width+1)
+                ends = starts + width
+                if width < n and len(g.lhs):
+                    exts = numpy.arange(1, n-width+1)
+                    # The constituents as left children.
+                    parent_ends = ends[:,numpy.newaxis] + exts
+                    invalid = parent_ends > n
+                    parent_ends[invalid] = n
+                    scores = (outside[starts[:,numpy.newaxis],
+                                      parent_ends][:,:,g.lhs] + g.logp +
+                              inside[ends[:,numpy.newaxis],
+                                     parent_ends][:,:,g.right])
+                    scores[invalid] = float('-inf')
+                    as_left = _scatter_logsumexp(_logsumexp(scores, 1),
+                                                 g.left, len(g.symbols))
+                    # The constituents as right children.
+                    parent_starts = starts[:,numpy.newaxis] - exts
+                    invalid = parent_starts < 0
+                    parent_starts[invalid] = 0
+                    scores = (outside[parent_starts,
+                                      ends[:,numpy.newaxis]][:,:,g.lhs] +
+                              g.logp +
+                              inside[parent_starts,
+                                     starts[:,numpy.newaxis]][:,:,g.left])
+                    scores[invalid] = float('-inf')
+                    as_right = _scatter_logsumexp(_logsumexp(scores, 1),
+                                                  g.right, len(g.symbols))
+                    top[starts, ends] = numpy.logaddexp(as_left, as_right)
+
+                # Apply the unary chains.
+                scores = top[starts, ends]
+                if len(g.unary_symbols):
+                    above = scores[:,g.unary_symbols]
+                    shift = _finite_max(above, 1)[:,numpy.newaxis]
+                    scores = scores.copy()
+                    scores[:,g.unary_symbols] = numpy.log(numpy.dot(
+                        numpy.exp(above - shift), g.unary_total)) + shift
+                outside[starts, ends] = scores
+        finally:
+            numpy.seterr(**olderr)
+        return outside
+
+    def __repr__(self):
+        return '<CKYChart for %d tokens>' % len(self._tokens)
+
+def _make_tree(production, children):
+    """
+    :return: A tree for the given production and children, whose
+        probability is computed in the same way as by
+        L{ViterbiParser._add_constituents_spanning()}.
+    """
+    subtrees = [c for c in children if isinstance(c, Tree)]
+    p = reduce(lambda pr,t:pr*t.prob(), subtrees, production.prob())
+    return ProbabilisticTree(production.lhs().symbol(), children, prob=p)
+
+def _finite_max(a, axis):
+    """
+    :return: The maximum of C{a} along the given axis, or 0 where the
+        maximum is infinite.
+    """
+    shift = a.max(axis)
+    shift[~numpy.isfinite(shift)] = 0
+    return shift
+
+def _logsumexp(a, axis):
+    shift = _finite_max(a, axis)
+    return numpy.log(numpy.exp(a - numpy.expand_dims(shift, axis))
+                     .sum(axis)) + shift
+
+def _group_logsumexp(a, starts):
+    """
+    :return: The log of the sums of the exponents of consecutive
+        groups of the columns of C{a}, which start at C{starts}.
+    """
+    shift = _finite_max(a, 1)[:,numpy.newaxis]
+    return numpy.log(numpy.add.reduceat(numpy.exp(a - shift), starts,
+                                        axis=1)) + shift
+
+def _scatter_logsumexp(a, columns, size):
+    """
+    :return: An array with C{size} columns, where column M{j} is the
+        log of the sum of the exponents of the columns M{i} of C{a}
+        with C{columns[i] == j}.
+    """
+    shift = _finite_max(a, 1)[:,numpy.newaxis]
+    total = numpy.zeros((len(a), size))
+    numpy.add.at(total.T, columns, numpy.exp(a - shift).T)
+    return numpy.log(total) + shift
+
+class _CKYGrammar(object):
+    """
+    A C{WeightedGrammar}, binarized and compiled into arrays for
+    L{CKYChart}.  Symbols are identified by their index in
+    C{symbols}, which holds the grammar's nonterminals, followed by
+    the internal symbols (see L{CKYChart}).
+
+      - C{lhs}, C{left}, C{right}, C{prob}, C{logp} and C{prods}
+        describe the binary productions, sorted by their left-hand
+        sides (and otherwise in the grammar's order).  The
+        productions for the symbol C{lhs_symbols[k]} start at
+        C{lhs_starts[k]}, and are given by C{lhs_rules[lhs]}.
+        C{prods} holds the original productions; and C{children}
+        holds the children of the original production, for the
+        final step of a production with more than two children.
+      - C{lexical} maps each terminal to the arrays of symbols,
+        probabilities, log probabilities and productions that can
+        cover it.
+      - C{unary_lhs}, C{unary_rhs}, C{unary_prob} and C{unary_prods}
+        describe the unary productions, in the same way; the ones
+        for C{unary_lhs_symbols[k]} start at C{unary_starts[k]}, and
+        C{unary_group} gives the group of each production.
+      - C{unary_symbols} lists the symbols of the unary productions,
+        and C{unary_total[a,b]} is the total probability of the
+        chains of unary productions from the M{a}th to the M{b}th of
+        these symbols.
+    """
+    NO_RULES = ([], [], numpy and numpy.zeros(0), [])
+    """The entry of C{lexical} for terminals that no symbol covers."""
+
+    def __init__(self, grammar):
+        self.start = grammar.start()
+        self.symbols = []
+        self.index = {}
+        for production in grammar.productions():
+            self._symbol(production.lhs())
+            for elt in production.rhs():
+                if isinstance(elt, Nonterminal):
+                    self._symbol(elt)
+        self.num_nonterminals = len(self.symbols)
+
+        binary = []
+        lexical = {}
+        unary = []
+        for production in grammar.productions():
+            rhs = production.rhs()
+            if len(rhs) == 0:
+                continue
+            lhs = self.index[production.lhs()]
+            p = production.prob()
+            if len(rhs) == 1:
+                if isinstance(rhs[0], Nonterminal):
+                    unary.append((lhs, self.index[rhs[0]], p, production))
+                else:
+                    lexical.setdefault(rhs[0], []).append(
+                        (lhs, p, production))
+                continue
+            children = []
+            for elt in rhs:
+                if isinstance(elt, Nonterminal):
+                    children.append(self.index[elt])
+                else:
+                    children.append(self._terminal(elt, lexical))
+            if len(children) == 2:
+                binary.append((lhs, children[0], children[1], p,
+                               production, None))
+                continue
+            left = self._symbol(('prefix', production, 2))
+            binary.append((left, children[0], children[1], p, None, None))
+            for i in range(2, len(children)-1):
+                prefix = self._symbol(('prefix', production, i+1))
+                binary.append((prefix, left, children[i], 1.0, None, None))
+                left = prefix
+            binary.append((lhs, left, children[-1], 1.0, production,
+                           children))
+
+        binary.sort(key=lambda rule: rule[0])
+        self.lhs = numpy.array([rule[0] for rule in binary], int)
+        self.left = numpy.array([rule[1] for rule in binary], int)
+        self.right = numpy.array([rule[2] for rule in binary], int)
+        self.prob = numpy.array([rule[3] for rule in binary], 'd')
+        self.logp = _log(self.prob)
+        self.prods = [rule[4] for rule in binary]
+        self.children = [rule[5] for rule in binary]
+        (self.lhs_symbols, self.lhs_starts) = _groups(self.lhs)
+        self.lhs_rules = {}
+        for (sym, lo, hi) in zip(self.lhs_symbols, self.lhs_starts,
+                                 list(self.lhs_starts[1:]) + [len(binary)]):
+            self.lhs_rules[sym] = (lo, hi)
+
+        self.lexical = {}
+        for (token, rules) in lexical.items():
+            probs = numpy.array([r[1] for r in rules], 'd')
+            self.lexical[token] = ([r[0] for r in rules], probs.tolist(),
+                                   _log(probs), [r[2] for r in rules])
+
+        unary.sort(key=lambda rule: rule[0])
+        self.unary_lhs = numpy.array([rule[0] for rule in unary], int)
+        self.unary_rhs = numpy.array([rule[1] for rule in unary], int)
+        self.unary_prob = numpy.array([rule[2] for rule in unary], 'd')
+        self.unary_prods = [rule[3] for rule in unary]
+        (self.unary_lhs_symbols, self.unary_starts) = _groups(self.unary_lhs)
+        self.unary_group = (numpy.searchsorted(self.unary_lhs_symbols,
+                                               self.unary_lhs))
+
+        symbols = sorted(set(self.unary_lhs.tolist() +
+                             self.unary_rhs.tolist()))
+        self.unary_symbols = numpy.array(symbols, int)
+        u = len(symbols)
+        total = numpy.zeros((u, u))
+        for (lhs, rhs, p, production) in unary:
+            total[symbols.index(lhs), symbols.index(rhs)] += p
+        # The sum of all chains: M{I + P + P^2 + ... = (I-P)^-1}.
+        self.unary_total = numpy.linalg.inv(numpy.eye(u) - total)
+
+    def _symbol(self, symbol):
+        if symbol not in self.index:
+            self.index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.index[symbol]
+
+    def _terminal(self, token, lexical):
+        """
+        :return: The internal symbol for a terminal, which covers
+            only that terminal, with probability 1.
+        """
+        if ('terminal', token) not in self.index:
+            sym = self._symbol(('terminal', token))
+            lexical.setdefault(token, []).append((sym, 1.0, None))
+        return self.index['terminal', token]
+
+def _log(a):
+    olderr = numpy.seterr(divide='ignore')
+    try:
+        return numpy.log(a)
+    finally:
+        numpy.seterr(**olderr)
+
+def _groups(a):
+    """
+    :return: The distinct values of the sorted array C{a}, and the
+        index of the first occurrence of each.
+    """
+    if not len(a):
+        return numpy.zeros(0, int), numpy.zeros(0, int)
+    starts = numpy.concatenate([[0], (a[1:] != a[:-1]).nonzero()[0] + 1])
+    return a[starts], starts
+
 ##//////////////////////////////////////////////////////
 ##  Test Code
 ##//////////////////////////////////////////////////////
@@ -58,8 +58,9 @@ from nltk.tag.simplify   import (simplify_brown_tag, simplify_wsj_tag,
 from nltk.tag.sequential import (SequentialBackoffTagger, ContextTagger,
                                  DefaultTagger, NgramTagger, UnigramTagger,
                                  BigramTagger, TrigramTagger, AffixTagger,
-                                 RegexpTagger, ClassifierBasedTagger,
-                                 ClassifierBasedPOSTagger) 
+                                 RegexpTagger, CompiledBackoffTagger,
+                                 ClassifierBasedTagger,
+                                 ClassifierBasedPOSTagger, training_tags) 
 from nltk.tag.brill      import BrillTagger, BrillTaggerTrainer, FastBrillTaggerTrainer   
 from nltk.tag.tnt        import TnT
 from nltk.tag.hunpos     import HunposTagger
@@ -68,10 +69,11 @@ from nltk.tag.crf        import MalletCRF
 
 from nltk.data      import load
 
-# Import hmm module if numpy is installed
+# Import hmm and crf modules if numpy is installed
 try:
     import numpy
     from nltk.tag.hmm import HiddenMarkovModelTagger, HiddenMarkovModelTrainer
+    from nltk.tag.crf import CRFTagger
 except ImportError:
     pass
 
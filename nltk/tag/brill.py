@@ -115,27 +115,86 @@ class BrillTagger(TaggerI, yaml.YAMLObject):
         
         # Run the initial tagger.
         tagged_tokens = self._initial_tagger.tag(tokens)
+        words = [word for (word, tag) in tagged_tokens]
+        tags = [tag for (word, tag) in tagged_tokens]
 
         # Create a dictionary that maps each tag to a list of the
         # indices of tokens that have that tag.
         tag_to_positions = defaultdict(set)
-        for i, (token, tag) in enumerate(tagged_tokens):
+        for i, tag in enumerate(tags):
             tag_to_positions[tag].add(i)
 
         # Apply each rule, in order.  Only try to apply rules at
         # positions that have the desired original tag.
-        for rule in self._rules:
+        for (rule, conditions) in self._compiled_rules():
             # Find the positions where it might apply
-            positions = tag_to_positions.get(rule.original_tag, [])
-            # Apply the rule at those positions.
-            changed = rule.apply(tagged_tokens, positions)
+            positions = tag_to_positions.get(rule.original_tag)
+            if not positions:
+                continue
+            if conditions is None:
+                # Apply the rule at those positions.
+                tagged_tokens = zip(words, tags)
+                changed = rule.apply(tagged_tokens, positions)
+            else:
+                # Check each condition against the word or tag array.
+                changed = []
+                for i in positions:
+                    for (use_tags, start, end, value) in conditions:
+                        values = (tags if use_tags else words)
+                        if value not in values[max(0, i+start):
+                                               max(0, i+end+1)]:
+                            break
+                    else:
+                        changed.append(i)
             # Update tag_to_positions with the positions of tags that
             # were modified.
             for i in changed:
+                tags[i] = rule.replacement_tag
                 tag_to_positions[rule.original_tag].remove(i)
                 tag_to_positions[rule.replacement_tag].add(i)
 
-        return tagged_tokens
+        return zip(words, tags)
+
+    def _compiled_rules(self):
+        """
+        Return a list of ``(rule, conditions)`` pairs, one for each
+        of this tagger's rules.  For rules that are instances of
+        ``ProximateTagsRule`` or ``ProximateWordsRule``, *conditions*
+        is a list of ``(use_tags, start, end, value)`` tuples, which
+        are checked against the sentence's tag array (if *use_tags*
+        is true) or word array; for any other rule it is None, and
+        the rule's ``apply()`` method is used.
+        """
+        try:
+            return self.__compiled_rules
+        except AttributeError:
+            compiled = []
+            for rule in self._rules:
+                conditions = None
+                if (isinstance(rule, ProximateTokensRule) and
+                    type(rule).applies.im_func is
+                    ProximateTokensRule.applies.im_func):
+                    if (rule.extract_property is
+                        ProximateTagsRule.extract_property):
+                        use_tags = True
+                    elif (rule.extract_property is
+                          ProximateWordsRule.extract_property):
+                        use_tags = False
+                    else:
+                        use_tags = None
+                    if use_tags is not None:
+                        conditions = [(use_tags, start, end, value)
+                                      for (start, end, value)
+                                      in rule._conditions]
+                compiled.append((rule, conditions))
+            self.__compiled_rules = compiled
+            return compiled
+
+    def __getstate__(self):
+        # Don't save the compiled rules.
+        state = self.__dict__.copy()
+        state.pop('_BrillTagger__compiled_rules', None)
+        return state
 
 ######################################################################
 ## Brill Rules
@@ -835,13 +894,26 @@ class FastBrillTaggerTrainer(object):
     A faster trainer for brill taggers.
     """
     def __init__(self, initial_tagger, templates, trace=0,
-                 deterministic=False):
+                 deterministic=False, processes=1):
+        """
+        :param processes: If greater than one, the training corpus is
+            divided into that many contiguous ranges of sentences, each
+            of which is handed to a worker process for the whole of
+            training.  The workers scan their sentences for the rules
+            that correct the initial tagger's errors, and after each
+            rule is chosen, they check which rules apply at the
+            affected positions in their sentences.  If None, one
+            worker per CPU is used.  The workers' results are merged
+            in the order that a single process uses, so the learned
+            rules are the same as with a single process.
+        """
         if not deterministic:
             deterministic = (trace > 0)
         self._initial_tagger = initial_tagger
         self._templates = templates
         self._trace = trace
         self._deterministic = deterministic
+        self._processes = processes
 
         self._tag_positions = None
         """Mapping from tags to lists of positions that use that tag."""
@@ -879,6 +951,18 @@ class FastBrillTaggerTrainer(object):
            if the rule applies.  This records the next position we
            need to check to see if the rule messed anything up."""
 
+        self._workers = None
+        """A list of single-process pools, one for each range of
+           sentences, or None if training is not done in parallel."""
+
+        self._worker_starts = None
+        """The number of the first sentence of each worker's range."""
+
+        self._worker_updates = None
+        """The changes to test_sents and _first_unknown_position that
+           have not yet been sent to the workers, as a pair of lists
+           (tag_changes, first_unknown_changes)."""
+
     #////////////////////////////////////////////////////////////
     # Training
     #////////////////////////////////////////////////////////////
@@ -896,6 +980,9 @@ class FastBrillTaggerTrainer(object):
         test_sents = [self._initial_tagger.tag(untag(sent))
                       for sent in train_sents]
 
+        # Hand out the sentences to the worker processes (if any).
+        self._start_workers(test_sents, train_sents)
+
         # Initialize our mappings.  This will find any errors made
         # by the initial tagger, and use those to generate repair
         # rules, which are added to the rule mappings.
@@ -937,8 +1024,10 @@ class FastBrillTaggerTrainer(object):
         except KeyboardInterrupt:
             print "Training stopped manually -- %d rules found" % len(rules)
 
-        # Discard our tag position mapping & rule mappings.
-        self._clean()
+        # Discard our tag position mapping & rule mappings, and stop
+        # the worker processes.
+        finally:
+            self._clean()
             
         # Create and return a tagger from the rules we found.
         return BrillTagger(self._initial_tagger, rules)
@@ -956,20 +1045,58 @@ class FastBrillTaggerTrainer(object):
         self._rule_scores = defaultdict(int)
         self._first_unknown_position = defaultdict(int)
 
-        # Scan through the corpus, initializing the tag_positions
-        # mapping and all the rule-related mappings.
+        # Scan through the corpus, initializing the tag_positions mapping.
         for sentnum, sent in enumerate(test_sents):
             for wordnum, (word, tag) in enumerate(sent):
-                
-                # Initialize tag_positions
                 self._tag_positions[tag].append( (sentnum,wordnum) )
 
-                # If it's an error token, update the rule-related mappings.
-                correct_tag = train_sents[sentnum][wordnum][1]
-                if tag != correct_tag:
-                    for rule in self._find_rules(sent, wordnum, correct_tag):
-                        self._update_rule_applies(rule, sentnum, wordnum,
-                                                  train_sents)
+        # For each error token, update the rule-related mappings.
+        for sentnum, wordnum, rules in self._error_rules(test_sents,
+                                                         train_sents):
+            for rule in rules:
+                self._update_rule_applies(rule, sentnum, wordnum,
+                                          train_sents)
+
+    def _error_rules(self, test_sents, train_sents):
+        """
+        Return an iterator over tuples *(sentnum, wordnum, rules)*, one
+        for each error token in *test_sents*, where *rules* lists the
+        rules that would correct it.  If there are worker processes,
+        each of them scans its own range of sentences.
+        """
+        if self._workers is None:
+            return _error_rules(self._templates, test_sents, train_sents,
+                                range(len(test_sents)))
+        results = [worker.apply_async(_brill_worker_error_rules)
+                   for worker in self._workers]
+        return (error for result in results for error in result.get())
+
+    def _start_workers(self, test_sents, train_sents):
+        """
+        If ``self._processes`` is not one, divide the sentences into
+        contiguous ranges, and start a worker process for each range.
+        Each worker is given the templates and its range of the two
+        corpora, and keeps its copy of *test_sents* up to date as
+        rules are applied; so after that, only rules and positions
+        are sent to the workers.
+        """
+        self._workers = None
+        if self._processes == 1 or len(test_sents) < _MIN_PARALLEL_ITEMS:
+            return
+
+        import multiprocessing
+        processes = self._processes or multiprocessing.cpu_count()
+        size = -(-len(test_sents) // processes)
+        self._worker_starts = range(0, len(test_sents), size)
+        self._worker_updates = ([], [])
+        self._workers = []
+        for start in self._worker_starts:
+            sentnums = range(start, min(start+size, len(test_sents)))
+            self._workers.append(multiprocessing.Pool(
+                1, _init_brill_worker,
+                (self._templates, sentnums,
+                 [test_sents[sentnum] for sentnum in sentnums],
+                 [train_sents[sentnum] for sentnum in sentnums])))
 
     def _clean(self):
         self._tag_positions = None
@@ -978,15 +1105,12 @@ class FastBrillTaggerTrainer(object):
         self._rules_by_score = None
         self._rule_scores = None
         self._first_unknown_position = None
-        
-    def _find_rules(self, sent, wordnum, new_tag):
-        """
-        Use the templates to find rules that apply at index *wordnum*
-        in the sentence *sent* and generate the tag *new_tag*.
-        """
-        for template in self._templates:
-            for rule in template.applicable_rules(sent, wordnum, new_tag):
-                yield rule
+        if self._workers is not None:
+            for worker in self._workers:
+                worker.terminate()
+        self._workers = None
+        self._worker_starts = None
+        self._worker_updates = None
 
     def _update_rule_applies(self, rule, sentnum, wordnum, train_sents):
         """
@@ -1072,12 +1196,13 @@ class FastBrillTaggerTrainer(object):
                         self._update_rule_applies(rule, sentnum, wordnum,
                                                   train_sents)
                         if self._rule_scores[rule] < max_score:
-                            self._first_unknown_position[rule] = (sentnum,
-                                                                  wordnum+1)
+                            self._set_first_unknown_position(
+                                rule, (sentnum, wordnum+1))
                             break # The update demoted the rule.
 
                 if self._rule_scores[rule] == max_score:
-                    self._first_unknown_position[rule] = (len(train_sents)+1,0)
+                    self._set_first_unknown_position(
+                        rule, (len(train_sents)+1, 0))
                     return rule
 
             # We demoted all the rules with score==max_score.
@@ -1089,6 +1214,11 @@ class FastBrillTaggerTrainer(object):
         # We reached the min-score threshold.
         return None
 
+    def _set_first_unknown_position(self, rule, pos):
+        self._first_unknown_position[rule] = pos
+        if self._workers is not None:
+            self._worker_updates[1].append((rule, pos))
+
     def _apply_rule(self, rule, test_sents):
         """
         Update *test_sents* by applying *rule* everywhere where its
@@ -1104,6 +1234,8 @@ class FastBrillTaggerTrainer(object):
         for (sentnum, wordnum) in update_positions:
             text = test_sents[sentnum][wordnum][0]
             test_sents[sentnum][wordnum] = (text, new_tag)
+        if self._workers is not None:
+            self._worker_updates[0].append((update_positions, new_tag))
 
     def _update_tag_positions(self, rule):
         """
@@ -1132,6 +1264,14 @@ class FastBrillTaggerTrainer(object):
                 n = template.get_neighborhood(test_sents[sentnum], wordnum)
                 neighbors.update([(sentnum, i) for i in n])
 
+        # If there are enough positions, have the worker processes
+        # find the rules that apply at them.
+        if (self._workers is not None and
+            len(neighbors) >= _MIN_PARALLEL_ITEMS):
+            worker_rules = self._worker_rules(neighbors)
+        else:
+            worker_rules = None
+
         # Update the rules at each position.  
         num_obsolete = num_new = num_unseen = 0
         for sentnum, wordnum in neighbors:
@@ -1149,34 +1289,78 @@ class FastBrillTaggerTrainer(object):
 
             # Check if the change causes our templates to propose any
             # new rules for this position.
-            site_rules = set()
-            for template in self._templates:
-                for new_rule in template.applicable_rules(test_sent, wordnum,
-                                                          correct_tag):
-                    if new_rule not in old_rules:
-                        num_new += 1
-                        if new_rule not in self._rule_scores:
-                            num_unseen += 1
-                        old_rules.add(new_rule)
-                        self._update_rule_applies(new_rule, sentnum,
-                                                  wordnum, train_sents)
+            if worker_rules is None:
+                site_rules = [new_rule for template in self._templates
+                              for new_rule in template.applicable_rules(
+                                  test_sent, wordnum, correct_tag)]
+            else:
+                (site_rules, later_rules, num_later) = \
+                    worker_rules[sentnum, wordnum]
+            for new_rule in site_rules:
+                if new_rule not in old_rules:
+                    num_new += 1
+                    if new_rule not in self._rule_scores:
+                        num_unseen += 1
+                    old_rules.add(new_rule)
+                    self._update_rule_applies(new_rule, sentnum,
+                                              wordnum, train_sents)
 
             # We may have caused other rules to match here, that are
             # not proposed by our templates -- in particular, rules
             # that are harmful or neutral.  We therefore need to
             # update any rule whose first_unknown_position is past
-            # this rule.
-            for new_rule, pos in self._first_unknown_position.items():
-                if pos > (sentnum, wordnum):
+            # this rule.  (The workers list the rules whose
+            # first_unknown_position is past this rule and that apply
+            # here, in the order of _first_unknown_position.)
+            if worker_rules is None:
+                for new_rule, pos in self._first_unknown_position.items():
+                    if pos > (sentnum, wordnum):
+                        if new_rule not in old_rules:
+                            num_new += 1
+                            if new_rule.applies(test_sent, wordnum):
+                                self._update_rule_applies(
+                                    new_rule, sentnum, wordnum, train_sents)
+            else:
+                # Rules that are already known here are not checked.
+                num_new += num_later
+                for old_rule in old_rules:
+                    pos = self._first_unknown_position.get(old_rule)
+                    if pos is not None and pos > (sentnum, wordnum):
+                        num_new -= 1
+                for new_rule in later_rules:
                     if new_rule not in old_rules:
-                        num_new += 1
-                        if new_rule.applies(test_sent, wordnum):
-                            self._update_rule_applies(new_rule, sentnum,
-                                                      wordnum, train_sents)
-            
+                        self._update_rule_applies(new_rule, sentnum,
+                                                  wordnum, train_sents)
+
         if self._trace > 3:
             self._trace_update_rules(num_obsolete, num_new, num_unseen)
 
+    def _worker_rules(self, positions):
+        """
+        Return a dictionary mapping each of the given positions to a
+        tuple *(site_rules, later_rules, num_later)*, computed by the
+        worker process that handles its sentence.  *site_rules* lists
+        the rules proposed by our templates there; *later_rules* lists
+        the rules whose first_unknown_position is past the position
+        and that apply there; and *num_later* is the number of rules
+        whose first_unknown_position is past the position.  The
+        changes made since the workers were last used are sent along.
+        """
+        worker_positions = [[] for worker in self._workers]
+        for pos in positions:
+            i = bisect.bisect_right(self._worker_starts, pos[0]) - 1
+            worker_positions[i].append(pos)
+
+        updates = self._worker_updates
+        self._worker_updates = ([], [])
+        results = [worker.apply_async(_brill_worker_rules,
+                                      updates + (worker_positions[i],))
+                   for (i, worker) in enumerate(self._workers)]
+        worker_rules = {}
+        for (i, result) in enumerate(results):
+            worker_rules.update(zip(worker_positions[i], result.get()))
+        return worker_rules
+
     #////////////////////////////////////////////////////////////
     # Tracing
     #////////////////////////////////////////////////////////////
@@ -1225,6 +1409,75 @@ class FastBrillTaggerTrainer(object):
 
         
 
+# Training is only run in parallel when there are at least this many
+# sentences; and the rules are only updated in parallel when there are
+# at least this many affected positions.
+_MIN_PARALLEL_ITEMS = 32
+
+def _error_rules(templates, test_sents, train_sents, sentnums):
+    """
+    Generate a tuple *(sentnum, wordnum, rules)* for each error token in
+    the given sentences of *test_sents*, where *rules* lists the rules
+    proposed by *templates* that would correct it.
+    """
+    for sentnum in sentnums:
+        sent = test_sents[sentnum]
+        for wordnum, (word, tag) in enumerate(sent):
+            correct_tag = train_sents[sentnum][wordnum][1]
+            if tag != correct_tag:
+                yield (sentnum, wordnum,
+                       [rule for template in templates
+                        for rule in template.applicable_rules(
+                            sent, wordnum, correct_tag)])
+
+# The state of a FastBrillTaggerTrainer worker process: the templates;
+# the numbers of the worker's sentences; dictionaries mapping them to
+# the test and training sentences; and the worker's copy of the
+# trainer's _first_unknown_position.
+_worker_state = None
+
+def _init_brill_worker(templates, sentnums, test_sents, train_sents):
+    global _worker_state
+    _worker_state = (templates, sentnums, dict(zip(sentnums, test_sents)),
+                     dict(zip(sentnums, train_sents)), {})
+
+def _brill_worker_error_rules():
+    (templates, sentnums, test_sents, train_sents, _) = _worker_state
+    return list(_error_rules(templates, test_sents, train_sents, sentnums))
+
+def _brill_worker_rules(tag_changes, first_unknown_changes, positions):
+    (templates, sentnums, test_sents, train_sents,
+     first_unknown_position) = _worker_state
+
+    # Bring the test sentences and first_unknown_position up to date.
+    # The changes to first_unknown_position are made in the same order
+    # as in the trainer, so the two dictionaries iterate in the same
+    # order.
+    for (update_positions, new_tag) in tag_changes:
+        for (sentnum, wordnum) in update_positions:
+            if sentnum in test_sents:
+                text = test_sents[sentnum][wordnum][0]
+                test_sents[sentnum][wordnum] = (text, new_tag)
+    for (rule, pos) in first_unknown_changes:
+        first_unknown_position[rule] = pos
+
+    results = []
+    for (sentnum, wordnum) in positions:
+        test_sent = test_sents[sentnum]
+        correct_tag = train_sents[sentnum][wordnum][1]
+        site_rules = [rule for template in templates
+                      for rule in template.applicable_rules(
+                          test_sent, wordnum, correct_tag)]
+        later_rules = []
+        num_later = 0
+        for rule, pos in first_unknown_position.items():
+            if pos > (sentnum, wordnum):
+                num_later += 1
+                if rule.applies(test_sent, wordnum):
+                    later_rules.append(rule)
+        results.append((site_rules, later_rules, num_later))
+    return results
+
 ######################################################################
 ## Testing
 ######################################################################
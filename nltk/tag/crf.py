@@ -6,12 +6,14 @@
 # For license information, see LICENSE.TXT
 
 """
-An interface to Mallet <http://mallet.cs.umass.edu/>'s Linear Chain
-Conditional Random Field (LC-CRF) implementation.
+Linear Chain Conditional Random Field (LC-CRF) taggers.
+L{CRFTagger} is a self-contained implementation, which uses numpy;
+L{MalletCRF} is an interface to Mallet <http://mallet.cs.umass.edu/>'s
+LC-CRF implementation.
 
 A user-supplied feature detector function is used to convert each
 token to a featureset.  Each feature/value pair is then encoded as a
-single binary feature for Mallet.
+single binary feature.
 """
 
 from tempfile import mkstemp
@@ -24,7 +26,13 @@ import zipfile
 import pickle
 from xml.etree import ElementTree
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nltk.classify import call_mallet
+from nltk.classify.util import minimize_lbfgs
 
 from nltk.tag.api import FeaturesetTaggerI
 
@@ -709,6 +717,425 @@ class CRFInfo(object):
             # Return true if both matched.
             return src_match and dst_match
 
+###########################################################################
+## Native CRF Tagger
+###########################################################################
+
+class CRFTagger(FeaturesetTaggerI):
+    """
+    A linear chain conditional random field tagger, which is trained
+    and run in-process, using numpy.  Tokens are converted to
+    featuresets using a feature detector function::
+
+        feature_detector(tokens, index) -> featureset
+
+    Each feature (name, value) pair is treated as a binary
+    input-feature.  The score of a tag sequence is the sum of:
+
+      - the weight of each input-feature of each token, paired with
+        the token's tag;
+      - the weight of each pair of adjacent tags; and
+      - the weights of the sentence's first tag and of its last tag.
+
+    The tagger chooses the tag sequence with the highest score, using
+    the Viterbi algorithm.  Input-features that were not seen in
+    training are ignored.
+
+    Sentences are processed in groups of sentences that have the same
+    length, so that each step of the forward-backward and Viterbi
+    algorithms handles a whole group at once.
+    """
+
+    def __init__(self, feature_detector, tags, features, weights):
+        """
+        Create a new CRF tagger.  Typically, C{CRFTagger}s are
+        created using L{train()}.
+
+        :param feature_detector: The feature detector function that
+            is used to convert tokens to featuresets.
+        :type tags: list(str)
+        :param tags: The tags that the tagger chooses from.
+        :type features: dict
+        :param features: A dictionary mapping each input-feature
+            C{(fname, fval)} pair to its index.
+        :type weights: numpy.ndarray
+        :param weights: The CRF's weights: the input-feature weights
+            (in row-major order, with one row per input-feature and
+            one column per tag), followed by the tag transition
+            weights (one row per previous tag), the first-tag
+            weights, and the last-tag weights.
+        """
+        if numpy is None:
+            raise ValueError('CRFTagger requires that numpy be installed')
+        self.feature_detector = feature_detector
+        self._tags = list(tags)
+        self._features = features
+        self._weights = numpy.asarray(weights, 'd')
+        if len(self._weights) != _num_crf_weights(len(features), len(tags)):
+            raise ValueError('Expected %d weights' % _num_crf_weights(
+                len(features), len(tags)))
+
+    def tags(self):
+        """
+        :return: The tags that this tagger chooses from.
+        :rtype: list(str)
+        """
+        return list(self._tags)
+
+    def weights(self):
+        """
+        :return: This CRF's weights (see L{__init__()}).
+        :rtype: numpy.ndarray
+        """
+        return self._weights
+
+    def batch_tag(self, sentences):
+        sentences = list(sentences)
+        weights = _split_crf_weights(self._weights, len(self._features),
+                                     len(self._tags))
+        tag_ids = [[] for sent in sentences]
+        for group in _crf_groups(self._encode(sentences),
+                                 len(self._features)):
+            paths = _crf_viterbi(group.emission_scores(weights[0]),
+                                 *weights[1:])
+            for (sentnum, path) in zip(group.sentnums, paths.tolist()):
+                tag_ids[sentnum] = path
+        return [zip(sent, [self._tags[i] for i in path])
+                for (sent, path) in zip(sentences, tag_ids)]
+
+    def _encode(self, sentences):
+        """
+        :return: A list containing, for each sentence, a list of the
+            indices of each token's known input-features.
+        """
+        features = self._features
+        encoded = []
+        for sent in sentences:
+            encoded.append([
+                [features[f] for f in
+                 self.feature_detector(sent, i).iteritems()
+                 if f in features]
+                for i in range(len(sent))])
+        return encoded
+
+    def __repr__(self):
+        return '<CRFTagger: %d tags, %d input-features>' % (
+            len(self._tags), len(self._features))
+
+    @classmethod
+    def train(cls, feature_detector, corpus, gaussian_variance=1,
+              max_iterations=100, tolerance=1e-7, memory=10, trace=1):
+        """
+        Train a new linear chain CRF tagger based on the given corpus
+        of training sequences, by maximizing the log likelihood of
+        the corpus's tag sequences, minus a gaussian prior on the
+        weights, using the L-BFGS algorithm.
+
+        :type corpus: list(list(tuple(str, str)))
+        :param corpus: Training data, represented as a list of
+            sentences, where each sentence is a list of (token, tag)
+            tuples.
+        :param feature_detector: The feature detector function that
+            is used to convert tokens to featuresets.
+        :type gaussian_variance: float
+        :param gaussian_variance: The variance of the gaussian prior
+            on the weights.  Smaller values give smaller weights.
+        :type max_iterations: int
+        :param max_iterations: The maximum number of iterations that
+            should be used for training the CRF.
+        :type tolerance: float
+        :param tolerance: Training stops when an iteration improves
+            the objective by no more than this fraction of its value.
+        :type memory: int
+        :param memory: The number of previous updates that L-BFGS
+            uses to approximate the inverse Hessian.
+        :type trace: int
+        :param trace: Controls the verbosity of trace output generated
+            while training the CRF.  Higher numbers generate more
+            verbose output.
+        """
+        if numpy is None:
+            raise ValueError('CRFTagger requires that numpy be installed')
+        t0 = time.time()
+
+        # Assign indices to the tags and the input-features.
+        tag_index = {}
+        features = {}
+        encoded = []
+        gold_tags = []
+        for sent in corpus:
+            tokens = [tok for (tok, tag) in sent]
+            encoded_sent = []
+            for i in range(len(sent)):
+                encoded_sent.append([
+                    features.setdefault(f, len(features)) for f in
+                    feature_detector(tokens, i).iteritems()])
+            encoded.append(encoded_sent)
+            gold_tags.append([tag_index.setdefault(tag, len(tag_index))
+                              for (tok, tag) in sent])
+        tags = sorted(tag_index, key=tag_index.get)
+        num_features = len(features)
+        num_tags = len(tags)
+        if trace >= 1:
+            print ('[CRFTagger] Training a new CRF: %d sentences, %d tags, '
+                   '%d input-features' % (len(encoded), num_tags,
+                                          num_features))
+
+        # Group the sentences, and count each joint-feature's
+        # occurrences in the training corpus.
+        groups = _crf_groups(encoded, num_features, gold_tags)
+        offsets = numpy.cumsum([0]+[group.num_toks for group in groups])
+        num_toks = offsets[-1]
+        token_fids = numpy.concatenate(
+            [group.fids[group.fids < num_features] for group in groups])
+        token_nums = numpy.concatenate(
+            [group.token_nums() + offset
+             for (group, offset) in zip(groups, offsets)])
+        starts = numpy.concatenate(
+            [numpy.arange(0, group.num_toks, group.length) + offset
+             for (group, offset) in zip(groups, offsets)])
+        ends = numpy.concatenate(
+            [numpy.arange(group.length-1, group.num_toks, group.length) +
+             offset for (group, offset) in zip(groups, offsets)])
+        gold = numpy.concatenate([group.gold.ravel() for group in groups])
+        empirical = numpy.concatenate([
+            numpy.bincount(token_fids*num_tags + gold[token_nums],
+                           minlength=num_features*num_tags),
+            numpy.bincount(numpy.concatenate(
+                [(group.gold[:,:-1]*num_tags + group.gold[:,1:]).ravel()
+                 for group in groups]), minlength=num_tags*num_tags),
+            numpy.bincount(numpy.concatenate(
+                [group.gold[:,0] for group in groups]), minlength=num_tags),
+            numpy.bincount(numpy.concatenate(
+                [group.gold[:,-1] for group in groups]), minlength=num_tags),
+            ]).astype('d')
+
+        def objective(weights):
+            """
+            Return the negative log likelihood of the training corpus
+            plus the prior, its gradient, and the log likelihood.
+            """
+            (emission, transition, initial, final) = _split_crf_weights(
+                weights, num_features, num_tags)
+            log_z = 0.0
+            marginals = numpy.empty((num_toks, num_tags))
+            expected_transition = numpy.zeros((num_tags, num_tags))
+            for (group, offset) in zip(groups, offsets):
+                (group_marginals, transition_counts, group_log_z) = \
+                    _crf_forward_backward(group.emission_scores(emission),
+                                          transition, initial, final)
+                log_z += group_log_z.sum()
+                marginals[offset:offset+group.num_toks] = \
+                    group_marginals.reshape(-1, num_tags)
+                expected_transition += transition_counts
+
+            expected_emission = numpy.empty((num_features, num_tags))
+            token_marginals = marginals[token_nums]
+            for tag in range(num_tags):
+                expected_emission[:,tag] = numpy.bincount(
+                    token_fids, token_marginals[:,tag], num_features)
+            expected = numpy.concatenate([
+                expected_emission.ravel(), expected_transition.ravel(),
+                marginals[starts].sum(0), marginals[ends].sum(0)])
+
+            ll = numpy.dot(weights, empirical) - log_z
+            value = -ll + 0.5 * numpy.dot(weights, weights) / gaussian_variance
+            gradient = expected - empirical + weights / gaussian_variance
+            return value, gradient, ll
+
+        if trace >= 2:
+            print
+            print '      Iteration    Log Likelihood'
+            print '      -----------------------------'
+
+        # Train the CRF.
+        weights = numpy.zeros(_num_crf_weights(num_features, num_tags), 'd')
+        try:
+            iternum = 0
+            for (new_weights, new_value, gradient, new_ll) in \
+                    minimize_lbfgs(objective, weights, memory):
+                iternum += 1
+                if iternum > 1:
+                    improvement = value - new_value
+                weights, value, ll = new_weights, new_value, new_ll
+
+                # Check the cutoffs.
+                if iternum > 1:
+                    if iternum >= max_iterations:
+                        break
+                    if improvement <= tolerance * max(abs(value), 1.0):
+                        break
+
+                if trace >= 2:
+                    print '     %9d    %14.5f' % (iternum, ll)
+
+        except KeyboardInterrupt:
+            print '      Training stopped: keyboard interrupt'
+
+        if trace >= 2:
+            print '         Final    %14.5f' % ll
+        if trace >= 1:
+            print '[CRFTagger] Training complete (%d seconds).' % (
+                time.time()-t0)
+        return cls(feature_detector, tags, features, weights)
+
+# Sentences are grouped so that no group has more than this many
+# tokens; this bounds the size of the arrays used to process a group.
+_MAX_GROUP_TOKENS = 5000
+
+class _CRFGroup(object):
+    """
+    A group of encoded sentences that have the same length, whose
+    tokens are numbered sentence by sentence.  C{fids} lists the
+    input-feature indices of each token in turn, starting at
+    C{ptr[i]} for the C{i}th token.  Each token's list ends with the
+    index C{num_features}, which stands for a feature with no
+    weights, so that no list is empty.
+    """
+    def __init__(self, sentnums, length, encoded, gold_tags, num_features):
+        self.sentnums = sentnums
+        self.length = length
+        self.num_toks = len(sentnums)*length
+        fids = []
+        ptr = []
+        for sentnum in sentnums:
+            for token_fids in encoded[sentnum]:
+                ptr.append(len(fids))
+                fids.extend(token_fids)
+                fids.append(num_features)
+        self.fids = numpy.array(fids, int)
+        self.ptr = numpy.array(ptr, int)
+        if gold_tags is not None:
+            self.gold = numpy.array([gold_tags[sentnum]
+                                     for sentnum in sentnums], int)
+
+    def token_nums(self):
+        """
+        :return: The number of the token that each input-feature
+            index in C{fids} belongs to, leaving out the final index
+            of each token.
+        """
+        lengths = numpy.diff(numpy.append(self.ptr, len(self.fids))) - 1
+        return numpy.repeat(numpy.arange(self.num_toks), lengths)
+
+    def emission_scores(self, emission):
+        """
+        :return: An array whose M{[s,t,j]}th element is the total
+            weight of the input-features of the M{t}th token of the
+            M{s}th sentence, paired with the M{j}th tag.
+        """
+        padded = numpy.vstack([emission, numpy.zeros(emission.shape[1])])
+        scores = numpy.add.reduceat(padded[self.fids], self.ptr, axis=0)
+        return scores.reshape(len(self.sentnums), self.length, -1)
+
+def _crf_groups(encoded, num_features, gold_tags=None):
+    """
+    :return: A list of L{_CRFGroup}s covering the non-empty
+        sentences in C{encoded}, whose input-feature indices are less
+        than C{num_features}.
+    """
+    by_length = {}
+    for (sentnum, sent) in enumerate(encoded):
+        if sent:
+            by_length.setdefault(len(sent), []).append(sentnum)
+    groups = []
+    for length in sorted(by_length):
+        sentnums = by_length[length]
+        size = max(1, _MAX_GROUP_TOKENS // length)
+        for i in range(0, len(sentnums), size):
+            groups.append(_CRFGroup(sentnums[i:i+size], length, encoded,
+                                    gold_tags, num_features))
+    return groups
+
+def _num_crf_weights(num_features, num_tags):
+    return (num_features + num_tags + 2) * num_tags
+
+def _split_crf_weights(weights, num_features, num_tags):
+    """
+    :return: A tuple C{(emission, transition, initial, final)} of
+        views into the given weight vector.
+    """
+    emission_end = num_features*num_tags
+    transition_end = emission_end + num_tags*num_tags
+    return (weights[:emission_end].reshape(num_features, num_tags),
+            weights[emission_end:transition_end].reshape(num_tags, num_tags),
+            weights[transition_end:transition_end+num_tags],
+            weights[transition_end+num_tags:])
+
+def _crf_forward_backward(scores, transition, initial, final):
+    """
+    Run the forward-backward algorithm on a group of sentences, given
+    the emission scores from L{_CRFGroup.emission_scores()}.  The
+    forward and backward scores are kept as probabilities that are
+    rescaled at every token, rather than as log scores, so that each
+    step is a matrix product.
+
+    :return: A tuple C{(marginals, transition_counts, log_z)}, where
+        C{marginals[s,t,j]} is the probability that the M{t}th token
+        of the M{s}th sentence has the M{j}th tag;
+        C{transition_counts[i,j]} is the expected number of times
+        that the M{j}th tag follows the M{i}th tag in the group; and
+        C{log_z[s]} is the log of the M{s}th sentence's partition
+        function.
+    """
+    (num_sents, length, num_tags) = scores.shape
+    shift = scores.max(2)
+    emission = numpy.exp(scores - shift[:,:,numpy.newaxis])
+    transition_shift = transition.max()
+    exp_transition = numpy.exp(transition - transition_shift)
+    log_z = (shift.sum(1) + transition_shift*(length-1) +
+             initial.max() + final.max())
+
+    alpha = numpy.empty(scores.shape)
+    for t in range(length):
+        if t == 0:
+            a = numpy.exp(initial - initial.max()) * emission[:,0]
+        else:
+            a = numpy.dot(alpha[:,t-1], exp_transition) * emission[:,t]
+        total = a.sum(1)
+        alpha[:,t] = a / total[:,numpy.newaxis]
+        log_z += numpy.log(total)
+
+    beta = numpy.empty(scores.shape)
+    beta[:,-1] = numpy.exp(final - final.max())
+    log_z += numpy.log(numpy.dot(alpha[:,-1], beta[0,-1]))
+    for t in range(length-2, -1, -1):
+        b = numpy.dot(emission[:,t+1] * beta[:,t+1], exp_transition.T)
+        beta[:,t] = b / b.sum(1)[:,numpy.newaxis]
+
+    marginals = alpha * beta
+    marginals /= marginals.sum(2)[:,:,numpy.newaxis]
+    transition_counts = numpy.zeros((num_tags, num_tags))
+    for t in range(1, length):
+        following = emission[:,t] * beta[:,t]
+        total = (alpha[:,t-1] *
+                 numpy.dot(following, exp_transition.T)).sum(1)
+        transition_counts += numpy.dot(
+            (alpha[:,t-1] / total[:,numpy.newaxis]).T, following)
+    transition_counts *= exp_transition
+    return marginals, transition_counts, log_z
+
+def _crf_viterbi(scores, transition, initial, final):
+    """
+    :return: An array whose M{s}th row lists the indices of the best
+        tag sequence for the M{s}th sentence of a group, given the
+        group's emission scores.
+    """
+    (num_sents, length, num_tags) = scores.shape
+    sents = numpy.arange(num_sents)
+    backpointers = numpy.empty((length, num_sents, num_tags), int)
+    best = initial + scores[:,0]
+    for t in range(1, length):
+        candidates = best[:,:,numpy.newaxis] + transition
+        backpointers[t] = candidates.argmax(1)
+        best = candidates[sents[:,numpy.newaxis], backpointers[t],
+                          numpy.arange(num_tags)] + scores[:,t]
+    paths = numpy.empty((num_sents, length), int)
+    paths[:,-1] = (best + final).argmax(1)
+    for t in range(length-1, 0, -1):
+        paths[:,t-1] = backpointers[t][sents, paths[:,t]]
+    return paths
+
 ###########################################################################
 ## Demonstration code
 ###########################################################################
@@ -18,7 +18,8 @@ consulted instead.  Any SequentialBackoffTagger may serve as a
 backoff tagger for any other SequentialBackoffTagger.
 """
 
-import re, yaml
+import re, yaml, heapq
+from operator import itemgetter
 
 from nltk.probability import FreqDist, ConditionalFreqDist
 from nltk.classify.naivebayes import NaiveBayesClassifier
@@ -147,7 +148,8 @@ class ContextTagger(SequentialBackoffTagger):
     def __repr__(self):
         return '<%s: size=%d>' % (self.__class__.__name__, self.size())
 
-    def _train(self, tagged_corpus, cutoff=0, verbose=False):
+    def _train(self, tagged_corpus, cutoff=0, verbose=False,
+               backoff_tags=None):
         """
         Initialize this ContextTagger's ``_context_to_tag`` table
         based on the given training data.  In particular, for each
@@ -163,35 +165,50 @@ class ContextTagger(SequentialBackoffTagger):
         :param cutoff: If the most likely tag for a context occurs
             fewer than cutoff times, then exclude it from the
             context-to-tag table for the new tagger.
+        :param backoff_tags: The tags that the backoff tagger assigns
+            to *tagged_corpus*, as returned by ``training_tags()``.
+            If not specified, they are computed here.
         """
 
         token_count = hit_count = 0
 
+        if self.backoff is not None and backoff_tags is None:
+            tagged_corpus = list(tagged_corpus)
+            backoff_tags = training_tags(self.backoff, tagged_corpus)
+
         # A context is considered 'useful' if it's not already tagged
         # perfectly by the backoff tagger.
         useful_contexts = set()
         
-        # Count how many times each tag occurs in each context.
-        fd = ConditionalFreqDist()
-        for sentence in tagged_corpus:
-            tokens, tags = zip(*sentence)
+        # Count how many times each tag occurs in each context.  (A
+        # plain dict of dicts is used, since updating a
+        # ConditionalFreqDist for every training token is costly.)
+        counts = {}
+        for sent_index, sentence in enumerate(tagged_corpus):
+            tokens = [token for (token, tag) in sentence]
+            history = []
             for index, (token, tag) in enumerate(sentence):
                 # Record the event.
                 token_count += 1
-                context = self.context(tokens, index, tags[:index])
+                context = self.context(tokens, index, history)
+                history.append(tag)
                 if context is None: continue
-                fd[context].inc(tag)
+                tag_counts = counts.get(context)
+                if tag_counts is None:
+                    tag_counts = counts[context] = {}
+                tag_counts[tag] = tag_counts.get(tag, 0) + 1
                 # If the backoff got it wrong, this context is useful:
-                if (self.backoff is None or
-                    tag != self.backoff.tag_one(tokens, index, tags[:index])):
+                if (backoff_tags is None or
+                    tag != backoff_tags[sent_index][index]):
                     useful_contexts.add(context)
 
         # Build the context_to_tag table -- for each context, figure
         # out what the most likely tag is.  Only include contexts that
         # we've seen at least `cutoff` times.
         for context in useful_contexts:
-            best_tag = fd[context].max()
-            hits = fd[context][best_tag]
+            # Ties are broken as by FreqDist.max()
+            hits, best_tag = max((n, tag) for (tag, n)
+                                 in counts[context].iteritems())
             if hits > cutoff:
                 self._context_to_tag[context] = best_tag
                 hit_count += hits
@@ -200,11 +217,92 @@ class ContextTagger(SequentialBackoffTagger):
         if verbose:
             size = len(self._context_to_tag)
             backoff = 100 - (hit_count * 100.0)/ token_count
-            pruning = 100 - (size * 100.0) / len(fd.conditions())
+            pruning = 100 - (size * 100.0) / len(counts)
             print "[Trained Unigram tagger:",
             print "size=%d, backoff=%.2f%%, pruning=%.2f%%]" % (
                 size, backoff, pruning)
 
+def training_tags(tagger, tagged_corpus, backoff_tags=None, processes=1):
+    """
+    Return the tags that *tagger* (together with its backoff taggers)
+    assigns to each token of *tagged_corpus*, when the history for
+    each token consists of the correct tags of the tokens before it.
+    These are the predictions that a ``ContextTagger`` compares the
+    training data against, to decide which contexts are worth
+    keeping.
+
+    The tags returned for one tagger can be passed as *backoff_tags*
+    when training the next tagger in a backoff chain, and when
+    calling this function for that tagger; that way, each tagger in
+    the chain is only applied to the training corpus once:
+
+        >>> train = [[('the', 'AT'), ('dog', 'NN'), ('barks', 'VBZ')],
+        ...          [('the', 'AT'), ('barks', 'NNS'), ('fall', 'VB')]]
+        >>> t0 = DefaultTagger('NN')
+        >>> tags0 = training_tags(t0, train)
+        >>> t1 = UnigramTagger(train, backoff=t0, backoff_tags=tags0)
+        >>> tags1 = training_tags(t1, train, backoff_tags=tags0)
+        >>> tags1
+        [['AT', 'NN', 'VBZ'], ['AT', 'VBZ', 'VB']]
+        >>> t2 = BigramTagger(train, backoff=t1, backoff_tags=tags1)
+        >>> t2.tag(['the', 'barks', 'fall'])
+        [('the', 'AT'), ('barks', 'NNS'), ('fall', 'VB')]
+
+    :param tagger: The tagger whose predictions should be returned.
+    :type tagger: SequentialBackoffTagger
+    :param tagged_corpus: A list of tagged sentences.
+    :param backoff_tags: The value returned by this function for
+        ``tagger.backoff`` and the same corpus.  If specified, only
+        ``tagger.choose_tag()`` is consulted, and this tag is used
+        wherever it returns None.
+    :param processes: If greater than one, the sentences are divided
+        among a pool of that many worker processes.  If None, one
+        worker per CPU is used.
+    :rtype: list(list(str))
+    """
+    if backoff_tags is None:
+        args = [(sentence, None) for sentence in tagged_corpus]
+    else:
+        args = zip(tagged_corpus, backoff_tags)
+    if processes == 1 or len(args) < 2:
+        return [_training_tags(tagger, sentence, sentence_backoff_tags)
+                for (sentence, sentence_backoff_tags) in args]
+
+    import multiprocessing
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes, _init_training_tags_worker,
+                                (tagger,))
+    try:
+        chunksize = max(1, len(args) // (4 * processes))
+        return pool.map(_training_tags_worker, args, chunksize)
+    finally:
+        pool.terminate()
+
+def _training_tags(tagger, sentence, backoff_tags):
+    tokens = [token for (token, tag) in sentence]
+    history = []
+    result = []
+    for index, (token, tag) in enumerate(sentence):
+        if backoff_tags is None:
+            guess = tagger.tag_one(tokens, index, history)
+        else:
+            guess = tagger.choose_tag(tokens, index, history)
+            if guess is None:
+                guess = backoff_tags[index]
+        result.append(guess)
+        history.append(tag)
+    return result
+
+# The tagger used by training_tags() in each worker process.
+_worker_tagger = None
+
+def _init_training_tags_worker(tagger):
+    global _worker_tagger
+    _worker_tagger = tagger
+
+def _training_tags_worker(args):
+    return _training_tags(_worker_tagger, *args)
+
 ######################################################################
 #{ Tagger Classes
 ######################################################################
@@ -259,18 +357,21 @@ class NgramTagger(ContextTagger, yaml.YAMLObject):
     :param cutoff: If the most likely tag for a context occurs
         fewer than *cutoff* times, then exclude it from the
         context-to-tag table for the new tagger.
+    :param backoff_tags: The tags that *backoff* assigns to the
+        training data, as returned by ``training_tags()``.  Only
+        needed to avoid computing them again.
     """
     yaml_tag = '!nltk.NgramTagger'
     
     def __init__(self, n, train=None, model=None,
-                 backoff=None, cutoff=0, verbose=False):
+                 backoff=None, cutoff=0, verbose=False, backoff_tags=None):
         self._n = n
         self._check_params(train, model)
         
         ContextTagger.__init__(self, model, backoff)
         
         if train:
-            self._train(train, cutoff, verbose)
+            self._train(train, cutoff, verbose, backoff_tags)
             
     def context(self, tokens, index, history):
         tag_context = tuple(history[max(0,index-self._n+1):index])
@@ -305,14 +406,17 @@ class UnigramTagger(NgramTagger):
     :param cutoff: The number of instances of training data the tagger must see
         in order not to use the backoff tagger
     :type cutoff: int
+    :param backoff_tags: The tags that the backoff tagger assigns to
+        the training data, as returned by ``training_tags()``
+    :type backoff_tags: list(list(str))
     """
 
     yaml_tag = '!nltk.UnigramTagger'
 
     def __init__(self, train=None, model=None,
-                 backoff=None, cutoff=0, verbose=False):
+                 backoff=None, cutoff=0, verbose=False, backoff_tags=None):
         NgramTagger.__init__(self, 1, train, model,
-                             backoff, cutoff, verbose)
+                             backoff, cutoff, verbose, backoff_tags)
 
     def context(self, tokens, index, history):
         return tokens[index]
@@ -335,13 +439,16 @@ class BigramTagger(NgramTagger):
     :param cutoff: The number of instances of training data the tagger must see
         in order not to use the backoff tagger
     :type cutoff: int
+    :param backoff_tags: The tags that the backoff tagger assigns to
+        the training data, as returned by ``training_tags()``
+    :type backoff_tags: list(list(str))
     """
     yaml_tag = '!nltk.BigramTagger'
 
     def __init__(self, train, model=None,
-                 backoff=None, cutoff=0, verbose=False):
+                 backoff=None, cutoff=0, verbose=False, backoff_tags=None):
         NgramTagger.__init__(self, 2, train, model,
-                             backoff, cutoff, verbose)
+                             backoff, cutoff, verbose, backoff_tags)
 
 
 class TrigramTagger(NgramTagger):
@@ -361,13 +468,16 @@ class TrigramTagger(NgramTagger):
     :param cutoff: The number of instances of training data the tagger must see
         in order not to use the backoff tagger
     :type cutoff: int
+    :param backoff_tags: The tags that the backoff tagger assigns to
+        the training data, as returned by ``training_tags()``
+    :type backoff_tags: list(list(str))
     """
     yaml_tag = '!nltk.TrigramTagger'
 
     def __init__(self, train=None, model=None,
-                 backoff=None, cutoff=0, verbose=False):
+                 backoff=None, cutoff=0, verbose=False, backoff_tags=None):
         NgramTagger.__init__(self, 3, train, model,
-                             backoff, cutoff, verbose)
+                             backoff, cutoff, verbose, backoff_tags)
 
 
 class AffixTagger(ContextTagger, yaml.YAMLObject):
@@ -387,12 +497,15 @@ class AffixTagger(ContextTagger, yaml.YAMLObject):
     :param min_stem_length: Any words whose length is less than
         min_stem_length+abs(affix_length) will be assigned a
         tag of None by this tagger.
+    :param backoff_tags: The tags that the backoff tagger assigns to
+        the training data, as returned by ``training_tags()``.
     """
 
     yaml_tag = '!nltk.AffixTagger'
 
     def __init__(self, train=None, model=None, affix_length=-3,
-                 min_stem_length=2, backoff=None, cutoff=0, verbose=False):
+                 min_stem_length=2, backoff=None, cutoff=0, verbose=False,
+                 backoff_tags=None):
 
         self._check_params(train, model)
         
@@ -402,7 +515,7 @@ class AffixTagger(ContextTagger, yaml.YAMLObject):
         self._min_word_length = min_stem_length + abs(affix_length)
 
         if train:
-            self._train(train, cutoff, verbose)
+            self._train(train, cutoff, verbose, backoff_tags)
 
     def context(self, tokens, index, history):
         token = tokens[index]
@@ -470,6 +583,209 @@ class RegexpTagger(SequentialBackoffTagger, yaml.YAMLObject):
     def __repr__(self):
         return '<Regexp Tagger: size=%d>' % len(self._regexps)
 
+
+class CompiledBackoffTagger(TaggerI):
+    """
+    A tagger that assigns exactly the same tags as a chain of
+    sequential backoff taggers, but looks them up in integer-indexed
+    tables compiled from that chain.  Tagging with a chain of n-gram
+    taggers calls ``context()`` and builds a new tuple for every
+    token and every tagger in the chain; the compiled tagger instead
+    maps each word to an integer id once, finds the tag assigned by
+    the history-independent tail of the chain (such as a
+    ``UnigramTagger`` followed by a ``DefaultTagger``) for the whole
+    sentence in a single pass, and only consults the n-gram tables
+    (keyed by a packed integer encoding of the preceeding tags) for
+    words that occur in them.
+
+        >>> train = [[('the', 'AT'), ('dog', 'NN'), ('barks', 'VBZ')],
+        ...          [('the', 'AT'), ('barks', 'NNS'), ('fall', 'VB')]]
+        >>> t0 = DefaultTagger('NN')
+        >>> t1 = UnigramTagger(train, backoff=t0)
+        >>> t2 = BigramTagger(train, backoff=t1)
+        >>> compiled = CompiledBackoffTagger(t2)
+        >>> compiled.tag(['the', 'barks', 'fall', 'loudly'])
+        [('the', 'AT'), ('barks', 'NNS'), ('fall', 'VB'), ('loudly', 'NN')]
+
+    N-gram taggers (including unigram, bigram and trigram taggers),
+    affix, regexp and default taggers are compiled.  Any other tagger
+    in the chain is consulted by calling its ``choose_tag()`` method,
+    as the chain itself would.  The compiled tables are a snapshot:
+    changes made to the chain after compilation are not reflected.
+
+    :param tagger: The first tagger of the backoff chain to compile.
+    :type tagger: SequentialBackoffTagger
+    """
+    _PAD, _UNK = 0, 1
+    """Tag ids used for the positions before the start of the
+       sentence, and for tags that do not occur in any table."""
+
+    def __init__(self, tagger):
+        self._tagger = tagger
+        self._tags = [None, None]
+        self._tag_ids = {}
+        self._word_ids = {}
+
+        # Split the chain into its history-independent tail, whose tag
+        # for each word can be precomputed, and the stages before it.
+        taggers = tagger._taggers
+        tail = len(taggers)
+        while tail > 0 and self._history_free(taggers[tail-1]):
+            tail -= 1
+        self._tail = taggers[tail:]
+        stages = [self._compile(t) for t in taggers[:tail]]
+        self._max_order = max([1] + [stage[1] for stage in stages
+                                     if stage[0] == 'ngram'])
+
+        # Make sure every word from every table has an id, then find
+        # the tag that the tail would assign to each of them.
+        for t in self._tail:
+            if isinstance(t, NgramTagger):
+                for context in t._context_to_tag:
+                    self._word_id(self._split_context(t, context)[1])
+        self._tail_tags = [self._tail_tag([word], 0, [])
+                           for word in self._words()]
+
+        self._base = len(self._tags)
+
+        # Convert the contexts to packed integers, now that the number
+        # of tags is known.  An n-gram stage's key is the remainder of
+        # the packed history modulo base**(n-1).  Each word gets its
+        # own list of (modulus, table) stages, in chain order; generic
+        # stages have a modulus of None and a tagger in place of the
+        # table.
+        self._generic_stages = []
+        self._word_stages = [[] for word_id in self._word_ids]
+        for stage in stages:
+            if stage[0] == 'ngram':
+                kind, n, table = stage
+                modulus = self._base ** (n-1)
+                for word_id, contexts in table.iteritems():
+                    packed = dict((self._pack(ids), tag_id)
+                                  for (ids, tag_id) in contexts)
+                    self._word_stages[word_id].append((modulus, packed))
+            else:
+                self._generic_stages.append((None, stage[1]))
+                for word_stages in self._word_stages:
+                    word_stages.append((None, stage[1]))
+
+    def _words(self):
+        words = [None] * len(self._word_ids)
+        for word, word_id in self._word_ids.iteritems():
+            words[word_id] = word
+        return words
+
+    def _word_id(self, word):
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self._word_ids)
+        return word_id
+
+    def _tag_id(self, tag):
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self._tags)
+            self._tags.append(tag)
+        return tag_id
+
+    def _pack(self, ids):
+        key = 0
+        for tag_id in ids:
+            key = key * self._base + tag_id
+        return key
+
+    @staticmethod
+    def _context_method(tagger):
+        """Return the class that defines *tagger*'s ``context()``."""
+        for cls in (UnigramTagger, NgramTagger, AffixTagger):
+            if type(tagger).context.im_func is cls.context.im_func:
+                return cls
+        return None
+
+    @classmethod
+    def _history_free(cls, tagger):
+        choose_tag = type(tagger).choose_tag.im_func
+        if choose_tag in (DefaultTagger.choose_tag.im_func,
+                          RegexpTagger.choose_tag.im_func):
+            return True
+        if choose_tag is not ContextTagger.choose_tag.im_func:
+            return False
+        context_method = cls._context_method(tagger)
+        return (context_method in (UnigramTagger, AffixTagger) or
+                (context_method is NgramTagger and tagger._n == 1))
+
+    @classmethod
+    def _split_context(cls, tagger, context):
+        """Return the (tag history, word) pair of an n-gram context."""
+        if cls._context_method(tagger) is UnigramTagger:
+            return (), context
+        return context
+
+    def _compile(self, tagger):
+        if (not isinstance(tagger, NgramTagger) or
+            type(tagger).choose_tag.im_func is not ContextTagger.choose_tag.im_func or
+            self._context_method(tagger) not in (UnigramTagger, NgramTagger)):
+            return ('generic', tagger)
+
+        n = tagger._n
+        if self._context_method(tagger) is UnigramTagger:
+            n = 1
+        table = {}
+        for context, tag in tagger._context_to_tag.iteritems():
+            history, word = self._split_context(tagger, context)
+            # Contexts near the start of a sentence are padded.
+            ids = ((self._PAD,) * (n-1-len(history)) +
+                   tuple(self._tag_id(t) for t in history))
+            table.setdefault(self._word_id(word), []).append(
+                (ids, self._tag_id(tag)))
+        return ('ngram', n, table)
+
+    def _tail_tag(self, tokens, index, history):
+        for tagger in self._tail:
+            tag = tagger.choose_tag(tokens, index, history)
+            if tag is not None:
+                return tag
+        return None
+
+    def tag(self, tokens):
+        # docs inherited from TaggerI
+        word_ids = map(self._word_ids.get, tokens)
+        tail_tags = self._tail_tags
+        tags = [(tail_tags[word_id] if word_id is not None
+                 else self._tail_tag(tokens, index, ()))
+                for (index, word_id) in enumerate(word_ids)]
+        if self._max_order == 1 and not self._generic_stages:
+            return zip(tokens, tags)
+
+        tag_ids, tag_list, base = self._tag_ids, self._tags, self._base
+        word_stages, generic_stages = self._word_stages, self._generic_stages
+        # The packed ids of the (max_order-1) preceeding tags.
+        window = base ** (self._max_order-1)
+        history = self._pack([self._PAD] * (self._max_order-1))
+        for index, word_id in enumerate(word_ids):
+            if word_id is None:
+                stages = generic_stages
+            else:
+                stages = word_stages[word_id]
+            for modulus, table in stages:
+                if modulus is None:
+                    tag = table.choose_tag(tokens, index, tags[:index])
+                    if tag is not None:
+                        tags[index] = tag
+                        break
+                else:
+                    tag_id = table.get(history % modulus)
+                    if tag_id is not None:
+                        tags[index] = tag_list[tag_id]
+                        break
+            history = (history * base +
+                       tag_ids.get(tags[index], self._UNK)) % window
+        return zip(tokens, tags)
+
+    def __repr__(self):
+        return '<CompiledBackoffTagger: %r>' % self._tagger
+
+
 class ClassifierBasedTagger(SequentialBackoffTagger, FeaturesetTaggerI):
     """
     A sequential tagger that uses a classifier to choose the tag for
@@ -511,11 +827,43 @@ class ClassifierBasedTagger(SequentialBackoffTagger, FeaturesetTaggerI):
     :param cutoff_prob: If specified, then this tagger will fall
         back on its backoff tagger if the probability of the most
         likely tag is less than *cutoff_prob*.
+
+    :param uses_history: If false, then the feature detector promises
+        not to look at its *history* argument.  The featuresets for
+        every token of every sentence are then extracted and
+        classified in a single batch.  Otherwise, ``batch_tag()``
+        classifies position *i* of all sentences in one batch, after
+        the tags of the positions before *i* are known.
+
+    :param beam_size: If specified, then ``batch_tag()`` uses beam
+        search, keeping the *beam_size* most likely tag sequences for
+        each sentence (according to the classifier's
+        ``prob_classify()``), instead of committing to the most
+        likely tag at each position.  If *cutoff_prob* is also
+        specified, then a hypothesis whose most likely next tag is
+        less probable than the cutoff is extended only with the tag
+        chosen by the backoff tagger.
+
+    :param history_size: The number of preceeding tags that the
+        feature detector looks at, if known.  During beam search,
+        hypotheses that agree on these tags share one featureset
+        (and one probability distribution).
+
+    Tagging goes through the classifier's ``batch_classify()`` (or
+    ``batch_prob_classify()``, if *cutoff_prob* or *beam_size* is
+    specified), so classifiers that score a batch of featuresets
+    more efficiently than one featureset at a time are used to full
+    advantage.
     """
+    _uses_history = True
+    _beam_size = None
+    _history_size = None
+
     def __init__(self, feature_detector=None, train=None,
                  classifier_builder=NaiveBayesClassifier.train,
                  classifier=None, backoff=None,
-                 cutoff_prob=None, verbose=False):
+                 cutoff_prob=None, verbose=False, uses_history=True,
+                 beam_size=None, history_size=None):
         self._check_params(train, classifier)
 
         SequentialBackoffTagger.__init__(self, backoff)
@@ -536,9 +884,155 @@ class ClassifierBasedTagger(SequentialBackoffTagger, FeaturesetTaggerI):
         self._classifier = classifier
         """The classifier used to choose a tag for each token."""
 
+        if not uses_history:
+            self._uses_history = False
+        if beam_size is not None:
+            self._beam_size = beam_size
+        if history_size is not None:
+            self._history_size = history_size
+
         if train:
             self._train(train, classifier_builder, verbose)
 
+    def tag(self, tokens):
+        # docs inherited from TaggerI
+        return self.batch_tag([tokens])[0]
+
+    def batch_tag(self, sentences):
+        # docs inherited from TaggerI
+        sentences = list(sentences)
+        if self._beam_size is not None:
+            return self._beam_search(sentences)
+        tags = [[] for sent in sentences]
+
+        if not self._uses_history:
+            positions = [(s, index) for (s, sent) in enumerate(sentences)
+                         for index in range(len(sent))]
+            featuresets = [self.feature_detector(sentences[s], index, [])
+                           for (s, index) in positions]
+            for (s, index), tag in zip(positions,
+                                       self._classify_many(featuresets)):
+                tags[s].append(tag)
+            # Consult the backoff taggers left to right, since they
+            # may depend on the tags that come before.
+            for sent, sent_tags in zip(sentences, tags):
+                for index, tag in enumerate(sent_tags):
+                    if tag is None:
+                        sent_tags[index] = self._backoff_tag(
+                            sent, index, sent_tags[:index])
+
+        else:
+            # Tag position i of every sentence that long at once.
+            active = range(len(sentences))
+            index = 0
+            while active:
+                active = [s for s in active if len(sentences[s]) > index]
+                featuresets = [self.feature_detector(sentences[s], index,
+                                                     tags[s])
+                               for s in active]
+                for s, tag in zip(active, self._classify_many(featuresets)):
+                    if tag is None:
+                        tag = self._backoff_tag(sentences[s], index, tags[s])
+                    tags[s].append(tag)
+                index += 1
+
+        return [zip(sent, sent_tags)
+                for (sent, sent_tags) in zip(sentences, tags)]
+
+    def _beam_search(self, sentences):
+        """
+        Tag each sentence with the most likely tag sequence found by a
+        left-to-right beam search.  Position *i* of every sentence is
+        processed at once, with one ``batch_prob_classify()`` call for
+        all the featuresets that the sentences' hypotheses need.
+        """
+        # The hypotheses for each sentence, as (logprob, tags) pairs.
+        beams = [[(0.0, [])] for sent in sentences]
+        length = max([len(sent) for sent in sentences] or [0])
+        for index in range(length):
+            active = [s for s in range(len(sentences))
+                      if len(sentences[s]) > index]
+
+            # Map each (sentence, history key) pair to the position of
+            # its featureset in featuresets.
+            featureset_ids = {}
+            featuresets = []
+            for s in active:
+                for (logprob, tags) in beams[s]:
+                    key = (s, self._history_key(tags))
+                    if key not in featureset_ids:
+                        featureset_ids[key] = len(featuresets)
+                        featuresets.append(self.feature_detector(
+                            sentences[s], index, tags))
+            pdists = self._classifier.batch_prob_classify(featuresets)
+
+            for s in active:
+                candidates = []
+                for (logprob, tags) in beams[s]:
+                    pdist = pdists[featureset_ids[s, self._history_key(tags)]]
+                    # The most likely tag comes first, so that ties
+                    # are broken as in greedy tagging.
+                    best_tag = pdist.max()
+                    if (self._cutoff_prob is not None and
+                        pdist.prob(best_tag) < self._cutoff_prob):
+                        # Defer to the backoff tagger, scoring its tag
+                        # with the classifier's best probability.
+                        tag = self._backoff_tag(sentences[s], index, tags)
+                        candidates.append((logprob + pdist.logprob(best_tag),
+                                           tags, tag))
+                        continue
+                    candidates.append((logprob + pdist.logprob(best_tag),
+                                       tags, best_tag))
+                    for tag in pdist.samples():
+                        if tag != best_tag:
+                            candidates.append((logprob + pdist.logprob(tag),
+                                               tags, tag))
+                best = heapq.nlargest(self._beam_size, candidates,
+                                      key=itemgetter(0))
+                beams[s] = [(logprob, tags + [tag])
+                            for (logprob, tags, tag) in best]
+
+        return [zip(sent, beam[0][1])
+                for (sent, beam) in zip(sentences, beams)]
+
+    def _history_key(self, history):
+        """
+        Return a key that identifies the part of *history* that the
+        feature detector looks at.
+        """
+        if not self._uses_history:
+            return ()
+        elif self._history_size is None:
+            return tuple(history)
+        else:
+            return tuple(history[len(history)-self._history_size:])
+
+    def _classify_many(self, featuresets):
+        """
+        Return the tag chosen by the classifier for each featureset
+        in *featuresets*, or None where the most likely tag's
+        probability is less than the cutoff probability.
+        """
+        if not featuresets:
+            return []
+        if self._cutoff_prob is None:
+            return self._classifier.batch_classify(featuresets)
+        tags = []
+        for pdist in self._classifier.batch_prob_classify(featuresets):
+            tag = pdist.max()
+            if pdist.prob(tag) >= self._cutoff_prob:
+                tags.append(tag)
+            else:
+                tags.append(None)
+        return tags
+
+    def _backoff_tag(self, tokens, index, history):
+        for tagger in self._taggers[1:]:
+            tag = tagger.choose_tag(tokens, index, history)
+            if tag is not None:
+                return tag
+        return None
+
     def choose_tag(self, tokens, index, history):
         # Use our feature detector to get the featureset.
         featureset = self.feature_detector(tokens, index, history)
@@ -607,6 +1101,8 @@ class ClassifierBasedPOSTagger(ClassifierBasedTagger):
     """
     A classifier based part of speech tagger.
     """
+    _history_size = 2
+
     def feature_detector(self, tokens, index, history):
         word = tokens[index]
         if index == 0:
@@ -654,6 +1150,75 @@ class ClassifierBasedPOSTagger(ClassifierBasedTagger):
         return features
 
     
+######################################################################
+#{ Demonstration
+######################################################################
+
+def _beam_benchmark(classifier, gold, beam_sizes):
+    """
+    Tag the sentences of *gold* with a ``ClassifierBasedPOSTagger``
+    using *classifier*, once for each beam size in *beam_sizes* (None
+    meaning greedy tagging).  Return a list of ``(beam_size, accuracy,
+    elapsed)`` tuples, where *accuracy* is a percentage and *elapsed*
+    is the tagging time in seconds.
+    """
+    import time
+    untagged = [[word for (word, tag) in sent] for sent in gold]
+    num_words = sum(len(sent) for sent in untagged)
+    results = []
+    for beam_size in beam_sizes:
+        tagger = ClassifierBasedPOSTagger(classifier=classifier,
+                                          beam_size=beam_size)
+        start = time.time()
+        tagged = tagger.batch_tag(untagged)
+        elapsed = time.time() - start
+        correct = sum(1 for (g, t) in zip(gold, tagged)
+                      for (gold_tag, tag) in zip(g, t) if gold_tag == tag)
+        results.append((beam_size, correct*100.0/max(num_words, 1),
+                        elapsed))
+    return results
+
+def demo(beam_sizes=(None, 1, 2, 4, 8), num_train=2000, num_test=500):
+    """
+    Compare greedy and beam-search decoding for a
+    ``ClassifierBasedPOSTagger`` trained on the treebank sample.  For
+    each beam size, the tagging accuracy on held-out sentences and
+    the tagging speed are displayed.  If matplotlib is installed, the
+    accuracy is then plotted against the time taken.
+    """
+    from nltk.corpus import treebank
+
+    sents = treebank.tagged_sents()
+    train, test = sents[:num_train], sents[num_train:num_train+num_test]
+    num_words = sum(len(sent) for sent in test)
+
+    print 'Training classifier-based tagger on %d sentences...' % len(train)
+    classifier = ClassifierBasedPOSTagger(train=train).classifier()
+    results = _beam_benchmark(classifier, test, beam_sizes)
+
+    print
+    print ' Beam | Accuracy | Time (secs) | Words/sec   (\'-\' is greedy)'
+    print '------+----------+-------------+----------'
+    for (beam_size, accuracy, elapsed) in results:
+        print '%5s | %7.2f%% | %11.3f | %9d' % (
+            beam_size or '-', accuracy, elapsed,
+            num_words/max(elapsed, 1e-6))
+
+    try:
+        import pylab
+    except ImportError:
+        print '(Install matplotlib to chart the accuracy/time trade-off.)'
+        return
+    times = [elapsed for (beam_size, accuracy, elapsed) in results]
+    accuracies = [accuracy for (beam_size, accuracy, elapsed) in results]
+    pylab.plot(times, accuracies, 'o-')
+    for (beam_size, accuracy, elapsed) in results:
+        pylab.annotate(beam_size and 'beam=%d' % beam_size or 'greedy',
+                       (elapsed, accuracy))
+    pylab.xlabel('Tagging time (secs)')
+    pylab.ylabel('Accuracy (%)')
+    pylab.title('Beam search: accuracy vs. time')
+    pylab.show()
 
 if __name__ == "__main__":
     import doctest
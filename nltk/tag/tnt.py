@@ -13,6 +13,11 @@ by Thorsten Brants
 http://acl.ldc.upenn.edu/A/A00/A00-1031.pdf
 '''
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from nltk.probability import FreqDist, ConditionalFreqDist
 
 from nltk.tag.api import TaggerI
@@ -68,8 +73,18 @@ class TnT(TaggerI):
     It is possible to differentiate the tags which are assigned to
     capitalized words. However this does not result in a significant
     gain in the accuracy of the results. 
+
+    If numpy is installed, the frequency distributions are compiled
+    into arrays the first time the tagger is used, and each word of a
+    sentence extends the whole beam at once.  The unknown word tagger
+    is then called once for each batch of sentences given to
+    tagdata().  The tags produced are the same either way.
     '''
 
+    # The compiled tables used for tagging (see _TnTDecoder); these
+    # are built when they are first needed.
+    _decoder = None
+
     def __init__(self, unk=None, Trained=False, N=1000, C=False):
         '''
         Construct a TnT statistical tagger. Tagger must be trained
@@ -160,6 +175,9 @@ class TnT(TaggerI):
         # compute lambda values from the trained frequency distributions
         self._compute_lambda()
 
+        # discard any tables compiled from the previous training data
+        self._decoder = None
+
         #(debugging -- ignore or delete me)
         #print "lambdas"
         #print i, self._l1, i, self._l2, i, self._l3
@@ -269,13 +287,49 @@ class TnT(TaggerI):
         Invokes tag(sent) function for each sentence
         compiles the results into a list of tagged sentences
         each tagged sentence is a list of (word, tag) tuples
+
+        If numpy is installed, the sentences are tagged with the
+        compiled tables instead, and all of the unknown words in
+        the data are passed to the unknown word tagger in one batch
         '''
+        if numpy is None:
+            res = []
+            for sent in data:
+                res1 = self.tag(sent)
+                res.append(res1)
+            return res
+
+        data = [list(sent) for sent in data]
+        if self._decoder is None:
+            self._decoder = _TnTDecoder(self)
+        decoder = self._decoder
+
+        # find the unknown words, and tag each of them (as a
+        # sentence of its own) with the unknown word tagger
+        unknown = []
+        for sent in data:
+            for word in sent:
+                if decoder.is_known(word):
+                    self.known += 1
+                else:
+                    self.unknown += 1
+                    unknown.append(word)
+        if self._unk is None:
+            unk_tags = ['Unk'] * len(unknown)
+        else:
+            unk_tags = [t for [(_w, t)] in
+                        self._unk.batch_tag([[w] for w in unknown])]
+        unk_tags.reverse()
+
         res = []
         for sent in data:
-            res1 = self.tag(sent)
-            res.append(res1)
+            tags = decoder.decode(sent, unk_tags)
+            res.append(zip(sent, tags))
         return res
 
+    def batch_tag(self, sentences):
+        return self.tagdata(sentences)
+
 
     def tag(self, data):
         '''
@@ -287,7 +341,8 @@ class TnT(TaggerI):
         :return: [(word, tag),]
 
         Calls recursive function '_tagword'
-        to produce a list of tags
+        to produce a list of tags (or tagdata, if numpy is
+        installed)
 
         Associates the sequence of returned tags
         with the correct words in the input sequence
@@ -295,6 +350,9 @@ class TnT(TaggerI):
         returns a list of (word, tag) tuples
         '''
 
+        if numpy is not None:
+            return self.tagdata([data])[0]
+
         current_state = [(['BOS', 'BOS'], 1.0)]
 
         sent = list(data)
@@ -420,7 +478,174 @@ class TnT(TaggerI):
             return 1
         else:
             return -1
-      
+
+
+########################################
+# compiled tables for tagging with numpy
+########################################
+
+class _TnTDecoder(object):
+    '''
+    The frequency distributions of a trained TnT tagger, compiled
+    into arrays of tag frequencies.  Tags (including their
+    capitalization flags) are identified by their index in tags:
+
+      - unigram[t] is P(t)
+      - bigram[t2, t] is P(t| t2)
+      - P(t| t1, t2) is trigram_freqs[i], where trigram_keys[i] is
+        (t1 * K + t2) * K + t, and K is the number of tags; the
+        trigrams that were not seen in training are left out
+
+    Index 0 is the 'BOS' history, and the last index stands for
+    every tag that was not seen in training (ie. those produced by
+    the unknown word tagger), all of whose frequencies are 0.
+
+    decode() keeps the beam as arrays of states, which hold the last
+    two tags of each candidate tagging, its probability, and a
+    pointer back to the state it was extended from.  The
+    probabilities are computed with the same floating point
+    operations as TnT._tagword(), so the taggings are identical.
+    '''
+
+    def __init__(self, tagger):
+        self._tagger = tagger
+        self.tags = ['BOS'] + list(tagger._uni)
+        self.index = dict((tag, i) for (i, tag) in enumerate(self.tags))
+        self.unseen = K = len(self.tags)
+        self.tags.append(None)
+        K += 1
+
+        self.unigram = numpy.zeros(K)
+        for tag in tagger._uni:
+            self.unigram[self.index[tag]] = tagger._uni.freq(tag)
+
+        self.bigram = numpy.zeros((K, K))
+        for h in tagger._bi.conditions():
+            for tag in tagger._bi[h]:
+                self.bigram[self.index[h], self.index[tag]] = \
+                    tagger._bi[h].freq(tag)
+
+        keys = []
+        freqs = []
+        for (h1, h2) in tagger._tri.conditions():
+            # (histories that were only looked up while tagging
+            # have no samples, and may contain unseen tags)
+            if tagger._tri[(h1, h2)].N() == 0:
+                continue
+            hist = (self.index[h1] * K + self.index[h2]) * K
+            for tag in tagger._tri[(h1, h2)]:
+                keys.append(hist + self.index[tag])
+                freqs.append(tagger._tri[(h1, h2)].freq(tag))
+        order = numpy.argsort(keys)
+        # a final key that is larger than any other, so that
+        # searchsorted() always returns a valid position
+        self.trigram_keys = numpy.append(
+            numpy.array(keys, 'int64')[order], K ** 3)
+        self.trigram_freqs = numpy.append(
+            numpy.array(freqs, 'd')[order], 0.0)
+        self._K = K
+
+        # word -> (tags, tag indices, P(w|t)), built as needed
+        self._lexicon = {}
+        self._words = set(tagger._wd.conditions())
+
+    def is_known(self, word):
+        return word in self._words
+
+    def _entry(self, word, C):
+        '''
+        :return: the possible tags (with the capitalization flag C)
+            of a known word, their indices, and the probability
+            of the word given each tag
+        '''
+        try:
+            return self._lexicon[word]
+        except KeyError:
+            wd = self._tagger._wd[word]
+            uni = self._tagger._uni
+            tags = [(t, C) for t in wd.samples()]
+            p_wd = [float(wd[t])/float(uni[(t, C)]) for t in wd.samples()]
+            entry = (tags, numpy.array([self.index[tag] for tag in tags]),
+                     numpy.array(p_wd))
+            self._lexicon[word] = entry
+            return entry
+
+    def decode(self, sent, unk_tags):
+        '''
+        :param sent: list of words
+        :param unk_tags: the unknown word tagger's tag for each of
+            the unknown words in sent (and any following sentences),
+            in reverse order; the tags for sent are popped off
+        :return: the most probable tag for each word
+        '''
+        tagger = self._tagger
+        (l1, l2, l3) = (tagger._l1, tagger._l2, tagger._l3)
+        K = self._K
+
+        prev1 = numpy.zeros(1, int)
+        prev2 = numpy.zeros(1, int)
+        probs = numpy.ones(1)
+        steps = []
+
+        for word in sent:
+            C = False
+            if tagger._C and word[0].isupper(): C=True
+
+            if self.is_known(word):
+                (tags, cands, p_wd) = self._entry(word, C)
+                p_uni = self.unigram[cands]
+                p_bi = self.bigram[prev1[:,numpy.newaxis], cands]
+                keys = ((prev2 * K + prev1)[:,numpy.newaxis] * K +
+                        cands).ravel()
+                pos = numpy.searchsorted(self.trigram_keys, keys)
+                p_tri = numpy.where(self.trigram_keys[pos] == keys,
+                                    self.trigram_freqs[pos], 0.0)
+                p_tri = p_tri.reshape(p_bi.shape)
+                p = l1 * p_uni + l2 * p_bi + l3 * p_tri
+                new_probs = (probs[:,numpy.newaxis] * (p * p_wd)).ravel()
+
+            # unknown words keep every state, with the same probability
+            else:
+                tags = [(unk_tags.pop(), C)]
+                cands = numpy.array([self.index.get(tags[0], self.unseen)])
+                new_probs = probs
+
+            # sort the new states, and apply the beam search cut
+            order = _beam_order(new_probs)[:tagger._N]
+            (back, choice) = divmod(order, len(cands))
+            probs = new_probs[order]
+            prev2 = prev1[back]
+            prev1 = cands[choice]
+            steps.append((back, choice, tags))
+
+        # follow the back pointers from the most probable state
+        res = []
+        state = 0
+        for (back, choice, tags) in reversed(steps):
+            (t, C) = tags[choice[state]]
+            res.append(t)
+            state = back[state]
+        res.reverse()
+        return res
+
+
+def _beam_order(probs):
+    '''
+    :return: the indices of probs, sorted from most to least probable,
+        in the same order as the states of TnT._tagword() are sorted
+    '''
+    order = numpy.argsort(-probs, kind='mergesort')
+    ranked = probs[order]
+    if (ranked[1:] == ranked[:-1]).any():
+        # _cmp_tup() never reports two states as equal, so the order
+        # of tied states depends on how list.sort() visits them;
+        # repeat the same sort, on the states' indices
+        probs = probs.tolist()
+        order = range(len(probs))
+        order.sort(lambda i, j: (probs[j]-probs[i]) > 0 and 1 or -1)
+        order = numpy.array(order)
+    return order
+
 
 ########################################
 # helper function -- basic sentence tokenizer
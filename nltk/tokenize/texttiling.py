@@ -7,7 +7,6 @@
 # For license information, see LICENSE.TXT
 
 import re
-import math
 import numpy
 
 from nltk.tokenize.api import TokenizerI
@@ -16,6 +15,10 @@ BLOCK_COMPARISON, VOCABULARY_INTRODUCTION = range(2)
 LC, HC = range(2)
 DEFAULT_SMOOTHING = range(1)
 
+# Number of gaps whose block vectors are materialized at once by
+# TextTilingTokenizer._block_comparison.
+_GAP_CHUNK_SIZE = 256
+
 
 class TextTilingTokenizer(TokenizerI):
     """Tokenize a document into topical sections using the TextTiling algorithm.
@@ -79,8 +82,7 @@ class TextTilingTokenizer(TokenizerI):
         # Tokenization step starts here
         
         # Remove punctuation
-        nopunct_text = ''.join([c for c in lowercase_text
-                                      if re.match("[a-z\-\' \n\t]", c)])
+        nopunct_text = re.sub("[^a-z\-\' \n\t]", '', lowercase_text)
         nopunct_par_breaks = self._mark_paragraph_breaks(nopunct_text)
 
         tokseqs = self._divide_to_tokensequences(nopunct_text)
@@ -93,9 +95,10 @@ class TextTilingTokenizer(TokenizerI):
         #words = _stem_words(words)
 
         # Filter stopwords
+        stopwords = set(self.stopwords)
         for ts in tokseqs:
-            ts.wrdindex_list = filter(lambda wi: wi[0] not in self.stopwords,
-                                      ts.wrdindex_list)
+            ts.wrdindex_list = [wi for wi in ts.wrdindex_list
+                                if wi[0] not in stopwords]
         
         token_table = self._create_token_table(tokseqs, nopunct_par_breaks)
         # End of the Tokenization step
@@ -137,46 +140,87 @@ class TextTilingTokenizer(TokenizerI):
             return gap_scores, smooth_scores, depth_scores, segment_boundaries
         return segmented_text
 
-    def _block_comparison(self, tokseqs, token_table):
-        "Implements the block comparison method"
-        def blk_frq(tok, block):
-            ts_occs = filter(lambda o: o[0] in block,
-                             token_table[tok].ts_occurences)
-            freq = sum([tsocc[1] for tsocc in ts_occs])
-            return freq
-            
-        gap_scores = []
-        numgaps = len(tokseqs)-1
-        
-        for curr_gap in range(numgaps):
-            score_dividend, score_divisor_b1, score_divisor_b2 = 0.0, 0.0, 0.0
-            score = 0.0
-            #adjust window size for boundary conditions
-            if curr_gap < self.k-1:
-                window_size = curr_gap + 1
-            elif curr_gap > numgaps-self.k:
-                window_size = numgaps - curr_gap
-            else:
-                window_size = self.k
-
-            b1 = [ts.index
-                  for ts in tokseqs[curr_gap-window_size+1 : curr_gap+1]]
-            b2 = [ts.index
-                  for ts in tokseqs[curr_gap+1 : curr_gap+window_size+1]]
+    def batch_tokenize(self, texts, processes=1, chunksize=1):
+        """Segment each text in *texts*, returning the results in the
+        same order.  If *processes* is greater than one, the texts are
+        distributed over a pool of that many worker processes; if it is
+        ``None``, one worker per CPU is used.
+
+        :param texts: The documents to segment.  Any iterable will do;
+            texts are consumed lazily when a pool is used.
+        :type texts: iter(str)
+        :param processes: The number of worker processes.
+        :type processes: int
+        :param chunksize: The number of texts sent to a worker at a time.
+        :type chunksize: int
+        :rtype: list
+        """
+        if processes == 1:
+            return [self.tokenize(text) for text in texts]
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            return list(pool.imap(_TextTilingWorker(self), texts, chunksize))
+        finally:
+            pool.terminate()
 
-            for t in token_table.keys():
-                score_dividend += blk_frq(t, b1)*blk_frq(t, b2)
-                score_divisor_b1 += blk_frq(t, b1)**2
-                score_divisor_b2 += blk_frq(t, b2)**2
-            try:
-                score = score_dividend/math.sqrt(score_divisor_b1*
-                                                 score_divisor_b2)
-            except ZeroDivisionError:
-                pass # score += 0.0
-
-            gap_scores.append(score)
+    def _block_comparison(self, tokseqs, token_table):
+        """Implements the block comparison method.
 
-        return gap_scores
+        The token table is flattened once into a sparse
+        pseudosentence-by-term count matrix.  Gaps are then scored in
+        chunks: the rows needed by a chunk are densified over just the
+        terms that occur in them, and the sliding block vectors on
+        either side of each gap are read off a cumulative sum."""
+        numgaps = len(tokseqs)-1
+        if numgaps < 1:
+            return []
+
+        rows, cols, counts = [], [], []
+        for term_id, field in enumerate(token_table.itervalues()):
+            for ts_index, count in field.ts_occurences:
+                rows.append(ts_index)
+                cols.append(term_id)
+                counts.append(count)
+        rows = numpy.array(rows, dtype=numpy.intp)
+        order = numpy.argsort(rows, kind='mergesort')
+        rows = rows[order]
+        cols = numpy.array(cols, dtype=numpy.intp)[order]
+        counts = numpy.array(counts, dtype=numpy.float64)[order]
+
+        #adjust window size for boundary conditions
+        gaps = numpy.arange(numgaps)
+        window_size = numpy.where(gaps < self.k-1, gaps+1,
+                                  numpy.where(gaps > numgaps-self.k,
+                                              numgaps-gaps, self.k))
+        # first and last pseudosentence of the blocks around each gap
+        b1_start = numpy.maximum(gaps-window_size+1, 0)
+        b2_end = numpy.minimum(gaps+window_size, numgaps)
+
+        gap_scores = numpy.zeros(numgaps)
+        for chunk_start in range(0, numgaps, _GAP_CHUNK_SIZE):
+            chunk = slice(chunk_start, chunk_start+_GAP_CHUNK_SIZE)
+            g, lo_idx, hi_idx = gaps[chunk], b1_start[chunk], b2_end[chunk]
+            lo, hi = lo_idx.min(), hi_idx.max()+1
+
+            first, last = numpy.searchsorted(rows, [lo, hi])
+            terms, local_cols = numpy.unique(cols[first:last],
+                                             return_inverse=True)
+            # prefix[j] holds the term counts of pseudosentences lo..lo+j-1
+            prefix = numpy.zeros((hi-lo+1, len(terms)))
+            prefix[rows[first:last]-lo+1, local_cols] = counts[first:last]
+            prefix = prefix.cumsum(axis=0)
+
+            b1 = prefix[g-lo+1] - prefix[lo_idx-lo]
+            b2 = prefix[hi_idx-lo+1] - prefix[g-lo+1]
+            score_dividend = (b1*b2).sum(axis=1)
+            score_divisor = numpy.sqrt((b1**2).sum(axis=1)*
+                                       (b2**2).sum(axis=1))
+            nonzero = score_divisor > 0
+            gap_scores[chunk][nonzero] = (score_dividend[nonzero]/
+                                          score_divisor[nonzero])
+
+        return gap_scores.tolist()
         
     def _smooth_scores(self, gap_scores):
         "Wraps the smooth function from the SciPy Cookbook"
@@ -236,7 +280,7 @@ class TextTilingTokenizer(TokenizerI):
                     #hit bottom
                     pass
                 
-                if word in token_table.keys():
+                if word in token_table:
                     token_table[word].total_count += 1
 
                     if token_table[word].last_par != current_par:
@@ -270,59 +314,55 @@ class TextTilingTokenizer(TokenizerI):
         boundaries = [0 for x in depth_scores]
         
         avg = sum(depth_scores)/len(depth_scores)
-        numpy.stdev = numpy.std(depth_scores)
+        stdev = numpy.std(depth_scores)
         if self.cutoff_policy == LC:
-            cutoff = avg-numpy.stdev/2.0
+            cutoff = avg-stdev/2.0
         else:
-            cutoff = avg-numpy.stdev/2.0
+            cutoff = avg-stdev/2.0
 
         depth_tuples = zip(depth_scores, range(len(depth_scores)))
         depth_tuples.sort()
         depth_tuples.reverse()
         hp = filter(lambda x:x[0]>cutoff, depth_tuples)
 
+        # Visit the deepest gaps first, and skip a gap if there is
+        # already a boundary close to it.
         for dt in hp:
-            boundaries[dt[1]] = 1
-            for dt2 in hp: #undo if there is a boundary close already
-                if dt[1] != dt2[1] and abs(dt2[1]-dt[1]) < 4 \
-                       and boundaries[dt2[1]] == 1:
-                    boundaries[dt[1]] = 0
+            index = dt[1]
+            if 1 not in boundaries[max(index-3, 0):index+4]:
+                boundaries[index] = 1
         return boundaries
 
     def _depth_scores(self, scores):
         """Calculates the depth of each gap, i.e. the average difference
         between the left and right peaks and the gap's score"""
         
-        depth_scores = [0 for x in scores]
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        depth_scores = numpy.zeros(len(scores))
         #clip boundaries: this holds on the rule of thumb(my thumb)
         #that a section shouldn't be smaller than at least 2
         #pseudosentences for small texts and around 5 for larger ones.
         
         clip = min(max(len(scores)/10, 2), 5)
-        index = clip
-
-        # SB: next three lines are redundant as depth_scores is already full of zeros
-        for i in range(clip):
-            depth_scores[i] = 0
-            depth_scores[-i-1] = 0
-                        
-        for gapscore in scores[clip:-clip]:
-            lpeak = gapscore
-            for score in scores[index::-1]:
-                if score >= lpeak:
-                    lpeak = score
-                else:
-                    break
-            rpeak = gapscore
-            for score in scores[:index:]:
-                if score >= rpeak:
-                    rpeak=score
-                else:
-                    break
-            depth_scores[index] = lpeak + rpeak - 2*gapscore
-            index += 1
-            
-        return depth_scores
+        if len(scores) <= 2*clip:
+            return depth_scores.tolist()
+
+        # The left peak of a gap is found by climbing left from it for
+        # as long as the scores do not decrease; i.e. it is the score at
+        # the start of the non-increasing run that the gap belongs to.
+        # The right peak is found the same way, climbing right.
+        positions = numpy.arange(len(scores))
+        run_starts = numpy.where(numpy.r_[True, scores[:-1] < scores[1:]],
+                                 positions, 0)
+        lpeaks = scores[numpy.maximum.accumulate(run_starts)]
+        run_ends = numpy.where(numpy.r_[scores[:-1] > scores[1:], True],
+                               positions, len(scores)-1)
+        rpeaks = scores[numpy.minimum.accumulate(run_ends[::-1])[::-1]]
+
+        inner = slice(clip, len(scores)-clip)
+        depth_scores[inner] = (lpeaks[inner] + rpeaks[inner] -
+                               2*scores[inner])
+        return depth_scores.tolist()
 
     def _normalize_boundaries(self, text, boundaries, paragraph_breaks):
         """Normalize the boundaries identified to the original text's
@@ -380,6 +420,13 @@ class TokenSequence(object):
         self.__dict__.update(locals())
         del self.__dict__['self']
 
+class _TextTilingWorker(object):
+    "A picklable callable that segments a text with a given tokenizer"
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+    def __call__(self, text):
+        return self.tokenizer.tokenize(text)
+
 #Pasted from the SciPy cookbook: http://www.scipy.org/Cookbook/SignalSmooth
 def smooth(x,window_len=11,window='flat'):
     """smooth the data using a window with requested size.
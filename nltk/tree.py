@@ -1215,7 +1215,7 @@ class ImmutableMultiParentedTree(ImmutableTree, MultiParentedTree):
 ## Probabilistic trees
 ######################################################################
 class ProbabilisticTree(Tree, ProbabilisticMixIn):
-    def __new__(cls, node_or_str, children=None, **prob_kwargs):
+    def __new__(cls, node_or_str=None, children=None, **prob_kwargs):
         return super(ProbabilisticTree, cls).__new__(
             cls, node_or_str, children)
     def __init__(self, node_or_str, children=None, **prob_kwargs):